@@ -2,21 +2,26 @@ import random
 import sys
 import os
 import re
+import threading
+from collections import deque
 
 # Добавляем путь для импорта модулей
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 try:
-    from utils.anki_connect import AnkiConnect
-    anki = AnkiConnect()
+    from utils.anki_connect import AsyncAnkiConnect
+    from utils.anki_cache import CachedAnkiConnect
+    anki = CachedAnkiConnect()  # шаблоны/стили моделей, папка медиа и данные карт - из кэша, пока не изменились
+    anki_async = AsyncAnkiConnect(anki)
 except ImportError:
     print("Ошибка: Не найден anki_connect.py")
     anki = None
+    anki_async = None
 
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                              QPushButton, QFrame, QGraphicsDropShadowEffect, QTextBrowser,
                              QSizePolicy)
-from PyQt5.QtCore import Qt, QPoint, pyqtSignal, QTimer, QUrl
+from PyQt5.QtCore import Qt, QObject, QPoint, pyqtSignal, QTimer, QUrl
 from PyQt5.QtGui import QColor, QCursor 
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 
@@ -104,6 +109,292 @@ class LatexRenderer:
         return f'<span style="color: #d1d1d1; font-family:Cambria,Times New Roman,serif;font-style:italic;letter-spacing:0.5px;">{expr}</span>'
 
 
+# Принудительно устанавливаем прозрачный фон и серый цвет текста.
+# Добавляется после CSS колоды, чтобы наши rules с !important сработали
+FORCE_CSS = """
+    /* Агрессивный сброс стилей для всех основных текстовых тегов */
+    body, div, p, span, h1, h2, h3, h4, h5, h6, 
+    font, table, td, th, ul, ol, li, dl, dt, dd, blockquote, section { 
+        background-color: transparent !important; 
+        color: #d1d1d1 !important; /* Светло-серый цвет для всего текста */
+    }
+    
+    /* Класс .card часто используется в Anki, перекрываем его отдельно */
+    .card { 
+        background-color: transparent !important; 
+        color: #d1d1d1 !important;
+    }
+    
+    /* Жирный текст делаем ярко-белым для контраста */
+    b, strong, th { color: #ffffff !important; }
+    
+    /* Курсив */
+    i, em { color: #e0e0e0 !important; }
+    
+    /* Ссылки (чтобы отличались) */
+    a { color: #00b0f4 !important; }
+    
+    /* Мелкий текст */
+    small { color: #aaaaaa !important; }
+    
+    /* Изображения */
+    img { max-width: 100%; height: auto; border-radius: 5px; }
+"""
+
+
+class CardLoader:
+    """
+    Собирает карточку из AnkiConnect: данные карты, шаблон и стили модели, папка медиа -> готовые HTML лица/оборота.
+
+    Всё уходит одним запросом multi (AnkiConnect.batch): шаблоны и стили запрашиваются сразу для модели прошлой карты -
+    карты обычно идут из одной модели. Только если модель сменилась, нужен второй запрос за её шаблонами.
+    round_trips - сколько запросов к Anki ушло всего.
+    """
+    def __init__(self, anki):
+        self.anki = anki
+        self.model_name = None
+        self.round_trips = 0
+
+    def load(self, card_id):
+        """{'id', 'front', 'back', 'css', 'deck', 'model', 'media_path'} или None, если карта не найдена."""
+        model_name = self.model_name
+        with self.anki.batch() as batch:
+            media = batch.getMediaDirPath()
+            info = batch.cardsInfo([card_id])
+            if model_name:
+                templates, styling = batch.modelTemplates(modelName=model_name), batch.modelStyling(modelName=model_name)
+        self.round_trips += 1
+
+        if not info.result or not info.result[0]:  # AnkiConnect отдаёт {} для ненайденной карты
+            return None
+        card_info = info.result[0]
+        if card_info['modelName'] != model_name:
+            model_name = self.model_name = card_info['modelName']
+            with self.anki.batch() as batch:
+                templates, styling = batch.modelTemplates(modelName=model_name), batch.modelStyling(modelName=model_name)
+            self.round_trips += 1
+        return self.build(card_id, card_info, templates.result, styling.result, media.result)
+
+    @classmethod
+    def build(cls, card_id, card_info, templates_dict, css_data, media_path):
+        """Рендер карточки из ответов AnkiConnect (cardsInfo, modelTemplates, modelStyling, getMediaDirPath)."""
+        fields = card_info['fields']
+        if templates_dict and isinstance(templates_dict, dict):
+            template = next(iter(templates_dict.values()))
+        else:
+            template = {'Front': '{{Front}}', 'Back': '{{Back}}'}
+
+        css = css_data.get('css', '') if css_data else ""
+        css = css + "\n" + FORCE_CSS
+
+        front_html = cls.render_template(template.get('Front', '{{Front}}'), fields)
+        back_html = cls.render_template(template.get('Back', '{{Back}}'), fields)
+
+        # Замена {{FrontSide}}
+        if '{{FrontSide}}' in back_html:
+            back_html = back_html.replace('{{FrontSide}}', front_html)
+
+        # Заменяем звуки на кнопки
+        front_html = cls.process_sounds_to_buttons(front_html)
+        back_html = cls.process_sounds_to_buttons(back_html)
+
+        # LaTeX рендеринг
+        front_html = LatexRenderer.render(front_html)
+        back_html = LatexRenderer.render(back_html)
+
+        return {
+            'id': card_id,
+            'front': front_html,
+            'back': back_html,
+            'css': css,
+            'deck': card_info['deckName'],
+            'model': card_info['modelName'],
+            'media_path': media_path,
+        }
+
+    @staticmethod
+    def render_template(template_html, fields):
+        html = template_html
+        for field_name, field_data in fields.items():
+            value = field_data['value']
+
+            # Заменяем поля
+            html = html.replace(f'{{{{{field_name}}}}}', value)
+
+            # Условные поля
+            start_tag = f'{{{{#{field_name}}}}}'
+            end_tag = f'{{{{/{field_name}}}}}'
+            if start_tag in html:
+                if value.strip():
+                    html = html.replace(start_tag, '').replace(end_tag, '')
+                else:
+                    pattern = f'{re.escape(start_tag)}(.*?){re.escape(end_tag)}'
+                    html = re.sub(pattern, '', html, flags=re.DOTALL)
+        return html
+
+    @staticmethod
+    def process_sounds_to_buttons(html):
+        """
+        Заменяет [sound:...] на стилизованные кнопки (ссылки) прямо в тексте
+        """
+        def sound_to_button(match):
+            filename = match.group(1)
+            # Создаем "кнопку" через стилизованную ссылку
+            return f'''
+                <a href="sound://{filename}" style="
+                    display:inline-block;
+                    background-color:#43B581;
+                    color:white;
+                    padding:2px 8px;
+                    margin:0 2px;
+                    border-radius:4px;
+                    text-decoration:none;
+                    font-size:0.85em;
+                    font-weight:bold;
+                    vertical-align:middle;
+                    font-family:Segoe UI,sans-serif;
+                ">▶</a>
+            '''
+        
+        # Заменяем [sound:...] на кнопки
+        processed = re.sub(r'\[sound:(.*?)\]', sound_to_button, html)
+        return processed
+
+
+PREFETCH_SIZE = 2                # Сколько готовых карточек держать в очереди (1-3)
+PREFETCH_REFRESH_INTERVAL = 60.0 # Как часто перепроверять очередь по таймеру, сек
+
+
+class CardPrefetcher:
+    """
+    Очередь следующих карточек, собранных заранее (CardLoader.load: данные карты, HTML лица/оборота, CSS).
+    На возрождении pop() отдаёт готовую карточку - показ без единого запроса к Anki.
+
+    Дозагрузка идёт в рабочем потоке client (AsyncAnkiConnect), не чаще одной одновременно.
+    refresh() - после ответа на карту и по таймеру: карты, которые больше не к показу (не в is:due / is:new),
+    выбрасываются из очереди, оставшиеся пересобираются (через кэш CachedAnkiConnect это бесплатно, если карта
+    не менялась), очередь дополняется до size.
+    Выбор карты - как раньше: случайная из is:due, затем из is:new, и только если обе пусты - из всей коллекции.
+    hits / misses - сколько раз pop() отдал готовую карточку / очередь была пуста.
+    """
+    def __init__(self, client, loader, size=PREFETCH_SIZE):
+        self.client = client
+        self.loader = loader
+        self.anki = loader.anki
+        self.size = size
+        self.current = None  # ID показанной карты - в очередь не берётся
+        self.hits = 0
+        self.misses = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._running = False
+        self._again = False
+
+    def pop(self):
+        """Следующая готовая карточка или None (очередь пуста). Запускает дозагрузку."""
+        with self._lock:
+            card = self._queue.popleft() if self._queue else None
+            if card: self.current = card['id']
+            self.hits, self.misses = self.hits + bool(card), self.misses + (not card)
+        self.refresh()
+        return card
+
+    def showing(self, card_id):
+        """Карта card_id показана в обход очереди: убрать её из очереди и не брать в неё."""
+        with self._lock:
+            self.current = card_id
+            self._queue = deque(c for c in self._queue if c['id'] != card_id)
+
+    def refresh(self):
+        """Перепроверить и дополнить очередь в фоне. Если дозагрузка уже идёт - она повторится после текущей."""
+        with self._lock:
+            if self._running:
+                self._again = True
+                return
+            self._running = True
+        self.client.submit(self._run)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def candidates(self):
+        """ID карт к показу в порядке приоритета: [is:due, is:new] (одним запросом), иначе [вся коллекция]."""
+        with self.anki.batch() as batch:
+            due, new = batch.findCards("is:due"), batch.findCards("is:new")
+        tiers = [due.result or [], new.result or []]
+        if not any(tiers):
+            tiers = [self.anki.findCards("") or []]
+        return tiers
+
+    def next_card_id(self):
+        """Случайная карта к показу (без очереди) или None."""
+        for cards in self.candidates():
+            if cards: return random.choice(cards)
+        return None
+
+    def _run(self):
+        while True:
+            try:
+                self._fill()
+            except Exception as e:
+                print(f"❌ Ошибка предзагрузки карт: {e}")
+            with self._lock:
+                if not self._again:
+                    self._running = False
+                    return
+                self._again = False
+
+    def _fill(self):
+        tiers = self.candidates()
+        allowed = set().union(*tiers)
+        with self._lock:
+            queued = [c['id'] for c in self._queue if c['id'] in allowed and c['id'] != self.current]
+        # Оставшиеся карты пересобираются: изменённые в Anki подтянутся (кэш сам знает, что изменилось)
+        cards = [self.loader.load(card_id) for card_id in queued]
+
+        taken = set(queued) | {self.current}
+        for tier in tiers:
+            choices = [c for c in tier if c not in taken]
+            random.shuffle(choices)
+            for card_id in choices:
+                if len(cards) >= self.size: break
+                card = self.loader.load(card_id)
+                if card:
+                    cards.append(card)
+                    taken.add(card_id)
+        with self._lock:
+            self._queue = deque(c for c in cards if c and c['id'] != self.current)
+
+
+class AnkiBridge(QObject):
+    """
+    Мост AnkiConnect -> Qt: запрос выполняется в рабочем потоке AsyncAnkiConnect, результат приходит сигналом
+    в поток GUI. Пока Anki отвечает (таймаут до 10 с), оверлей поверх игры не замирает.
+        bridge.call(card_loader.load, card_id, on_result=self.show_card, on_error=...)
+    on_result(результат) и on_error(исключение) вызываются в потоке GUI.
+    """
+    _done = pyqtSignal(object, object, object)  # (on_result, on_error, future)
+
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self._done.connect(self._deliver)
+
+    def call(self, fn, *args, on_result=None, on_error=None, **kwargs):
+        future = self.client.submit(fn, *args, **kwargs)
+        # Сигнал испускается из рабочего потока, а слот выполняется в потоке GUI (queued connection)
+        future.add_done_callback(lambda f: self._done.emit(on_result, on_error, f))
+        return future
+
+    def _deliver(self, on_result, on_error, future):
+        error = future.exception()
+        if error is not None:
+            if on_error: on_error(error)
+            else: print(f"❌ Ошибка запроса к Anki: {error}")
+        elif on_result:
+            on_result(future.result())
+
+
 class OverlayWindow(QWidget):
     # Сигнал, который испускается при ответе на карту
     card_answered = pyqtSignal(bool, int)
@@ -115,6 +406,9 @@ class OverlayWindow(QWidget):
         self.is_showing_answer = False
         self.media_path = None
         self.media_player = QMediaPlayer()
+        self.card_loader = CardLoader(anki) if anki else None
+        self.bridge = AnkiBridge(anki_async, self) if anki_async else None
+        self._loading_card_id = None  # карта, которую сейчас грузит bridge (ответы по старым запросам отбрасываются)
         
         self.setWindowTitle("Anki Overlay")
         self.resize(600, 400)
@@ -254,154 +548,49 @@ class OverlayWindow(QWidget):
         else:
             print(f"Файл не найден: {filepath}")
 
-    def process_sounds_to_buttons(self, html):
-        """
-        Заменяет [sound:...] на стилизованные кнопки (ссылки) прямо в тексте
-        """
-        def sound_to_button(match):
-            filename = match.group(1)
-            # Создаем "кнопку" через стилизованную ссылку
-            return f'''
-                <a href="sound://{filename}" style="
-                    display:inline-block;
-                    background-color:#43B581;
-                    color:white;
-                    padding:2px 8px;
-                    margin:0 2px;
-                    border-radius:4px;
-                    text-decoration:none;
-                    font-size:0.85em;
-                    font-weight:bold;
-                    vertical-align:middle;
-                    font-family:Segoe UI,sans-serif;
-                ">▶</a>
-            '''
-        
-        # Заменяем [sound:...] на кнопки
-        processed = re.sub(r'\[sound:(.*?)\]', sound_to_button, html)
-        return processed
-
     def load_card(self, card_id):
         if not anki:
             self.card_browser.setText("Ошибка: Нет anki_connect")
             return
 
-        try:
-            self.answer_buttons_widget.hide()
-            self.btn_show_answer.show()
-            self.btn_show_answer.setText("Показать ответ")
-            self.is_showing_answer = False
-            self.media_player.stop()
+        self.reset_card_view()
 
-            try:
-                self.media_path = anki.getMediaDirPath()
-            except:
-                self.media_path = None
+        # Карточка собирается в рабочем потоке, GUI не ждёт Anki
+        self._loading_card_id = card_id
+        self.bridge.call(self.card_loader.load, card_id,
+                         on_result=lambda card: self._on_card_loaded(card_id, card),
+                         on_error=lambda e: self._on_card_error(card_id, e))
 
-            card_info_list = anki.cardsInfo([card_id])
-            if not card_info_list:
-                self.card_browser.setText("Карта не найдена.")
-                return
-            
-            card_info = card_info_list[0]
-            model_name = card_info['modelName']
-            deck_name = card_info['deckName']
-            fields = card_info['fields']
-            
-            templates_dict = anki.modelTemplates(modelName=model_name)
-            print(templates_dict
-                  )
-            if templates_dict and isinstance(templates_dict, dict):
-                template = next(iter(templates_dict.values()))
-            else:
-                template = {'Front': '{{Front}}', 'Back': '{{Back}}'}
+    def _on_card_loaded(self, card_id, card):
+        if card_id != self._loading_card_id: return  # уже запрошена другая карта
+        self._loading_card_id = None
+        if not card:
+            self.card_browser.setText("Карта не найдена.")
+            return
+        self.show_card(card)
 
-            css_data = anki.modelStyling(modelName=model_name)
-            css = css_data.get('css', '') if css_data else ""
-            
-            # === ИЗМЕНЕНИЯ ЗДЕСЬ (CSS) ===
-            # Принудительно устанавливаем прозрачный фон и серый цвет текста
-            force_css = """
-                /* Агрессивный сброс стилей для всех основных текстовых тегов */
-                body, div, p, span, h1, h2, h3, h4, h5, h6, 
-                font, table, td, th, ul, ol, li, dl, dt, dd, blockquote, section { 
-                    background-color: transparent !important; 
-                    color: #d1d1d1 !important; /* Светло-серый цвет для всего текста */
-                }
-                
-                /* Класс .card часто используется в Anki, перекрываем его отдельно */
-                .card { 
-                    background-color: transparent !important; 
-                    color: #d1d1d1 !important;
-                }
-                
-                /* Жирный текст делаем ярко-белым для контраста */
-                b, strong, th { color: #ffffff !important; }
-                
-                /* Курсив */
-                i, em { color: #e0e0e0 !important; }
-                
-                /* Ссылки (чтобы отличались) */
-                a { color: #00b0f4 !important; }
-                
-                /* Мелкий текст */
-                small { color: #aaaaaa !important; }
-                
-                /* Изображения */
-                img { max-width: 100%; height: auto; border-radius: 5px; }
-            """
-            # Добавляем наш CSS после CSS колоды, чтобы наши rules с !important сработали
-            css = css + "\n" + force_css
-
-            def render_template(template_html):
-                html = template_html
-                for field_name, field_data in fields.items():
-                    value = field_data['value']
-                    
-                    # Заменяем поля
-                    html = html.replace(f'{{{{{field_name}}}}}', value)
-                    
-                    # Условные поля
-                    start_tag = f'{{{{#{field_name}}}}}'
-                    end_tag = f'{{{{/{field_name}}}}}'
-                    if start_tag in html:
-                        if value.strip():
-                            html = html.replace(start_tag, '').replace(end_tag, '')
-                        else:
-                            pattern = f'{re.escape(start_tag)}(.*?){re.escape(end_tag)}'
-                            html = re.sub(pattern, '', html, flags=re.DOTALL)
-                return html
-
-            front_html = render_template(template.get('Front', '{{Front}}'))
-            back_html = render_template(template.get('Back', '{{Back}}'))
-
-            # Замена {{FrontSide}}
-            if '{{FrontSide}}' in back_html:
-                back_html = back_html.replace('{{FrontSide}}', front_html)
-
-            # Заменяем звуки на кнопки
-            front_html = self.process_sounds_to_buttons(front_html)
-            back_html = self.process_sounds_to_buttons(back_html)
-
-            # LaTeX рендеринг
-            front_html = LatexRenderer.render(front_html)
-            back_html = LatexRenderer.render(back_html)
-
-            self.current_card_data = {
-                'id': card_id,
-                'front': front_html,
-                'back': back_html,
-                'css': css,
-                'deck': deck_name
-            }
-            
-            self.header.setText(f"Колода: {deck_name}")
-            self.render_card(side='front')
-            
-        except Exception as e:
-            self.card_browser.setText(f"Ошибка: {e}")
-            import traceback
-            traceback.print_exc()
+    def _on_card_error(self, card_id, error):
+        if card_id != self._loading_card_id: return
+        self._loading_card_id = None
+        self.card_browser.setText(f"Ошибка: {error}")
+        import traceback
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    def reset_card_view(self):
+        self.answer_buttons_widget.hide()
+        self.btn_show_answer.show()
+        self.btn_show_answer.setText("Показать ответ")
+        self.is_showing_answer = False
+        self.media_player.stop()
+
+    def show_card(self, card):
+        """Показывает уже собранную карточку (CardLoader.load / CardPrefetcher.pop) - без запросов к Anki."""
+        self._loading_card_id = None  # ответ на запрошенную раньше карту больше не нужен
+        self.reset_card_view()
+        self.media_path = card['media_path']
+        self.current_card_data = card
+        self.header.setText(f"Колода: {card['deck']}")
+        self.render_card(side='front')
 
     def render_card(self, side='front'):
         if not self.current_card_data: 
@@ -440,18 +629,19 @@ class OverlayWindow(QWidget):
         if not self.current_card_data: 
             return
         card_id = self.current_card_data['id']
-        
-        try:
-            anki.answerCards(answers=[{"cardId": card_id, "ease": ease}])
+        self.answer_buttons_widget.hide()  # второй клик по кнопке, пока ответ уходит, не отправит его дважды
+        self.header.setText("Отправка ответа...")
+
+        def answered(_):
             self.header.setText("Ответ принят...")
-            
-            # === ИСПРАВЛЕНИЕ ОШИБКИ ЗДЕСЬ ===
-            # Было: self.card_card_answered.emit(True, card_id)
-            # Стало: self.card_answered.emit(True, card_id)
             self.card_answered.emit(True, card_id)
-            
-        except Exception as e:
+
+        def failed(e):
             print(f"Ошибка ответа: {e}")
+            self.answer_buttons_widget.show()
+
+        self.bridge.call(anki.answerCards, answers=[{"cardId": card_id, "ease": ease}],
+                         on_result=answered, on_error=failed)
 
     def toggle_interaction_mode(self):
         self.is_interactive = not self.is_interactive
@@ -494,31 +684,27 @@ if __name__ == "__main__":
     overlay = OverlayWindow()
     overlay.show()
 
-    def get_next_card():
-        if not anki: 
-            return None
-        cards = anki.findCards("is:due")
-        if cards:
-            return random.choice(cards)
-        
-        cards = anki.findCards("is:new")
-        if cards:
-            return random.choice(cards)
-            
-        cards = anki.findCards("")
-        if cards:
-            return random.choice(cards)
-            
-        return None
+    prefetcher = CardPrefetcher(anki_async, overlay.card_loader) if overlay.bridge else None
 
     def load_next_cycle(success=True, prev_card_id=None):
         if prev_card_id:
             print(f"Карта {prev_card_id} решена. Ищем следующую...")
-        
-        next_id = get_next_card()
-        
+        if not prefetcher:
+            return show_next_card(None)
+        # Готовая карточка из очереди - показ сразу, без запросов к Anki и без задержки. pop() дозагружает
+        # очередь в фоне (после ответа на карту - с перепроверкой, какие карты ещё к показу)
+        card = prefetcher.pop()
+        if card:
+            print(f"Карта из очереди: {card['id']}")
+            overlay.show_card(card)
+            return
+        # Очередь пуста (старт) - поиск карты в рабочем потоке, показ - по сигналу в потоке GUI
+        overlay.bridge.call(prefetcher.next_card_id, on_result=show_next_card)
+
+    def show_next_card(next_id):
         if next_id:
             print(f"Загрузка карты: {next_id}")
+            prefetcher.showing(next_id)
             QTimer.singleShot(150, lambda: overlay.load_card(next_id))
         else:
             overlay.header.setText("Все карты пройдены!")
@@ -526,6 +712,11 @@ if __name__ == "__main__":
             overlay.answer_buttons_widget.hide()
             overlay.btn_show_answer.hide()
 
+    if prefetcher:
+        prefetch_timer = QTimer(overlay)
+        prefetch_timer.timeout.connect(prefetcher.refresh)
+        prefetch_timer.start(int(PREFETCH_REFRESH_INTERVAL * 1000))
+
     overlay.card_answered.connect(load_next_cycle)
     print("Старт приложения...")
     load_next_cycle() 
@@ -0,0 +1,348 @@
+"""
+Микро-бенчмарк транспорта AnkiConnect против локальной заглушки (Anki не нужен).
+
+StubAnki - HTTP/1.1 сервер на 127.0.0.1, отвечающий на действия AnkiConnect по маленькой фейковой коллекции
+(карты, модель Basic, стили, папка медиа, multi). Сравнивается:
+- старый путь: requests.post на каждый вызов (новое TCP-соединение на запрос);
+- AnkiConnect с AnkiTransport: keep-alive соединения из пула requests.Session, в одном и в нескольких потоках;
+- переподключение: сервер рвёт соединения, AnkiConnect должен переподключиться сам;
+- загрузка карточки: четыре последовательных запроса (как раньше в load_card) против CardLoader,
+  который собирает их в один multi. У заглушки задержка ответа ANKI_DELAY - Anki выполняет запросы
+  в своём главном потоке, так что каждый запрос стоит заметно больше, чем локальный HTTP;
+- AsyncAnkiConnect: CARD_LOADS карточек последовательно и через asyncio.gather; сколько вызывающий поток
+  (GUI оверлея) ждёт на одной карточке - синхронно и через submit();
+- CachedAnkiConnect: новые карточки (модель уже в кэше) и повторная загрузка тех же - сколько действий реально ушло в Anki на карточку
+  и доля попаданий в кэш;
+- CardPrefetcher: сколько проходит от "нужна следующая карта" (возрождение) до готовой карточки -
+  поиск и сборка на месте (findCards + CardLoader.load) против pop() из очереди.
+
+Запуск: python overlay/test_anki_connect.py
+"""
+import os
+import sys
+import json
+import asyncio
+import socket
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.anki_connect import AnkiConnect, AsyncAnkiConnect
+from utils.anki_cache import CachedAnkiConnect
+from overlay import CardLoader, CardPrefetcher
+
+REQUESTS = 500
+THREADS = 4
+CARD_LOADS = 50
+ANKI_DELAY = 0.005  # Задержка ответа заглушки в замере загрузки карточек, сек
+
+
+class StubCollection:
+    """Фейковая коллекция: ответы на действия AnkiConnect, нужные оверлею."""
+    def __init__(self, cards=20):
+        self.lock = threading.Lock()
+        self.calls = {}  # действие -> число вызовов (multi считает и вложенные действия)
+        self.cards = {
+            1000 + i: {
+                'cardId': 1000 + i, 'note': 5000 + i, 'modelName': 'Basic', 'deckName': 'Default',
+                'fields': {'Front': {'value': f'Вопрос {i}', 'order': 0}, 'Back': {'value': f'Ответ {i}', 'order': 1}},
+                'due': i, 'queue': 2 if i % 2 else 0, 'mod': 1700000000,
+            } for i in range(cards)
+        }
+        self.note_mods = {info['note']: 1700000000 for info in self.cards.values()}
+        self.model_mod = 1700000000
+
+    def handle(self, action, params):
+        with self.lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+        if action == 'multi':
+            results = []
+            for item in params.get('actions', []):
+                try:
+                    results.append({'result': self.handle(item['action'], item.get('params', {})), 'error': None})
+                except Exception as e:
+                    results.append({'result': None, 'error': str(e)})
+            return results
+        if action == 'version':
+            return 6
+        if action == 'getMediaDirPath':
+            return '/tmp/anki_media'
+        if action == 'findCards':
+            query = params.get('query', '')
+            if query == 'is:due':
+                return [c for c, info in self.cards.items() if info['queue'] == 2]
+            if query == 'is:new':
+                return [c for c, info in self.cards.items() if info['queue'] == 0]
+            return list(self.cards)
+        if action == 'cardsInfo':
+            return [self.cards.get(c, {}) for c in params.get('cards', [])]  # как AnkiConnect: {} для ненайденной карты
+        if action == 'modelTemplates':
+            return {'Card 1': {'Front': '{{Front}}', 'Back': '{{FrontSide}}<hr id=answer>{{Back}}'}}
+        if action == 'modelStyling':
+            return {'css': '.card { font-family: arial; font-size: 20px; }'}
+        if action == 'cardsModTime':
+            return [{'cardId': c, 'mod': self.cards[c]['mod']} for c in params.get('cards', []) if c in self.cards]
+        if action == 'notesModTime':
+            return [{'noteId': n, 'mod': self.note_mods[n]} for n in params.get('notes', []) if n in self.note_mods]
+        if action == 'findModelsByName':
+            return [{'name': name, 'id': 1, 'mod': self.model_mod} for name in params.get('modelNames', [])]
+        if action == 'updateNoteFields':
+            note = params['note']
+            with self.lock:
+                for info in self.cards.values():
+                    if info['note'] == note['id']:
+                        for name, value in note['fields'].items(): info['fields'][name]['value'] = value
+                self.note_mods[note['id']] = int(time.time())
+            return None
+        if action == 'answerCards':
+            with self.lock:
+                for answer in params.get('answers', []):
+                    info = self.cards.get(answer['cardId'])
+                    if info: info['queue'], info['mod'] = 1, info['mod'] + 1
+            return [True] * len(params.get('answers', []))
+        raise ValueError(f'unsupported action: {action}')
+
+
+class StubAnki:
+    """
+    Заглушка AnkiConnect в фоновом потоке. delay - искусственная задержка ответа (сек),
+    close_every - закрывать соединение после каждого N-го ответа (проверка переподключения).
+    """
+    def __init__(self, collection=None, delay=0.0, close_every=0):
+        self.collection = collection or StubCollection()
+        self.delay = delay
+        self.close_every = close_every
+        self.requests = 0
+        self.connections = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, как у AnkiConnect
+            wbufsize = -1                  # ответ уходит одной записью (заголовки + тело), как у AnkiConnect
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                stub.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                stub.requests += 1
+                if stub.delay: time.sleep(stub.delay)
+                try:
+                    reply = {'result': stub.collection.handle(body['action'], body.get('params', {})), 'error': None}
+                except Exception as e:
+                    reply = {'result': None, 'error': str(e)}
+                data = json.dumps(reply).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if stub.close_every and stub.requests % stub.close_every == 0:
+                    self.send_header('Connection', 'close')
+                    self.close_connection = True
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.address = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure(name, call, n=REQUESTS, threads=1):
+    """call() - один запрос version. Возвращает запросов в секунду."""
+    call()  # прогрев
+    start = time.perf_counter()
+    if threads == 1:
+        for _ in range(n): call()
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda _: call(), range(n)))
+    rps = n / (time.perf_counter() - start)
+    print(f"{name:<40} | {rps:8.0f} запр/с | {1000 / rps:6.2f} мс на запрос")
+    return rps
+
+
+def plain_post(address):
+    """Старый AnkiConnect.send_request: requests.post, новое соединение на каждый вызов."""
+    payload = {'action': 'version', 'version': 6, 'params': {}}
+    return requests.post(address, json=payload, timeout=10).json()['result']
+
+
+def sequential_load(anki, card_id):
+    """Старый load_card: по запросу на каждое действие."""
+    media_path = anki.getMediaDirPath()
+    card_info = anki.cardsInfo([card_id])[0]
+    templates = anki.modelTemplates(modelName=card_info['modelName'])
+    styling = anki.modelStyling(modelName=card_info['modelName'])
+    return CardLoader.build(card_id, card_info, templates, styling, media_path)
+
+
+def card_load_benchmark():
+    """(мс и запросов на карточку до, мс и запросов после, одинаковый ли HTML)."""
+    results = []
+    with StubAnki(StubCollection(CARD_LOADS), delay=ANKI_DELAY) as stub:
+        anki = AnkiConnect(stub.address)
+        card_ids = list(stub.collection.cards)[:CARD_LOADS]
+        loader = CardLoader(anki)
+        for name, load in (("последовательно (до)", lambda c: sequential_load(anki, c)), ("CardLoader multi (после)", loader.load)):
+            load(card_ids[0])  # прогрев
+            requests_before, start = stub.requests, time.perf_counter()
+            cards = [load(c) for c in card_ids]
+            dt = (time.perf_counter() - start) / len(card_ids)
+            round_trips = (stub.requests - requests_before) / len(card_ids)
+            print(f"{name:<40} | {dt * 1000:8.2f} мс | {round_trips:.2f} запросов на карточку")
+            results.append((dt, round_trips, cards))
+    (t_before, rt_before, cards_before), (t_after, rt_after, cards_after) = results
+    return t_before, rt_before, t_after, rt_after, cards_before == cards_after
+
+
+def async_benchmark():
+    """(мс на CARD_LOADS карточек подряд, через gather, мс блокировки вызывающего потока синхронно и через submit)."""
+    with StubAnki(StubCollection(CARD_LOADS), delay=ANKI_DELAY) as stub:
+        client = AsyncAnkiConnect(AnkiConnect(stub.address, pool_size=THREADS), max_workers=THREADS)
+        loader = CardLoader(client.anki)
+        card_ids = list(stub.collection.cards)[:CARD_LOADS]
+
+        async def sequential():
+            return [await client.run(loader.load, c) for c in card_ids]
+
+        async def concurrent():
+            return await asyncio.gather(*[client.run(loader.load, c) for c in card_ids])
+
+        timings = []
+        for run in (sequential, concurrent):
+            start = time.perf_counter()
+            asyncio.run(run())
+            timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        loader.load(card_ids[0])
+        blocked_sync = time.perf_counter() - start
+        start = time.perf_counter()
+        future = client.submit(loader.load, card_ids[0])
+        blocked_async = time.perf_counter() - start
+        future.result()
+        client.close()
+    return timings[0], timings[1], blocked_sync, blocked_async
+
+
+def cache_benchmark():
+    """[(название, мс на карточку, запросов на карточку, действий Anki на карточку)], доля попаданий, одинаковый ли HTML."""
+    rows = []
+    with StubAnki(StubCollection(CARD_LOADS), delay=ANKI_DELAY) as stub:
+        card_ids = list(stub.collection.cards)
+        plain, cached = CardLoader(AnkiConnect(stub.address)), CardLoader(CachedAnkiConnect(stub.address))
+        for name, loader in (("без кэша", plain), ("кэш, новые карты", cached), ("кэш, те же карты", cached)):
+            calls_before, requests_before = sum(stub.collection.calls.values()), stub.requests
+            calls_before -= stub.collection.calls.get('multi', 0)
+            start = time.perf_counter()
+            cards = [loader.load(c) for c in card_ids]
+            dt = (time.perf_counter() - start) / len(card_ids)
+            calls = sum(stub.collection.calls.values()) - stub.collection.calls.get('multi', 0) - calls_before
+            rows.append((name, dt, (stub.requests - requests_before) / len(card_ids), calls / len(card_ids), cards))
+        hits, misses = sum(cached.anki.hits.values()), sum(cached.anki.misses.values())
+    same = rows[0][4] == rows[2][4]
+    for name, dt, round_trips, calls, _ in rows:
+        print(f"{'CardLoader, ' + name:<40} | {dt * 1000:8.2f} мс | {round_trips:.2f} запросов, {calls:.2f} действий Anki на карточку")
+    return rows, hits / max(hits + misses, 1), same
+
+
+def missing_card_check(missing=999999):
+    """Ненайденная карта: кэш отдаёт {} на её месте, как обычный cardsInfo, и проверка mod-времён после неё не падает."""
+    with StubAnki(StubCollection(CARD_LOADS)) as stub:
+        plain, cached = AnkiConnect(stub.address), CachedAnkiConnect(stub.address, validate_interval=0)
+        card_id = next(iter(stub.collection.cards))
+        ok = True
+        for _ in range(2):  # второй проход идёт вместе с проверкой mod-времён закэшированных карт
+            ok &= cached.cardsInfo([missing]) == plain.cardsInfo([missing]) == [{}]
+            ok &= cached.cardsInfo([card_id, missing]) == plain.cardsInfo([card_id, missing])
+        ok &= CardLoader(cached).load(missing) is None
+    return ok
+
+
+def prefetch_benchmark(rounds=20):
+    """(мс до готовой карточки без очереди, мс через pop(), доля pop() с готовой карточкой)."""
+    with StubAnki(StubCollection(CARD_LOADS), delay=ANKI_DELAY) as stub:
+        client = AsyncAnkiConnect(CachedAnkiConnect(stub.address))
+        loader = CardLoader(client.anki)
+        prefetcher = CardPrefetcher(client, loader)
+        loader.load(prefetcher.next_card_id())  # прогрев кэша моделей и папки медиа
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            loader.load(prefetcher.next_card_id())
+        on_demand = (time.perf_counter() - start) / rounds
+
+        prefetcher.refresh()
+        waited = 0.0
+        for _ in range(rounds):
+            time.sleep(0.2)  # игрок между возрождениями: очередь успевает дозагрузиться
+            start = time.perf_counter()
+            card = prefetcher.pop()
+            waited += time.perf_counter() - start
+            if card: client.anki.answerCards([{"cardId": card['id'], "ease": 3}])
+        client.close()
+    return on_demand, waited / rounds, prefetcher.hits / rounds
+
+
+if __name__ == "__main__":
+    print(f"Запросов: {REQUESTS}, потоков в многопоточном замере: {THREADS}\n")
+    results = {}
+    with StubAnki() as stub:
+        anki = AnkiConnect(stub.address, pool_size=THREADS)
+        before = stub.connections
+        results['post'] = measure("requests.post (до)", lambda: plain_post(stub.address))
+        post_connections, before = stub.connections - before, stub.connections
+        results['keepalive'] = measure("AnkiConnect keep-alive (после)", anki.version)
+        keepalive_connections, before = stub.connections - before, stub.connections
+        results['post_mt'] = measure(f"requests.post, {THREADS} потока", lambda: plain_post(stub.address), threads=THREADS)
+        before = stub.connections
+        results['pool_mt'] = measure(f"AnkiConnect пул {THREADS}, {THREADS} потока", anki.version, threads=THREADS)
+        pool_connections = stub.connections - before
+
+    with StubAnki(close_every=7) as stub:
+        anki = AnkiConnect(stub.address)
+        ok = all(anki.version() == 6 for _ in range(50))
+        reconnects = anki.transport.reconnects
+
+    print(f"\nЗагрузка {CARD_LOADS} карточек, задержка Anki {ANKI_DELAY * 1000:.0f} мс:")
+    t_before, rt_before, t_after, rt_after, same = card_load_benchmark()
+    t_seq, t_gather, blocked_sync, blocked_async = async_benchmark()
+    print(f"{'AsyncAnkiConnect подряд':<40} | {t_seq * 1000:8.1f} мс на {CARD_LOADS}")
+    print(f"{f'AsyncAnkiConnect gather, {THREADS} потока':<40} | {t_gather * 1000:8.1f} мс на {CARD_LOADS}")
+    cache_rows, hit_rate, cache_same = cache_benchmark()
+    missing_ok = missing_card_check()
+    t_on_demand, t_pop, pop_hits = prefetch_benchmark()
+    print(f"{'Следующая карта: поиск + сборка':<40} | {t_on_demand * 1000:8.2f} мс")
+    print(f"{'Следующая карта: CardPrefetcher.pop()':<40} | {t_pop * 1000:8.2f} мс | готова в {pop_hits:.0%} случаев")
+
+    print("\n" + "=" * 72)
+    print(f"Один поток:  x{results['keepalive'] / results['post']:.2f} "
+          f"(соединений: {post_connections} → {keepalive_connections})")
+    print(f"{THREADS} потока:    x{results['pool_mt'] / results['post_mt']:.2f} (соединений после: {pool_connections})")
+    print(f"Переподключение после разрыва сервером: {'✅' if ok else '❌'} (повторов: {reconnects})")
+    print(f"Карточка: {t_before * 1000:.1f} → {t_after * 1000:.1f} мс, запросов {rt_before:.0f} → {rt_after:.0f}, "
+          f"HTML {'совпадает ✅' if same else 'отличается ❌'}")
+    (_, t_plain, _, calls_plain, _), _, (_, t_warm, _, calls_warm, _) = cache_rows
+    print(f"Кэш: {t_plain * 1000:.1f} → {t_warm * 1000:.1f} мс на карточку из кэша, действий Anki {calls_plain:.0f} → {calls_warm:.0f}, "
+          f"попаданий {hit_rate:.0%}, HTML {'совпадает ✅' if cache_same else 'отличается ❌'}")
+    print(f"Кэш, ненайденная карта: {'{} как у cardsInfo ✅' if missing_ok else 'ошибка ❌'}")
+    print(f"Возрождение → карточка: {t_on_demand * 1000:.1f} → {t_pop * 1000:.2f} мс (очередь не пуста в {pop_hits:.0%} случаев)")
+    print(f"Async: x{t_seq / t_gather:.2f} с gather; поток GUI ждёт {blocked_sync * 1000:.2f} → {blocked_async * 1000:.2f} мс на карточку")
+    print("=" * 72)
@@ -0,0 +1,114 @@
+"""
+Экспорт двухстадийного варианта matcher.onnx.
+
+matcher.onnx принимает пару (scene, template) и для каждой пары заново гоняет backbone сцены.
+Граф режется по выходам backbone'ов на три модели:
+    matcher_scene.onnx    - scene (1, 3, H, W)    -> scene_features    (токены сцены)
+    matcher_template.onnx - template (1, 3, h, w) -> template_features (токены шаблона)
+    matcher_head.onnx     - (scene_features, template_features) -> output (cross-attention + голова)
+
+Веса и операции не меняются, поэтому результат совпадает с исходной моделью.
+После экспорта respawn_detect_ai.TemplateMatcher подхватывает двухстадийный режим сам.
+
+Запуск: python respawn_detect/export_split_model.py
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import onnx
+import onnx.utils
+import onnxruntime as ort
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+from respawn_detect_ai import MODEL_FILENAME, SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME
+
+# Граница между backbone'ами и головой корреляции в matcher.onnx
+SCENE_TOKENS = "/Transpose_output_0"
+TEMPLATE_TOKENS = "/Transpose_1_output_0"
+
+SCENE_FEATURES = "scene_features"
+TEMPLATE_FEATURES = "template_features"
+
+
+def rename_tensor(model, old, new):
+    """Переименовывает тензор во всём графе (входы/выходы графа и узлов)."""
+    graph = model.graph
+    for node in graph.node:
+        for i, name in enumerate(node.input):
+            if name == old: node.input[i] = new
+        for i, name in enumerate(node.output):
+            if name == old: node.output[i] = new
+    for value in list(graph.input) + list(graph.output) + list(graph.value_info):
+        if value.name == old: value.name = new
+
+
+def extract(source_path, target_path, inputs, outputs, renames):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = os.path.join(tmp, os.path.basename(target_path))
+        onnx.utils.extract_model(source_path, tmp_path, inputs, outputs)
+        model = onnx.load(tmp_path)
+    for old, new in renames.items():
+        rename_tensor(model, old, new)
+    onnx.checker.check_model(model)
+    onnx.save(model, target_path)
+    print(f"✅ {os.path.basename(target_path)}: {len(model.graph.node)} nodes, {os.path.getsize(target_path) / 1e6:.1f} MB")
+
+
+def export(model_dir=SCRIPT_DIR):
+    source_path = os.path.join(model_dir, MODEL_FILENAME)
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f"Нет модели {source_path}")
+
+    extract(source_path, os.path.join(model_dir, SCENE_MODEL_FILENAME),
+            ["scene"], [SCENE_TOKENS], {SCENE_TOKENS: SCENE_FEATURES})
+    extract(source_path, os.path.join(model_dir, TEMPLATE_MODEL_FILENAME),
+            ["template"], [TEMPLATE_TOKENS], {TEMPLATE_TOKENS: TEMPLATE_FEATURES})
+    extract(source_path, os.path.join(model_dir, HEAD_MODEL_FILENAME),
+            [SCENE_TOKENS, TEMPLATE_TOKENS], ["output"], {SCENE_TOKENS: SCENE_FEATURES, TEMPLATE_TOKENS: TEMPLATE_FEATURES})
+
+
+def verify(model_dir=SCRIPT_DIR, scene_shape=(1, 3, 544, 960), template_shape=(1, 3, 64, 288), iterations=5):
+    """Сравнивает исходную и двухстадийную модели на случайном входе и меряет время."""
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = 2
+    load = lambda f: ort.InferenceSession(os.path.join(model_dir, f), sess_options=opts, providers=['CPUExecutionProvider'])
+    full, scene, template, head = [load(f) for f in (MODEL_FILENAME, SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME)]
+
+    rng = np.random.default_rng(0)
+    scene_tensor = rng.standard_normal(scene_shape, dtype=np.float32)
+    template_tensor = rng.standard_normal(template_shape, dtype=np.float32)
+
+    def run_full():
+        return full.run(None, {"scene": scene_tensor, "template": template_tensor})[0]
+
+    template_features = template.run(None, {"template": template_tensor})[0]
+    def run_split():
+        scene_features = scene.run(None, {"scene": scene_tensor})[0]
+        return head.run(None, {SCENE_FEATURES: scene_features, TEMPLATE_FEATURES: template_features})[0]
+
+    diff = float(np.abs(run_full() - run_split()).max())
+    print(f"\nМакс. разница с {MODEL_FILENAME}: {diff:.2e}")
+
+    def timeit(fn):
+        start = time.perf_counter()
+        for _ in range(iterations): fn()
+        return (time.perf_counter() - start) / iterations * 1000
+
+    scene_features = scene.run(None, {"scene": scene_tensor})[0]
+    t_full = timeit(run_full)
+    t_scene = timeit(lambda: scene.run(None, {"scene": scene_tensor}))
+    t_head = timeit(lambda: head.run(None, {SCENE_FEATURES: scene_features, TEMPLATE_FEATURES: template_features}))
+    print(f"Полная модель на пару:  {t_full:.1f} мс")
+    print(f"Энкодер сцены на кадр:  {t_scene:.1f} мс")
+    print(f"Голова на шаблон:       {t_head:.1f} мс")
+    for n in (1, 5, 20):
+        print(f"  {n:2d} шаблонов: {n * t_full:8.1f} мс -> {t_scene + n * t_head:8.1f} мс")
+    return diff
+
+
+if __name__ == "__main__":
+    export()
+    verify()
@@ -0,0 +1,225 @@
+"""
+Квантизация matcher.onnx (и двухстадийных моделей, если они экспортированы) с проверкой против FP32.
+
+Создаёт рядом с исходными файлами:
+    <модель>.int8.onnx - статическая INT8 квантизация (QDQ, веса по каналам), калибровка на синтетических сценах
+    <модель>.fp16.onnx - веса и вычисления в FP16, входы/выходы остаются FP32 (нужен пакет onnxconverter-common)
+TemplateMatcher подхватывает их сам (onnx_precision: auto в config.yaml, см. utils/ort_session.py).
+
+Затем на других синтетических сценах (шаблон вклеен в шум / только шум) сравнивает каждый вариант с FP32:
+разница оценок, совпадение решений при пороге THRESHOLD и время на пару (сцена, шаблон).
+Наборы моделей проверяются отдельно, каждый своим путём: matcher.onnx - одним запуском на пару,
+двухстадийный - сцена -> шаблон -> голова (время - сцена + голова, признаки шаблона в матчере считаются один раз).
+Вариант набора, который меняет решения (совпадение < MIN_AGREEMENT) или не быстрее FP32 (< MIN_SPEEDUP),
+удаляется у моделей этого набора - иначе onnx_precision: auto молча взял бы его. --keep оставляет все варианты.
+
+Динамическая квантизация (quantize_dynamic) для этой сети не годится: depthwise свёртки теряют сигнал
+(оценки совпадения сваливаются к ~0.4) и ConvInteger на CPU медленнее FP32 в разы.
+
+Запуск: python respawn_detect/quantize_model.py [--keep] [--no-export]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import cv2
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.abspath(os.path.join(SCRIPT_DIR, '..')))
+from respawn_detect_ai import MODEL_FILENAME, SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME, Preprocessor
+from utils.ort_session import SessionSettings, create_session, variant_path
+
+TEMPLATES_PATH = "templates"
+SCENE_SIZE = (544, 960)  # (h, w) - кратно stride
+SAMPLES = 8              # сцен каждого типа на шаблон
+ITERATIONS = 5
+THRESHOLD = 0.7
+MIN_AGREEMENT = 0.98     # доля решений (score > THRESHOLD), совпадающих с FP32
+MIN_SPEEDUP = 1.05
+CALIBRATION_SEED, EVAL_SEED = 0, 1
+MODELS = (MODEL_FILENAME, SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME)
+# Наборы моделей, которые матчер запускает вместе: проверяются и удаляются вместе
+MODEL_SETS = {
+    'single-stage': (MODEL_FILENAME,),
+    'two-stage': (SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME),
+}
+
+
+def make_samples(seed=0):
+    """[(сцена RGB, шаблон RGB, есть ли шаблон на сцене)]: шаблон вклеен в шум в случайном месте или только шум."""
+    rng = np.random.default_rng(seed)
+    templates = []
+    if os.path.isdir(TEMPLATES_PATH):
+        for f in sorted(os.listdir(TEMPLATES_PATH)):
+            img = cv2.imread(os.path.join(TEMPLATES_PATH, f))
+            if img is not None: templates.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    if not templates:
+        templates = [rng.integers(0, 255, (48, 160, 3), dtype=np.uint8)]
+
+    h, w = SCENE_SIZE
+    samples = []
+    for template in templates:
+        th, tw = template.shape[:2]
+        if th > h or tw > w: continue
+        for _ in range(SAMPLES):
+            scene = (rng.integers(0, 255, (h, w, 3), dtype=np.uint8) // 4 + 60).astype(np.uint8)
+            samples.append((scene.copy(), template, False))
+            y, x = rng.integers(0, h - th + 1), rng.integers(0, w - tw + 1)
+            scene[y:y + th, x:x + tw] = template
+            samples.append((scene, template, True))
+    return samples
+
+
+def make_tensors(samples):
+    pre = Preprocessor()
+    return [(pre(scene), pre(template)) for scene, template, _ in samples]
+
+
+def fp32_session(name, model_dir=SCRIPT_DIR):
+    return create_session(os.path.join(model_dir, name), SessionSettings(precision='fp32', cache_optimized=False))
+
+
+def calibration_feeds(name, tensors, model_dir=SCRIPT_DIR):
+    """Входы модели name на калибровочных сценах. Для головы - признаки из FP32 моделей сцены и шаблона."""
+    names = [i.name for i in fp32_session(name, model_dir).get_inputs()]
+    if name == MODEL_FILENAME:
+        return [{names[0]: s, names[1]: t} for s, t in tensors]
+    if name == SCENE_MODEL_FILENAME:
+        return [{names[0]: s} for s, _ in tensors]
+    if name == TEMPLATE_MODEL_FILENAME:
+        return [{names[0]: t} for _, t in tensors]
+    scene, template = fp32_session(SCENE_MODEL_FILENAME, model_dir), fp32_session(TEMPLATE_MODEL_FILENAME, model_dir)
+    return [{names[0]: scene.run(None, {scene.get_inputs()[0].name: s})[0],
+             names[1]: template.run(None, {template.get_inputs()[0].name: t})[0]} for s, t in tensors]
+
+
+def quantize_int8(path, feeds):
+    from onnxruntime.quantization import quantize_static, CalibrationDataReader, QuantFormat, QuantType
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.feeds = iter(feeds)
+
+        def get_next(self):
+            return next(self.feeds, None)
+
+    target = variant_path(path, 'int8')
+    # Ветка шаблона делит веса с веткой сцены через Identity - квантизатору нужны веса Conv как initializer,
+    # поэтому сначала предобработка (сворачивает Identity/константы и выводит формы)
+    prepared = variant_path(path, 'prep')
+    try:
+        quant_pre_process(path, prepared, skip_symbolic_shape=True)
+        quantize_static(prepared, target, Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8)
+    finally:
+        if os.path.exists(prepared): os.remove(prepared)
+    print(f"✅ {os.path.basename(target)}: {os.path.getsize(target) / 1e6:.1f} MB")
+
+
+def convert_fp16(path):
+    try:
+        import onnx
+        from onnxconverter_common import float16
+    except ImportError:
+        print(f"⚠️ {os.path.basename(path)}: FP16 пропущен (pip install onnx onnxconverter-common)")
+        return
+    target = variant_path(path, 'fp16')
+    model = float16.convert_float_to_float16(onnx.load(path), keep_io_types=True)
+    onnx.save(model, target)
+    print(f"✅ {os.path.basename(target)}: {os.path.getsize(target) / 1e6:.1f} MB")
+
+
+def export(model_dir=SCRIPT_DIR):
+    tensors = make_tensors(make_samples(CALIBRATION_SEED))
+    for name in MODELS:
+        path = os.path.join(model_dir, name)
+        if not os.path.exists(path): continue
+        quantize_int8(path, calibration_feeds(name, tensors, model_dir))
+        convert_fp16(path)
+
+
+def scorer(model_set, precision, model_dir=SCRIPT_DIR):
+    """
+    (оценка пары, замер) для набора моделей с вариантом precision - так же, как их запускает матчер.
+    score(s, t) -> оценка пары; timed(s, t) - то, что матчер делает на каждом кадре для пары.
+    """
+    settings = SessionSettings(precision=precision, cache_optimized=False)
+    if model_set == 'single-stage':
+        session = create_session(os.path.join(model_dir, MODEL_FILENAME), settings)
+        scene_name, template_name = session.get_inputs()[0].name, session.get_inputs()[1].name
+        score = lambda s, t: float(session.run(None, {scene_name: s, template_name: t})[0].reshape(-1)[0])
+        return score, score
+
+    scene, template, head = [create_session(os.path.join(model_dir, name), settings) for name in MODEL_SETS[model_set]]
+    scene_name, template_name = scene.get_inputs()[0].name, template.get_inputs()[0].name
+    features_name, template_features_name = head.get_inputs()[0].name, head.get_inputs()[1].name
+    encode_scene = lambda s: scene.run(None, {scene_name: s})[0]
+    encode_template = lambda t: template.run(None, {template_name: t})[0]
+    run_head = lambda fs, ft: float(head.run(None, {features_name: fs, template_features_name: ft})[0].reshape(-1)[0])
+    score = lambda s, t: run_head(encode_scene(s), encode_template(t))
+    # Признаки шаблона матчер считает при загрузке - на кадре только сцена и голова
+    template_features = {}
+
+    def timed(s, t):
+        if id(t) not in template_features: template_features[id(t)] = encode_template(t)
+        return run_head(encode_scene(s), template_features[id(t)])
+    return score, timed
+
+
+def evaluate(score, timed, tensors):
+    scores = np.array([score(s, t) for s, t in tensors])
+    timed(*tensors[0])  # прогрев
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        timed(*tensors[0])
+    return scores, (time.perf_counter() - start) / ITERATIONS * 1000
+
+
+def benchmark(model_dir=SCRIPT_DIR, keep=False):
+    """
+    Сравнивает варианты каждого набора моделей (одностадийный, двухстадийный) с FP32 того же набора.
+    Непрошедшие проверку варианты удаляются только у моделей своего набора.
+    """
+    samples = make_samples(EVAL_SEED)
+    tensors = make_tensors(samples)
+    labels = np.array([label for _, _, label in samples])
+    print(f"\nСцен: {len(samples)} ({SCENE_SIZE[1]}x{SCENE_SIZE[0]}), порог {THRESHOLD}")
+
+    results = {}
+    for model_set, names in MODEL_SETS.items():
+        paths = [os.path.join(model_dir, name) for name in names]
+        if not all(os.path.exists(path) for path in paths): continue
+        results[model_set] = {}
+        for precision in ('fp32', 'int8', 'fp16'):
+            if not any(os.path.exists(variant_path(path, precision)) for path in paths): continue
+            results[model_set][precision] = evaluate(*scorer(model_set, precision, model_dir), tensors)
+
+        ref_scores, ref_ms = results[model_set]['fp32']
+        print(f"\n--- {model_set}: {', '.join(names)} ---")
+        print(f"{'Вариант':<8} | {'мс/пара':<8} | {'Ускорение':<9} | {'max |Δ|':<8} | {'mean |Δ|':<8} | {'Решения = FP32':<14} | Точность")
+        for precision, (scores, ms) in results[model_set].items():
+            diff = np.abs(scores - ref_scores)
+            agree = np.mean((scores > THRESHOLD) == (ref_scores > THRESHOLD))
+            accuracy = np.mean((scores > THRESHOLD) == labels)
+            print(f"{precision:<8} | {ms:<8.1f} | x{ref_ms / ms:<8.2f} | {diff.max():<8.4f} | {diff.mean():<8.4f} | {agree * 100:<13.1f}% | {accuracy * 100:.1f}%")
+            if precision == 'fp32' or keep: continue
+            if agree < MIN_AGREEMENT or ref_ms / ms < MIN_SPEEDUP:
+                for path in paths:
+                    variant = variant_path(path, precision)
+                    if os.path.exists(variant): os.remove(variant)
+                print(f"❌ {model_set} {precision}: не прошёл проверку (совпадение >= {MIN_AGREEMENT:.0%}, "
+                      f"ускорение >= x{MIN_SPEEDUP}) - файлы набора удалены")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Квантизация моделей матчера и сравнение с FP32")
+    parser.add_argument("--keep", action="store_true", help="не удалять варианты, не прошедшие проверку")
+    parser.add_argument("--no-export", action="store_true", help="только сравнить уже созданные варианты")
+    args = parser.parse_args()
+    if not args.no_export:
+        export()
+    benchmark(keep=args.keep)
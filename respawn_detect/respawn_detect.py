@@ -6,7 +6,12 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from utils.anki_connect import hi as hi_anki
 import utils.config as config
 import utils.profiler
-from screeninfo import get_monitors
+from utils.pyramid import build_pyramid, downscale_mask, effective_levels, coarse_candidates, candidate_window
+from utils.scale_bank import ScaleBank, config_resolution, resize
+from utils.frame_source import PyAutoGuiSource, to_rgb
+from utils.respawn_events import FrameScores, RespawnDetector, EVENT_STARTED
+from utils.poll_scheduler import PollScheduler
+from utils.template_store import get_store
 import mss
 import cv2
 import pyautogui
@@ -18,19 +23,49 @@ import numpy as np
 
 prof = utils.profiler.get_profiler("template_matcher")
 
+MONITOR_REFRESH_INTERVAL = 5.0 # Как часто (сек) перепроверять мониторы: смена разрешения/DPI перестраивает банк масштабов
+
 pyautogui.useImageNotFoundException(False)
 
 def hi():
     print(f'hi from {__name__}')
 
 class TemplateMatcher:
-    def __init__(self, config, use_gray=False):
+    def __init__(self, config, use_gray=False, engine='opencv', pyramid_levels=0, pyramid_top_k=3, frame_source=None):
+        """
+        engine: 'opencv' - cv2.matchTemplate по заранее загруженным numpy-шаблонам (по умолчанию),
+                'pyautogui' - старый путь через pyautogui.locate (для сравнения).
+        pyramid_levels: >0 - поиск от грубого к точному (только engine='opencv'): сначала на сцене,
+                        уменьшенной в 2**pyramid_levels раз, затем pyramid_top_k кандидатов
+                        проверяются на полном разрешении.
+
+        frame_source: откуда брать кадры (utils.frame_source). None - живой захват через pyautogui.
+                      Для записей (ImageDirSource/VideoFileSource) вызывающий сам переключает кадры через next().
+
+        engine='opencv' ищет каждый монитор отдельно, шаблоном, отмасштабированным под разрешение этого монитора
+        (utils.scale_bank). Разрешение шаблона - из суффикса "@ШxВ" в имени файла или config.template_base_resolution;
+        если оно неизвестно, шаблон не масштабируется.
+        """
         self.config = config
         self.templates_path = 'templates'
         self.template_extensions = ['.png','.jpg']
         self.use_gray = use_gray
-        self.monitors = []
+        self.engine = engine
+        self.pyramid_levels = pyramid_levels
+        self.pyramid_top_k = pyramid_top_k
+        self.frame_source = frame_source or PyAutoGuiSource()
+        self.monitors = [] # [{'left', 'top', 'width', 'height', ...}] - физические мониторы источника кадров
+        self._monitors_key = None
+        self._monitors_checked = 0.0
+        self.templates = () # ((путь, изображение, маска или None), ...) - из общего хранилища шаблонов
+        self.template_store = get_store(self.templates_path, self.template_extensions)
+        # (путь, масштаб) -> (изображение, маска, ([изображение по уровням], [маска по уровням]) или None)
+        self.scale_bank = ScaleBank(self._build_scaled_template,
+                                    config_resolution(getattr(config, 'template_base_resolution', None)))
+        self.scores = FrameScores()  # оценки совпадений текущей проверки (engine='opencv')
+        self.last_score = None       # лучшая оценка последней проверки - для гистерезиса RespawnDetector
         self.update_monitors()
+        self.load_templates()
 
     @prof
     def check(self, return_template_path = False):
@@ -51,9 +86,9 @@ class TemplateMatcher:
                 (False, None) если совпадений нет
         
         Алгоритм работы:
-        1. Делает скриншот экрана
-        2. Итерируется по всем файлам в директории шаблонов
-        3. Для каждого подходящего файла (png/jpg) пытается найти совпадение на скриншоте
+        1. Берёт кадр всего экрана у источника кадров (по умолчанию - скриншот pyautogui)
+        2. Итерируется по заранее загруженным шаблонам (png/jpg из директории шаблонов)
+        3. Для каждого шаблона пытается найти совпадение на скриншоте
         4. При первом найденном совпадении прерывает поиск
         
         
@@ -61,30 +96,98 @@ class TemplateMatcher:
         - Использует confidence_level из конфигурации
         - Прекращает поиск при первом совпадении
         - Поддерживает многомониторные конфигурации (allScreens=True)
+        - Шаблоны перечитываются только при изменении файлов в директории шаблонов (utils.template_store)
         """
+        self.scores.begin()
+        try:
+            self.refresh_templates()
+            if time.perf_counter() - self._monitors_checked > MONITOR_REFRESH_INTERVAL:
+                self.update_monitors()
+            frame = self.frame_source.grab()
+            if frame is None:
+                return (False, None) if return_template_path else False
+            screen_rgb = to_rgb(frame)
 
-        screen_img = self.get_screen_img()
-        
-        for filename in os.listdir(self.templates_path):
-            template_path = os.path.join(self.templates_path, filename)
-                
-            if os.path.isfile(template_path):
-                _, extension = os.path.splitext(filename)
-                if extension.lower() in self.template_extensions:
+            if self.engine == 'pyautogui':
+                screen_img = Image.fromarray(screen_rgb)
+                for template_path, _, _ in self.templates:
                     if self.find_pattern(screen_img, template_path, self.config.confidence_level):
                         if return_template_path:
                             return True, template_path
                         return True
-        if return_template_path:
-            return False, None
-        return False
+            else:
+                # Скриншот конвертируется один раз; каждый монитор ищется шаблонами под своё разрешение
+                haystack = self.prepare_image(screen_rgb)
+                for monitor_size, (x0, y0, x1, y1) in self.monitor_regions(haystack.shape):
+                    region = haystack[y0:y1, x0:x1]
+                    region_pyramid = build_pyramid(region, self.pyramid_levels) if self.pyramid_levels else None
+                    for template_path, _, _ in self.templates:
+                        if region_pyramid:
+                            found = self.find_pattern_pyramid(region_pyramid, template_path, self.config.confidence_level,
+                                                              monitor_size=monitor_size)
+                        else:
+                            needle, mask, _ = self.template_variant(template_path, monitor_size)
+                            found = self.find_pattern_cv(region, needle, self.config.confidence_level, mask=mask)
+                        if found:
+                            print(f"Найдено совпадение с шаблоном: {template_path}")
+                            if return_template_path:
+                                return True, template_path
+                            return True
+
+            if return_template_path:
+                return False, None
+            return False
+        finally:
+            self.last_score = self.scores.end()
+
+    @prof
+    def load_templates(self):
+        """
+        Перечитывает папку шаблонов сразу, не дожидаясь опроса хранилища (utils.template_store).
+        Файлы декодирует хранилище, общее с нейросетевым матчером; здесь - приведение к RGB/серому и маска прозрачности.
+        """
+        self.template_store.refresh()
+        self.refresh_templates()
+
+    def _prepare_template(self, file):
+        template_img, mask = self.prepare_image(file.image, keep_alpha=True)
+        return file.path, template_img, mask
+
+    def _build_scaled_template(self, template, scale):
+        template_img, mask = template
+        template_img, mask = resize(template_img, scale), resize(mask, scale, is_mask=True)
+        pyramid = None
+        if self.pyramid_levels:
+            levels = build_pyramid(template_img, self.pyramid_levels)
+            pyramid = (levels, [downscale_mask(mask, level.shape) for level in levels])
+        return template_img, mask, pyramid
+
+    def rebuild_scale_bank(self):
+        """Заново строит варианты всех шаблонов под все текущие мониторы (после смены шаблонов или мониторов)."""
+        self.scale_bank.variants.clear()
+        if self.engine != 'opencv': return
+        self.scale_bank.prebuild([(path, (img, mask), None) for path, img, mask in self.templates])
+
+    def template_variant(self, template_path, monitor_size=None):
+        """(изображение, маска, пирамида) шаблона под монитор monitor_size=(ширина, высота); None - без масштаба."""
+        for path, template_img, mask in self.templates:
+            if path == template_path:
+                return self.scale_bank.get(path, (template_img, mask), monitor_size)
+        raise KeyError(template_path)
+
+    def refresh_templates(self):
+        """Подхватывает изменения папки шаблонов: хранилище проверяет mtime не чаще раза в несколько секунд."""
+        templates = self.template_store.prepared(self, self._prepare_template)
+        if templates is not self.templates:
+            self.templates = templates
+            self.rebuild_scale_bank()
 
     @prof
     def get_screen_img(self, allScreens=True, monitor_id=0, region=(0.25,0.25,0.5,0.5)):
         """
         Захват изображения экрана с поддержкой мультимониторных конфигураций.
         
-        Использует pyautogui.screenshot() для корректной обработки DPI scaling.
+        Кадр берётся у self.frame_source (по умолчанию pyautogui.screenshot() - корректно обрабатывает DPI scaling).
         
         Args:
             allScreens (bool): Если True, захватывает все мониторы в одно изображение.
@@ -113,52 +216,163 @@ class TemplateMatcher:
             для актуализации списка мониторов.
         """
         if allScreens:
-            pil_img = pyautogui.screenshot(allScreens=True)
+            frame = self.frame_source.grab()
             
         elif monitor_id is not None and monitor_id < len(self.monitors):  # ✅ Исправлено
             monitor = self.monitors[monitor_id]
             
             if region is not None:
                 # region - относительные координаты (x, y, w, h) в диапазоне 0.0-1.0
-                abs_x = int(monitor.x + region[0] * monitor.width)
-                abs_y = int(monitor.y + region[1] * monitor.height)
-                abs_width = int(region[2] * monitor.width)
-                abs_height = int(region[3] * monitor.height)
-                pil_img = pyautogui.screenshot(region=(abs_x, abs_y, abs_width, abs_height))
+                abs_x = int(monitor['left'] + region[0] * monitor['width'])
+                abs_y = int(monitor['top'] + region[1] * monitor['height'])
+                abs_width = int(region[2] * monitor['width'])
+                abs_height = int(region[3] * monitor['height'])
+                frame = self.frame_source.grab({'left': abs_x, 'top': abs_y, 'width': abs_width, 'height': abs_height})
             else:
                 # Весь монитор
-                pil_img = pyautogui.screenshot(region=(monitor.x, monitor.y, 
-                                                        monitor.width, monitor.height))
+                frame = self.frame_source.grab({key: monitor[key] for key in ('left', 'top', 'width', 'height')})
         else:
             # Fallback
-            pil_img = pyautogui.screenshot()
+            frame = self.frame_source.grab()
+        if frame is None:
+            return None
+        pil_img = Image.fromarray(to_rgb(frame))
         #pil_img.show()
         return pil_img
 
     @prof
     def update_monitors(self):
-        self.monitors = get_monitors()
-        for m in self.monitors:
-            print(f"Монитор: {m.name}")
-            print(f"  Разрешение: {m.width}x{m.height}")
-            print(f"  Координаты: x={m.x}, y={m.y}")
-            print(f"  Основной: {m.is_primary}\n")
+        """
+        Перечитывает список мониторов у источника кадров. Если геометрия изменилась (подключили монитор,
+        сменили разрешение/DPI) - печатает новый список и перестраивает банк масштабов шаблонов.
+        """
+        self._monitors_checked = time.perf_counter()
+        monitors = self.frame_source.get_monitors(refresh=True)[1:]
+        key = tuple((m['left'], m['top'], m['width'], m['height']) for m in monitors)
+        if key == self._monitors_key:
+            return False
+        self.monitors = monitors
+        self._monitors_key = key
+        for i, m in enumerate(self.monitors):
+            print(f"Монитор: {m.get('name', i + 1)}")
+            print(f"  Разрешение: {m['width']}x{m['height']}")
+            print(f"  Координаты: x={m['left']}, y={m['top']}")
+            print(f"  Основной: {m.get('is_primary', i == 0)}\n")
+        self.scale_bank.set_monitors([(m['width'], m['height']) for m in self.monitors])
+        self.rebuild_scale_bank()
+        return True
+
+    def monitor_regions(self, haystack_shape):
+        """
+        [((ширина, высота) монитора, (x0, y0, x1, y1) в кадре всего экрана)].
+        Кадр всех экранов начинается с левого верхнего угла виртуального экрана.
+        Если мониторы неизвестны или не совпадают со скриншотом - весь скриншот считается одним монитором.
+        """
+        hh, hw = haystack_shape[:2]
+        regions = []
+        if self.monitors:
+            left = min(m['left'] for m in self.monitors)
+            top = min(m['top'] for m in self.monitors)
+            for m in self.monitors:
+                x0, y0 = max(0, m['left'] - left), max(0, m['top'] - top)
+                x1, y1 = min(hw, x0 + m['width']), min(hh, y0 + m['height'])
+                if x1 > x0 and y1 > y0:
+                    regions.append(((m['width'], m['height']), (x0, y0, x1, y1)))
+        return regions or [((hw, hh), (0, 0, hw, hh))]
 
     @prof
     def prepare_image(self, source, keep_alpha=False):
-        pass
+        """
+        Приводит источник к numpy-массиву для cv2.matchTemplate.
+
+        Args:
+            source: путь к файлу, PIL.Image или numpy-массив RGB/RGBA.
+            keep_alpha (bool): Если True - возвращает (изображение, маска). Маска - альфа-канал,
+                               или None, если прозрачности нет.
+
+        Returns:
+            np.ndarray RGB (или серый при use_gray=True), либо кортеж (изображение, маска) при keep_alpha=True.
+            Если файл не читается - None (или (None, None)).
+        """
+        if isinstance(source, str):
+            img = cv2.imread(source, cv2.IMREAD_UNCHANGED)
+            if img is None:
+                return (None, None) if keep_alpha else None
+            if img.ndim == 2:
+                img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+            elif img.shape[2] == 4:
+                img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+            else:
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        else:
+            img = np.asarray(source)
+
+        mask = None
+        if img.ndim == 3 and img.shape[2] == 4:
+            alpha = img[:, :, 3]
+            if keep_alpha and alpha.min() < 255:
+                mask = np.ascontiguousarray(alpha)
+            img = img[:, :, :3]
+
+        if self.use_gray and img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        img = np.ascontiguousarray(img)
+        return (img, mask) if keep_alpha else img
 
     @prof
     def find_pattern(self,haystack_source, needle_source, threshold=0.95):
         """
+        Старый путь через pyautogui.locate (engine='pyautogui').
         haystack_source: Где ищем (путь или скриншот pyautogui)
         needle_source: Что ищем (путь или картинка, желательно с прозрачностью)
         """
-        location = pyautogui.locate(needle_source, haystack_source, confidence=threshold)
+        location = pyautogui.locate(needle_source, haystack_source, confidence=threshold, grayscale=self.use_gray)
         if location:
             print(f"Найдено совпадение с шаблоном: {needle_source}")
             return True
         return False
+
+    @prof
+    def find_pattern_cv(self, haystack, needle, threshold=0.95, mask=None):
+        """
+        cv2.matchTemplate по готовым numpy-массивам (из prepare_image).
+        Та же метрика, что у pyautogui.locate (TM_CCOEFF_NORMED), поэтому confidence_level сохраняет смысл.
+        mask: маска прозрачности шаблона - прозрачные пиксели не участвуют в сравнении.
+        """
+        h, w = needle.shape[:2]
+        if h > haystack.shape[0] or w > haystack.shape[1]:
+            return False
+        res = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED, mask=mask)
+        if mask is not None:
+            # С маской на однотонных участках возможны inf/nan
+            res = np.nan_to_num(res, nan=0.0, posinf=0.0, neginf=0.0)
+        _, max_val, _, _ = cv2.minMaxLoc(res)
+        self.scores.note(max_val)
+        return max_val > threshold
+
+    @prof
+    def find_pattern_pyramid(self, haystack_pyramid, template_path, threshold=0.95, monitor_size=None):
+        """
+        Поиск от грубого к точному: кандидаты с верхнего уровня пирамиды подтверждаются на полном разрешении
+        в окне вокруг каждого кандидата.
+        haystack_pyramid: build_pyramid(скриншот монитора) - строится один раз на кадр.
+        monitor_size: (ширина, высота) монитора - берётся вариант шаблона под это разрешение.
+        """
+        needle_levels, mask_levels = self.template_variant(template_path, monitor_size)[2]
+        needle, mask = needle_levels[0], mask_levels[0]
+        haystack = haystack_pyramid[0]
+        levels = effective_levels(needle.shape, min(self.pyramid_levels, len(haystack_pyramid) - 1))
+        if levels == 0:
+            return self.find_pattern_cv(haystack, needle, threshold, mask=mask)
+
+        candidates = coarse_candidates(haystack_pyramid[levels], needle_levels[levels], levels,
+                                       self.pyramid_top_k, mask_levels[levels])
+        margin = 2 ** (levels + 1)  # Погрешность координат после уменьшения
+        for _, x, y in candidates:
+            x0, y0, x1, y1 = candidate_window(x, y, needle.shape, haystack.shape, margin)
+            if self.find_pattern_cv(haystack[y0:y1, x0:x1], needle, threshold, mask=mask):
+                return True
+        return False
         
 
 if __name__ == "__main__":
@@ -182,14 +396,19 @@ if __name__ == "__main__":
 
     counter = 0
     start_time = time.time()
+    # Кадры -> события начала/конца возрождения (N из M кадров, отдельные пороги входа и выхода)
+    events = RespawnDetector(template_matcher, my_config)
+    # Пауза между проверками: целевой FPS, бюджет CPU, активное окно (см. utils.poll_scheduler)
+    scheduler = PollScheduler.from_config(my_config)
 
     while True:
         counter += 1
         
-        if template_matcher.check():
-            print('!!! Found !!!')
-            # Можно добавить небольшую паузу, если нашло, чтобы не спамить
-            # time.sleep(1)
+        with scheduler.frame():
+            event = events.poll()
+        if event is not None:
+            print('!!! Respawn started !!!' if event.kind == EVENT_STARTED else f'Respawn ended ({event.duration:.1f}s)')
+        scheduler.pause(hit=events.last_found, present=events.present, present_interval=events.poll_interval)
         
         REPORT_INTERVAL = 10
         if counter % REPORT_INTERVAL == 0:
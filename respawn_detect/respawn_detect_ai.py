@@ -1,9 +1,10 @@
 import sys
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import cv2
 import numpy as np
-import mss
 import onnxruntime as ort
 import ctypes
 
@@ -17,48 +18,381 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from utils.anki_connect import hi as hi_anki
 import utils.config as config
 import utils.profiler
+from utils.pyramid import build_pyramid, effective_levels, coarse_candidates, candidate_window
+from utils.scale_bank import ScaleBank, config_resolution, resize
+from utils.frame_source import MssSource, to_rgb
+from utils.ort_session import SessionSettings, BoundRunner, create_session
+from utils.respawn_events import FrameScores, RespawnDetector, EVENT_STARTED
+from utils.poll_scheduler import PollScheduler
+from utils.template_store import get_store
 
 prof = utils.profiler.get_profiler("template_matcher")
+prof_registry = utils.profiler.get_profiler("template_registry")
+prof_pipeline = utils.profiler.get_profiler("pipeline")
+prof_gate = utils.profiler.get_profiler("change_gate")
 
 MODEL_FILENAME = "matcher.onnx"
+# Двухстадийный вариант (создаётся export_split_model.py). Если файлы есть - используется автоматически.
+SCENE_MODEL_FILENAME = "matcher_scene.onnx"
+TEMPLATE_MODEL_FILENAME = "matcher_template.onnx"
+HEAD_MODEL_FILENAME = "matcher_head.onnx"
 
 MONITORS = [2]
 
 SCALE_FACTOR=1
 
+# True - шаблоны одного размера (и мониторы с одинаковым размером сцены) оцениваются одним session.run
+BATCH_TEMPLATES = False
+BATCH_MAX_BYTES = 256 * 2**20  # Предел буфера сцен на один session.run батча: больше пар - несколько запусков
+
+# True - session.run в горячем цикле идёт через IOBinding: входы/выходы привязаны к постоянным буферам
+# (буфер сцены монитора/тайла, тензор шаблона), onnxruntime не копирует входы и не выделяет выходы на каждом кадре
+IO_BINDING = True
+
+# True - захват и инференс в разных потоках (PipelinedDetector)
+PIPELINED = False
+
+# Пропуск инференса, если картинка монитора почти не изменилась с последней проверки (ChangeGate)
+CHANGE_GATE = True
+GATE_THRESHOLD = 12   # Разница яркости (0-255) хотя бы одной клетки миниатюры, с которой кадр считается изменившимся
+GATE_REGION = None    # Относительная область (x, y, w, h) с шаблонами. None - весь монитор
+
+# Захват и инференс только в областях (ROI), где шаблоны находились раньше (RoiTracker)
+ROI_CAPTURE = True
+ROI_RESCAN_INTERVAL = 30  # Раз в столько проверок - полный кадр, чтобы поймать смену раскладки
+ROI_MARGIN = 0.5          # Отступ вокруг рамки совпадения в долях размера шаблона
+
+# Поиск от грубого к точному: кандидаты ищутся на сцене, уменьшенной в 2**PYRAMID_LEVELS раз
+# (серый cv2.matchTemplate), нейросеть проверяет только PYRAMID_TOP_K окон на полном разрешении. 0 - выключено.
+PYRAMID_LEVELS = 0
+PYRAMID_TOP_K = 3
+
+# Шаблоны масштабируются под разрешение каждого монитора (utils.scale_bank), если разрешение шаблона известно:
+# суффикс "@ШxВ" в имени файла или template_base_resolution из config.yaml. Иначе шаблон используется как есть.
+# Раз в столько секунд мониторы перечитываются: смена разрешения/DPI перестраивает банк масштабов.
+MONITOR_REFRESH_INTERVAL = 5.0
+
+# Поиск по сетке тайлов с перекрытием: тайл, где шаблон нашёлся в прошлый раз, проверяется первым,
+# поиск прерывается на первом совпадении. Сетка (строки, столбцы): None - подбирается калибровкой при старте.
+# Перекрытие в пикселях: None - по размеру самого большого шаблона (чтобы шаблон целиком влезал хотя бы в один тайл).
+TILED = False
+TILE_GRID = None
+TILE_OVERLAP = None
+TILE_CALIBRATION_GRIDS = [(1, 1), (1, 2), (2, 2), (2, 3), (3, 3)]
+
 def hi():
     print(f'hi from {__name__}')
 
+
+def tile_grid(h, w, rows, cols, overlap_y, overlap_x):
+    """
+    Прямоугольники (y0, y1, x0, x1) сетки rows x cols по изображению h x w.
+    Каждый тайл продлевается вправо и вниз на перекрытие (как get_tiles в test_tiling.py).
+    """
+    h_step, w_step = h // rows, w // cols
+    return [(r * h_step, min(h, (r + 1) * h_step + overlap_y), c * w_step, min(w, (c + 1) * w_step + overlap_x))
+            for r in range(rows) for c in range(cols)]
+
+
+
+class Preprocessor:
+    """
+    Быстрый препроцессинг uint8 RGB -> нормализованный NCHW float32 (1, 3, H, W) с паддингом до stride.
+
+    Нормализация (x / 255 - mean) / std сведена к таблице на 256 значений для каждого канала,
+    поэтому результат бит-в-бит совпадает с TemplateMatcher.preprocess(pad_to_stride(img)).
+    Запись идёт за один проход сразу в NCHW буфер, без промежуточных float-копий кадра.
+    Хвост паддинга заполняется значением чёрного пикселя.
+
+    key: буфер переиспользуется между вызовами с одинаковым key (например, индекс монитора).
+         Результат валиден до следующего вызова с тем же key.
+         key=None - каждый раз новый массив (для тензоров, которые нужно хранить, например шаблонов).
+    on_release(buf): вызывается, когда буфер ключа пересоздан под новый размер или выброшен (release) -
+         чтобы отпустить то, что держит ссылку на старый буфер (привязки IOBinding).
+    """
+    MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    def __init__(self, stride=32):
+        self.stride = stride
+        values = np.arange(256, dtype=np.float32) / 255.0
+        self.lut = (values[None, :] - self.MEAN[:, None]) / self.STD[:, None]  # (3, 256)
+        self.buffers = {}  # key -> (1, 3, H, W) float32
+        self.on_release = None
+
+    def padded_shape(self, h, w):
+        return h + (self.stride - h % self.stride) % self.stride, w + (self.stride - w % self.stride) % self.stride
+
+    @property
+    def pad_value(self):
+        """Нормализованное значение чёрного пикселя по каналам (3,)."""
+        return self.lut[:, 0]
+
+    def get_buffer(self, key, h, w, batch=1):
+        if key is None:
+            return np.empty((batch, 3, h, w), dtype=np.float32)
+        buf = self.buffers.get(key)
+        if buf is None or buf.shape != (batch, 3, h, w):
+            if buf is not None and self.on_release: self.on_release(buf)
+            buf = np.empty((batch, 3, h, w), dtype=np.float32)
+            self.buffers[key] = buf
+        return buf
+
+    def release(self, key):
+        """Выбрасывает буфер key, который больше не понадобится."""
+        buf = self.buffers.pop(key, None)
+        if buf is not None and self.on_release: self.on_release(buf)
+
+    def fill(self, img, out):
+        """Пишет img в левый верхний угол out (3, H, W), остаток заполняет значением чёрного пикселя."""
+        h, w = img.shape[:2]
+        oh, ow = out.shape[1:]
+        for c in range(3):
+            plane = out[c]
+            # uint8 индексы не выходят за 0..255, mode='clip' позволяет писать прямо в out без буферизации
+            np.take(self.lut[c], img[:, :, c], out=plane[:h, :w], mode='clip')
+            if oh > h: plane[h:, :] = self.lut[c, 0]
+            if ow > w: plane[:h, w:] = self.lut[c, 0]
+        return out
+
+    def __call__(self, img, key=None):
+        buf = self.get_buffer(key, *self.padded_shape(*img.shape[:2]))
+        self.fill(img, buf[0])
+        return buf
+
+
+class ChangeGate:
+    """
+    Дешёвый детектор изменений перед нейросетью.
+    Кадр монитора сжимается до серой миниатюры и сравнивается с миниатюрой кадра, на котором последний раз
+    запускался инференс (а не с предыдущим кадром - так медленные изменения тоже накапливаются и ловятся).
+    Если ни одна клетка миниатюры не изменилась на threshold - инференс можно пропустить и взять прошлый результат.
+    Сравнивается максимум по клеткам, а не среднее: шаблон занимает малую часть монитора, и в среднем
+    по всей миниатюре его появление почти не заметно (tf2_5.png на 1080p - 0.1 при шуме сжатия 1.5),
+    а клетки, которые он закрывает, меняются на 20+ (шум - до 8).
+
+    region: относительная область (x, y, w, h) внутри монитора, в которой появляются шаблоны. None - весь монитор.
+    max_skip: не больше стольких пропусков подряд - затем принудительная проверка.
+    """
+    def __init__(self, threshold=GATE_THRESHOLD, thumb_size=(64, 36), region=GATE_REGION, max_skip=30):
+        self.threshold = threshold
+        self.thumb_size = thumb_size
+        self.region = region
+        self.max_skip = max_skip
+        self.references = {}  # key -> миниатюра последнего проверенного кадра
+        self.skips = {}       # key -> пропусков подряд
+
+    def thumbnail(self, img):
+        if self.region is not None:
+            h, w = img.shape[:2]
+            x, y, rw, rh = self.region
+            img = img[int(y * h):int((y + rh) * h), int(x * w):int((x + rw) * w)]
+        # Прореживание шагом до ~4x размера миниатюры перед INTER_AREA - в разы дешевле, чем усреднять весь кадр
+        step = max(1, min(img.shape[0] // (self.thumb_size[1] * 4), img.shape[1] // (self.thumb_size[0] * 4)))
+        small = cv2.resize(img[::step, ::step], self.thumb_size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY).astype(np.int16)
+
+    @prof_gate
+    def changed(self, key, img):
+        """True - кадр нужно проверить (миниатюра запоминается как новая точка отсчёта), False - можно пропустить."""
+        thumb = self.thumbnail(img)
+        ref = self.references.get(key)
+        skips = self.skips.get(key, 0)
+        if ref is not None and skips < self.max_skip and np.abs(thumb - ref).max() < self.threshold:
+            self.skips[key] = skips + 1
+            prof_gate.count("skipped")
+            return False
+        self.references[key] = thumb
+        self.skips[key] = 0
+        prof_gate.count("evaluated")
+        return True
+
+    def reset(self, key=None):
+        if key is None:
+            self.references.clear()
+            self.skips.clear()
+        else:
+            self.references.pop(key, None)
+            self.skips.pop(key, None)
+
+
+class RoiTracker:
+    """
+    Области поиска шаблонов в абсолютных координатах виртуального экрана: [left, top, width, height].
+
+    Области берутся из config.template_rois, а если там не заданы - выучиваются по рамкам прошлых совпадений
+    (объединение всех рамок шаблона + отступ). Пока области известны для всех шаблонов, захват и инференс
+    идут только по ним; раз в rescan_interval проверок делается полный кадр, чтобы поймать смену раскладки.
+    """
+    def __init__(self, bounds, declared=None, rescan_interval=ROI_RESCAN_INTERVAL, margin=ROI_MARGIN):
+        self.bounds = bounds  # монитор 0 из mss (весь виртуальный экран)
+        self.declared = {name: list(roi) for name, roi in (declared or {}).items()}
+        self.learned = {}
+        self.rescan_interval = rescan_interval
+        self.margin = margin
+        self.checks_since_rescan = 0
+
+    def get(self, name):
+        return self.declared.get(name) or self.learned.get(name)
+
+    def covers(self, templates):
+        return bool(templates) and all(self.get(t.name) for t in templates)
+
+    def need_rescan(self):
+        self.checks_since_rescan += 1
+        if self.checks_since_rescan >= self.rescan_interval:
+            self.checks_since_rescan = 0
+            return True
+        return False
+
+    def learn(self, name, left, top, width, height):
+        """Добавляет рамку совпадения шаблона (абсолютные пиксели) к его выученной области."""
+        if name in self.declared: return
+        mx = max(32, int(width * self.margin))
+        my = max(32, int(height * self.margin))
+        x0, y0, x1, y1 = left - mx, top - my, left + width + mx, top + height + my
+
+        old = self.learned.get(name)
+        if old:
+            x0, y0 = min(x0, old[0]), min(y0, old[1])
+            x1, y1 = max(x1, old[0] + old[2]), max(y1, old[1] + old[3])
+
+        b = self.bounds
+        x0, y0 = max(x0, b['left']), max(y0, b['top'])
+        x1, y1 = min(x1, b['left'] + b['width']), min(y1, b['top'] + b['height'])
+        roi = [int(x0), int(y0), int(x1 - x0), int(y1 - y0)]
+        if roi != old:
+            self.learned[name] = roi
+            print(f"📍 ROI {name}: {roi}")
+
+
+class TemplateEntry:
+    """
+    Подготовленный шаблон: RGB, RGB с паддингом до stride и готовый NCHW float32 тензор.
+    features - эмбеддинг шаблона для двухстадийной модели (None, если она не загружена).
+    """
+    __slots__ = ('name', 'path', 'mtime', 'rgb', 'padded', 'tensor', 'features', 'build_time')
+
+    def __init__(self, name, path, mtime, rgb, padded, tensor, features, build_time):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.rgb = rgb
+        self.padded = padded
+        self.tensor = tensor
+        self.features = features
+        self.build_time = build_time
+
+
+class CapturedFrame:
+    """
+    Результат capture_frame: изображения мониторов и всё, что нужно для их проверки, одним неизменяемым набором.
+    origins/sizes - как capture_origins/capture_sizes матчера, monitors - раскладка [виртуальный экран, мониторы...],
+    по которой кадр снят. Поток захвата отдаёт его потоку инференса, ничего не меняя в самом матчере.
+    """
+    __slots__ = ('images', 'origins', 'sizes', 'scale', 'monitors')
+
+    def __init__(self, images, origins, sizes, scale, monitors):
+        self.images = tuple(images)
+        self.origins = tuple(origins)
+        self.sizes = tuple(sizes)
+        self.scale = scale
+        self.monitors = tuple(monitors)
+
+
+class TemplateRegistry:
+    """
+    Шаблоны нейросетевого матчера поверх общего хранилища (utils.template_store).
+    Хранилище само следит за папкой (опрос mtime раз в несколько секунд) и декодирует файлы;
+    здесь тензор шаблона строится один раз на файл и пересобирается только если у файла поменялся mtime.
+
+    prepare: функция rgb -> (padded, tensor, features), обычно TemplateMatcher.prepare_template.
+    Сэкономленное кэшем время - показатель saved_prep_s, а не секция: оно не было потрачено и не входит в total.
+    """
+    def __init__(self, store, prepare):
+        self.store = store
+        self.prepare = prepare
+        self.saved_prep = 0.0  # с, сколько стоила бы подготовка шаблонов без кэша (pad_to_stride + preprocess)
+
+    @property
+    def entries(self):
+        return {t.path: t for t in self.get_all()}
+
+    def get_all(self):
+        return list(self.store.prepared(self, self._build, on_hit=self._count_saved))
+
+    def _count_saved(self, entry):
+        self.saved_prep += entry.build_time
+        prof_registry.count("cache_hit")
+        prof_registry.gauge("saved_prep_s", self.saved_prep)
+
+    def _build(self, file):
+        with prof_registry("build"):
+            rgb = np.ascontiguousarray(file.image[:, :, :3])
+            t0 = time.perf_counter()
+            padded, tensor, features = self.prepare(rgb)
+            build_time = time.perf_counter() - t0
+        return TemplateEntry(file.name, file.path, file.mtime, rgb, padded, tensor, features, build_time)
+
+
 class TemplateMatcher:
-    def __init__(self, config):
+    def __init__(self, config, frame_source=None):
+        """
+        frame_source: откуда брать кадры (utils.frame_source). None - живой захват через mss.
+                      Для записей (ImageDirSource/VideoFileSource) вызывающий сам переключает кадры через next().
+        """
         self.config = config
         self.templates_path = 'templates'
         self.template_extensions = ['.png', '.jpg']
         
-        self.sct = mss.mss()
+        self.frame_source = frame_source or MssSource()
+        monitors = self.frame_source.get_monitors()
         # monitors[0] - это весь виртульный экран
         # monitors[1:] - это физические мониторы
-        self.virtual_screen = self.sct.monitors[0]
-        self.physical_monitors = self.sct.monitors[1:]
+        self.virtual_screen = monitors[0]
+        self.physical_monitors = monitors[1:]
         
         self.last_found_monitor_idx = 0 
+        self.scores = FrameScores()  # оценки совпадений текущей проверки (по мониторам)
+        self.last_score = None       # лучшая оценка последней проверки - для гистерезиса RespawnDetector
+        self.static = False          # на последней проверке гейт не нашёл изменившихся мониторов (для PollScheduler)
         print(f"🖥️ Virtual Screen: {self.virtual_screen}")
         print(f"🖥️ Physical monitors: {len(self.physical_monitors)}")
 
         # === ONNX SETUP ===
-        model_path = os.path.join(os.path.dirname(__file__), MODEL_FILENAME)
+        model_dir = os.path.dirname(__file__)
+        model_path = os.path.join(model_dir, MODEL_FILENAME)
         self.session = None
-        self.template_cache = {} 
+        self.session_settings = SessionSettings.from_config(config)
+        self._runners = {}  # сессия -> BoundRunner (IO_BINDING)
+        self.preprocessor = Preprocessor()
+        self.preprocessor.on_release = self._release_bindings
+        self.templates = TemplateRegistry(get_store(self.templates_path, self.template_extensions), self.prepare_template)
+        self._template_batches = {}  # (ключ набора шаблонов, число сцен) -> [(индексы шаблонов, (сцен * k, 3, h, w))]
+        self.gate = ChangeGate() if CHANGE_GATE else None
+        self._last_results = {}  # mon_idx -> результат последней полной проверки (для пропущенных гейтом кадров)
+        self._templates_key = None
+        self.rois = RoiTracker(self.virtual_screen, getattr(config, 'template_rois', None)) if ROI_CAPTURE else None
+        self._template_pyramids = {}  # путь -> (mtime, [серый шаблон по уровням])
+        self.capture_origins = []  # (x, y) левого верхнего угла каждого изображения из capture_all_and_split в пикселях экрана
+        self.capture_sizes = []    # (ширина, высота) монитора каждого изображения после масштаба SCALE_FACTOR
+        self.capture_scale = 1
+        self.scale_bank = ScaleBank(self._build_scaled_template,  # (путь, mtime, масштаб) -> TemplateEntry
+                                    config_resolution(getattr(config, 'template_base_resolution', None)))
+        self.scale_bank.set_monitors(self._monitor_sizes())
+        self._monitors_checked = time.perf_counter()
+        self.tile_grid = TILE_GRID
+        self._tiles = {}      # (размер изображения, сетка, перекрытие) -> [(y0, y1, x0, x1)]
+        self._last_tile = {}  # mon_idx -> индекс тайла последнего совпадения
+
+        # Параллельная проверка тайлов/мониторов (inference_workers из config.yaml). Сессия onnxruntime общая:
+        # session.run потокобезопасен и отпускает GIL. 1 - последовательно, без пула.
+        self.workers = max(1, int(getattr(config, 'inference_workers', 1)))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="respawn-infer") if self.workers > 1 else None
         
         if os.path.exists(model_path):
             try:
-                sess_options = ort.SessionOptions()
-                sess_options.intra_op_num_threads = 2
-                sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-                
-                self.session = ort.InferenceSession(
-                    model_path, sess_options=sess_options, providers=['CPUExecutionProvider']
-                )
+                self.session = self._create_session(model_path)
                 
                 self.input_name_scene = self.session.get_inputs()[0].name
                 self.input_name_template = self.session.get_inputs()[1].name
@@ -69,13 +403,174 @@ class TemplateMatcher:
         else:
             print(f"❌ Model file not found")
 
+        # === ДВУХСТАДИЙНЫЙ РЕЖИМ ===
+        # Сцена кодируется один раз на монитор, эмбеддинги шаблонов считаются при загрузке,
+        # на каждый шаблон запускается только лёгкая голова корреляции.
+        self.two_stage = False
+        split_paths = [os.path.join(model_dir, f) for f in (SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME)]
+        if all(os.path.exists(p) for p in split_paths):
+            try:
+                self.scene_session, self.template_session, self.head_session = [self._create_session(p) for p in split_paths]
+                self.scene_features_name = self.head_session.get_inputs()[0].name
+                self.template_features_name = self.head_session.get_inputs()[1].name
+                self.two_stage = True
+                print(f"✅ Two-stage NN model loaded")
+            except Exception as e:
+                print(f"❌ Failed to load two-stage model, using {MODEL_FILENAME}: {e}")
+
+        # Тензоры шаблонов (и их варианты под мониторы) готовим сразу, а не на первом кадре
+        if os.path.isdir(self.templates_path):
+            templates = self.templates.get_all()
+            self.scale_bank.prebuild([(t.path, t, t.mtime) for t in templates])
+            print(f"🧩 Templates loaded: {len(templates)} | scaled variants: {len(self.scale_bank.variants)}")
+
+        if TILED and self.tile_grid is None and (self.session is not None or self.two_stage):
+            self.tile_grid = self.calibrate_tiles()
+
+    def _create_session(self, path):
+        # Вариант точности, кэш оптимизированного графа, потоки и память - utils.ort_session (настройки из config.yaml)
+        session = create_session(path, self.session_settings)
+        if session.model_variant != path:
+            print(f"⚡ {os.path.basename(path)} -> {os.path.basename(session.model_variant)}")
+        return session
+
+    def _run(self, session, feeds, run_options=None):
+        """
+        session.run для горячего цикла. С IO_BINDING - через привязанные буферы (BoundRunner):
+        выходы переиспользуются и валидны до следующего запуска с теми же входами.
+        """
+        if not IO_BINDING:
+            return session.run(None, feeds, run_options)
+        runner = self._runners.get(session)
+        if runner is None:
+            runner = self._runners.setdefault(session, BoundRunner(session))
+        return runner.run(feeds, run_options)
+
+    def _clear_bindings(self):
+        # Привязки держат ссылки на буферы сцен и тензоры шаблонов - старые отпускаем
+        for runner in self._runners.values():
+            runner.clear()
+
+    def _release_bindings(self, buf):
+        """Буфер препроцессинга пересоздан - отпускаем привязки к нему и к эмбеддингам, посчитанным из него."""
+        arrays = [buf]
+        while arrays:
+            arrays = [out for runner in list(self._runners.values()) for out in runner.drop(arrays)]
+
+    def _monitor_sizes(self):
+        """Размеры проверяемых мониторов (из MONITORS) с учётом текущего масштаба захвата SCALE_FACTOR."""
+        return [(int(mon['width'] * SCALE_FACTOR), int(mon['height'] * SCALE_FACTOR))
+                for i, mon in enumerate(self.physical_monitors) if i+1 in MONITORS or len(MONITORS) == 0]
+
+    @prof
+    def update_monitors(self):
+        """
+        Перечитывает список мониторов у источника кадров.
+        Если геометрия изменилась - сбрасываются выученные ROI, гейт и прошлые результаты, банк масштабов перестраивается.
+        """
+        self._monitors_checked = time.perf_counter()
+        return self.apply_monitors(self.frame_source.get_monitors(refresh=True))
+
+    def apply_monitors(self, monitors):
+        """Переходит на раскладку monitors = [виртуальный экран, мониторы...]. True - она отличалась от текущей."""
+        if not monitors or list(monitors) == [self.virtual_screen] + self.physical_monitors:
+            return False
+
+        self.virtual_screen = monitors[0]
+        self.physical_monitors = list(monitors[1:])
+        print(f"🖥️ Monitors changed: {self.physical_monitors}")
+        if self.rois is not None:
+            self.rois.bounds = self.virtual_screen
+            self.rois.learned.clear()
+        if self.gate: self.gate.reset()
+        self._last_results.clear()
+        self._clear_bindings()
+        self.scale_bank.set_monitors(self._monitor_sizes())
+        self.scale_bank.prebuild([(t.path, t, t.mtime) for t in self.templates.get_all()])
+        return True
+
+    def _build_scaled_template(self, template, scale):
+        if scale == 1.0: return template
+        with prof_registry("build_scaled"):
+            rgb = resize(template.rgb, scale)
+            t0 = time.perf_counter()
+            padded, tensor, features = self.prepare_template(rgb)
+            build_time = time.perf_counter() - t0
+        return TemplateEntry(template.name, f"{template.path}@{scale:.3f}", template.mtime, rgb, padded, tensor, features, build_time)
+
+    def templates_for_size(self, templates, monitor_size):
+        """Варианты шаблонов под монитор размера monitor_size = (ширина, высота) после масштаба захвата."""
+        return [self.scale_bank.get(t.path, t, monitor_size, t.mtime) for t in templates]
+
+    def templates_for_monitor(self, templates, mon_idx):
+        if mon_idx >= len(self.capture_sizes): return templates
+        return self.templates_for_size(templates, self.capture_sizes[mon_idx])
+
+    def _monitor_size_at(self, x, y):
+        """Размер (с учётом SCALE_FACTOR) физического монитора, в который попадает точка экрана (x, y)."""
+        for mon in self.physical_monitors:
+            if mon['left'] <= x < mon['left'] + mon['width'] and mon['top'] <= y < mon['top'] + mon['height']:
+                return int(mon['width'] * SCALE_FACTOR), int(mon['height'] * SCALE_FACTOR)
+        return None
+
     @prof
     def check(self, visualize=False):
-        if self.session is None: return False
+        if self.session is None and not self.two_stage: return False
+
+        self.static = False
+        self.scores.begin()
+        try:
+            # 0. Если известны области всех шаблонов - захватываем только их
+            if self.rois is not None:
+                templates = self._get_all_templates()
+                if self.rois.covers(templates) and not self.rois.need_rescan():
+                    return self.check_rois(templates, visualize)
+
+            # 1. ЗАХВАТ ВСЕГО И СРАЗУ (Самый быстрый способ)
+            monitor_images = self.capture_all_and_split(SCALE_FACTOR)
+            return self.check_images(monitor_images, visualize)
+        finally:
+            self.last_score = self.scores.end()
+
+    @prof
+    def check_rois(self, templates, visualize=False):
+        """Захват и инференс только по областям шаблонов (каждый шаблон ищется в своей области)."""
+        for template in templates:
+            left, top, width, height = self.rois.get(template.name)
+            monitor_size = self._monitor_size_at(left + width // 2, top + height // 2)
+            if monitor_size:
+                template = self.scale_bank.get(template.path, template, monitor_size, template.mtime)
+            with prof("capture_roi"):
+                roi = self.frame_source.grab({'left': left, 'top': top, 'width': width, 'height': height})
+                if roi is None: return False
+                roi_rgb = to_rgb(roi, SCALE_FACTOR)
+            if roi_rgb.size == 0: continue
+
+            scene_tensor = self.preprocessor(roi_rgb, key=('roi', template.name))
+            if self.find_pattern(roi_rgb, template, threshold=self.config.confidence_level, visualize=visualize,
+                                 mon_idx=self.last_found_monitor_idx, scene_tensor=scene_tensor):
+                return True
+        return False
+
+    @prof
+    def _learn_roi(self, mon_idx, template, screen_img):
+        """Находит рамку совпавшего шаблона на изображении монитора и добавляет её к области шаблона."""
+        if self.rois is None or mon_idx >= len(self.capture_origins): return
+        th, tw = template.rgb.shape[:2]
+        if th > screen_img.shape[0] or tw > screen_img.shape[1]: return
+        # Нейросеть даёт только оценку, координаты уточняем классическим matchTemplate (только при совпадении)
+        res = cv2.matchTemplate(screen_img, template.rgb, cv2.TM_CCOEFF_NORMED)
+        _, _, _, (x, y) = cv2.minMaxLoc(res)
+        origin_x, origin_y = self.capture_origins[mon_idx]
+        scale = self.capture_scale
+        self.rois.learn(template.name, origin_x + int(x / scale), origin_y + int(y / scale), int(tw / scale), int(th / scale))
+
+    @prof
+    def check_images(self, monitor_images, visualize=False):
+        """Поиск шаблонов на уже захваченных изображениях мониторов (результат capture_all_and_split)."""
+        if self.session is None and not self.two_stage: return False
+        self.static = False
 
-        # 1. ЗАХВАТ ВСЕГО И СРАЗУ (Самый быстрый способ)
-        monitor_images = self.capture_all_and_split(SCALE_FACTOR)
-        
         # 2. Определяем порядок проверки (начинаем с последнего успешного)
         indices = list(range(len(monitor_images)))
         if self.last_found_monitor_idx in indices:
@@ -84,6 +579,43 @@ class TemplateMatcher:
 
         templates = self._get_all_templates()
 
+        # Набор шаблонов поменялся - прошлые результаты мониторов больше не валидны
+        templates_key = tuple((t.path, t.mtime) for t in templates)
+        if templates_key != self._templates_key:
+            self._templates_key = templates_key
+            self._last_results.clear()
+            self._template_batches.clear()
+            self._clear_bindings()
+            self.scale_bank.prune(t.path for t in templates)
+            if self.gate: self.gate.reset()
+
+        # 2.5. Гейт изменений: неизменившиеся мониторы не гоняем через нейросеть
+        if self.gate:
+            changed = []
+            for mon_idx in indices:
+                if monitor_images[mon_idx].size == 0: continue
+                if self.gate.changed(mon_idx, monitor_images[mon_idx]):
+                    # Старый результат к новому кадру не относится, даже если проверка до монитора не дойдёт
+                    self._last_results.pop(mon_idx, None)
+                    changed.append(mon_idx)
+                elif mon_idx in self._last_results:
+                    # Кадр не изменился - оценка та же, что в прошлый раз
+                    self.scores.note(self.scores.previous(mon_idx), mon_idx)
+                    if self._last_results[mon_idx]:
+                        self.last_found_monitor_idx = mon_idx
+                        return True
+                else:
+                    changed.append(mon_idx)
+            indices = changed
+            self.static = not changed
+
+        # Двухстадийная модель и так не гоняет backbone сцены на каждый шаблон, батч ей не нужен
+        if BATCH_TEMPLATES and not self.two_stage:
+            return self._check_batched(monitor_images, indices, templates, visualize)
+
+        if self.executor and len(indices) > 1 and not PYRAMID_LEVELS and not TILED:
+            return self._check_monitors_parallel(monitor_images, indices, templates, visualize)
+
         # 3. Инференс
         for mon_idx in indices:
             screen_img = monitor_images[mon_idx]
@@ -91,92 +623,414 @@ class TemplateMatcher:
             # Если после обрезки полос ничего не осталось
             if screen_img.size == 0: continue
 
-            for tmpl_name, tmpl_img in templates:
+            # Шаблоны под разрешение этого монитора
+            mon_templates = self.templates_for_monitor(templates, mon_idx)
+
+            if PYRAMID_LEVELS or TILED:
+                if PYRAMID_LEVELS:
+                    found = self.find_pattern_pyramid(screen_img, mon_templates, visualize=visualize, mon_idx=mon_idx)
+                else:
+                    found = self.find_pattern_tiled(screen_img, mon_templates, visualize=visualize, mon_idx=mon_idx)
+                self._last_results[mon_idx] = found is not None
+                if found is not None:
+                    self.last_found_monitor_idx = mon_idx
+                    self._learn_roi(mon_idx, found, screen_img)
+                    return True
+                continue
+
+            # Сцена одна на все шаблоны - готовим тензор один раз в буфер монитора
+            with prof("preprocess_scene"):
+                scene_tensor = self.preprocessor(screen_img, key=mon_idx)
+            scene_features = None
+            if self.two_stage:
+                scene_features = self.encode_scene(scene_tensor)
+                if scene_features is None: continue
+
+            for template in mon_templates:
                 is_match = self.find_pattern(
-                    screen_img, tmpl_img, tmpl_name, 
+                    screen_img, template,
                     threshold=self.config.confidence_level, 
-                    visualize=visualize, mon_idx=mon_idx
+                    visualize=visualize, mon_idx=mon_idx, scene_tensor=scene_tensor,
+                    scene_features=scene_features
                 )
                 
                 if is_match:
                     self.last_found_monitor_idx = mon_idx
+                    self._last_results[mon_idx] = True
+                    self._learn_roi(mon_idx, template, screen_img)
                     return True
+
+            self._last_results[mon_idx] = False
                     
         return False
 
+    @prof
+    def find_pattern_pyramid(self, scene_rgb, templates, visualize=False, mon_idx=0):
+        """
+        Поиск от грубого к точному. Серая пирамида сцены строится один раз на монитор,
+        для каждого шаблона на верхнем уровне ищутся PYRAMID_TOP_K кандидатов,
+        и нейросеть проверяет только окна вокруг них на полном разрешении.
+        Возвращает совпавший TemplateEntry или None.
+        """
+        with prof("build_scene_pyramid"):
+            scene_pyramid = build_pyramid(cv2.cvtColor(scene_rgb, cv2.COLOR_RGB2GRAY), PYRAMID_LEVELS)
+
+        for template in templates:
+            template_pyramid = self._get_template_pyramid(template)
+            levels = effective_levels(template.rgb.shape, PYRAMID_LEVELS)
+            if levels == 0:
+                if self.find_pattern(scene_rgb, template, threshold=self.config.confidence_level,
+                                     visualize=visualize, mon_idx=mon_idx):
+                    return template
+                continue
+
+            with prof("coarse_candidates"):
+                candidates = coarse_candidates(scene_pyramid[levels], template_pyramid[levels], levels, PYRAMID_TOP_K)
+            th, tw = template.rgb.shape[:2]
+            # Окно как у ROI: нейросеть видит шаблон с контекстом вокруг
+            margin = max(2 ** (levels + 1), int(max(th, tw) * ROI_MARGIN))
+            for i, (_, x, y) in enumerate(candidates):
+                x0, y0, x1, y1 = candidate_window(x, y, template.rgb.shape, scene_rgb.shape, margin)
+                window = scene_rgb[y0:y1, x0:x1]
+                scene_tensor = self.preprocessor(window, key=('pyramid', i))
+                if self.find_pattern(window, template, threshold=self.config.confidence_level, visualize=visualize,
+                                     mon_idx=mon_idx, scene_tensor=scene_tensor):
+                    return template
+        return None
+
+    def get_tiles(self, img_shape, templates, grid=None):
+        """Тайлы (y0, y1, x0, x1) изображения размера img_shape под текущую сетку и размер шаблонов (с кэшем)."""
+        rows, cols = grid or self.tile_grid or (1, 1)
+        if TILE_OVERLAP is not None:
+            overlap_y = overlap_x = TILE_OVERLAP
+        else:
+            overlap_y = max((t.rgb.shape[0] for t in templates), default=0)
+            overlap_x = max((t.rgb.shape[1] for t in templates), default=0)
+        key = (img_shape[:2], rows, cols, overlap_y, overlap_x)
+        tiles = self._tiles.get(key)
+        if tiles is None:
+            tiles = self._tiles[key] = tile_grid(img_shape[0], img_shape[1], rows, cols, overlap_y, overlap_x)
+        return tiles
+
+    def _search_tile(self, tile, tile_key, templates, threshold, visualize=False, mon_idx=0, cancel=None, run_options=None,
+                     debug=None):
+        """
+        Все шаблоны против одного тайла: сцена готовится (и кодируется) один раз. Совпавший TemplateEntry или None.
+        cancel: threading.Event - поиск бросается между запусками нейросети, если другой поток уже нашёл шаблон.
+        debug: как в find_pattern - куда складывать окна отладки вместо показа.
+        """
+        if cancel is not None and cancel.is_set(): return None
+        scene_tensor = self.preprocessor(tile, key=tile_key)
+        scene_features = None
+        if self.two_stage:
+            scene_features = self.encode_scene(scene_tensor, run_options=run_options)
+            if scene_features is None: return None
+        for template in templates:
+            if cancel is not None and cancel.is_set(): return None
+            if self.find_pattern(tile, template, threshold=threshold, visualize=visualize, mon_idx=mon_idx,
+                                 scene_tensor=scene_tensor, scene_features=scene_features, run_options=run_options,
+                                 debug=debug):
+                return template
+        return None
+
+    def _search_parallel(self, jobs, visualize=False):
+        """
+        Параллельный поиск по нескольким изображениям (тайлам или мониторам) в пуле self.executor.
+        jobs: [(изображение, ключ буфера, шаблоны, mon_idx)] в порядке приоритета.
+
+        На первом совпадении остальные задачи отменяются: ещё не начатые снимаются с очереди, идущие session.run
+        прерываются через RunOptions.terminate. Метод дожидается остановки всех задач, поэтому буферы сцен
+        не переиспользуются, пока их читает другой поток. Окна отладки (visualize) задачи не показывают сами -
+        их показывает вызывающий поток по мере завершения задач.
+        Возвращает ((индекс задачи, TemplateEntry) или (None, None), [индексы задач, проверенных без совпадения]).
+        """
+        cancel = threading.Event()
+        run_options = ort.RunOptions()
+        threshold = self.config.confidence_level
+        views = [[] for _ in jobs]  # окна отладки каждой задачи
+        futures = {self.executor.submit(self._search_tile, img, key, templates, threshold, visualize, mon_idx, cancel,
+                                        run_options, views[i]): i
+                   for i, (img, key, templates, mon_idx) in enumerate(jobs)}
+
+        hit, missed = (None, None), []
+        for future in as_completed(futures):
+            if future.cancelled(): continue
+            i = futures[future]
+            found = future.result()
+            for view in views[i]:
+                self._show_debug(*view)
+            if found is not None and hit[1] is None:
+                hit = (i, found)
+                cancel.set()
+                run_options.terminate = True
+                for f in futures: f.cancel()
+                prof.count("cancelled", sum(f.cancelled() for f in futures))
+            elif found is None and not cancel.is_set():
+                missed.append(i)
+        return hit, missed
+
+    @prof
+    def _check_monitors_parallel(self, monitor_images, indices, templates, visualize=False):
+        """Мониторы проверяются одновременно в пуле; первый найденный шаблон отменяет остальные проверки."""
+        indices = [i for i in indices if monitor_images[i].size]
+        jobs = [(monitor_images[i], i, self.templates_for_monitor(templates, i), i) for i in indices]
+        (j, found), missed = self._search_parallel(jobs, visualize)
+        for k in missed:
+            self._last_results[indices[k]] = False
+        if found is None: return False
+
+        mon_idx = indices[j]
+        self.last_found_monitor_idx = mon_idx
+        self._last_results[mon_idx] = True
+        self._learn_roi(mon_idx, found, monitor_images[mon_idx])
+        return True
+
+    @prof
+    def find_pattern_tiled(self, scene_rgb, templates, visualize=False, mon_idx=0):
+        """
+        Поиск по сетке тайлов с перекрытием. Первым проверяется тайл последнего совпадения на этом мониторе,
+        поиск прерывается на первом совпадении. Возвращает совпавший TemplateEntry или None.
+        С пулом (inference_workers > 1) тайлы проверяются параллельно.
+        """
+        tiles = self.get_tiles(scene_rgb.shape, templates)
+        order = list(range(len(tiles)))
+        last = self._last_tile.get(mon_idx)
+        if last is not None and last < len(tiles):
+            order.remove(last)
+            order.insert(0, last)
+
+        if self.executor:
+            jobs = [(scene_rgb[y0:y1, x0:x1], ('tile', mon_idx, i), templates, mon_idx)
+                    for i in order for y0, y1, x0, x1 in (tiles[i],)]
+            (j, found), _ = self._search_parallel(jobs, visualize)
+            if found is not None:
+                self._last_tile[mon_idx] = order[j]
+            return found
+
+        for i in order:
+            y0, y1, x0, x1 = tiles[i]
+            found = self._search_tile(scene_rgb[y0:y1, x0:x1], ('tile', mon_idx, i), templates,
+                                      self.config.confidence_level, visualize=visualize, mon_idx=mon_idx)
+            if found is not None:
+                self._last_tile[mon_idx] = i
+                return found
+        return None
+
+    def calibrate_tiles(self, grids=TILE_CALIBRATION_GRIDS, iterations=2):
+        """
+        Подбирает сетку тайлов на реальном кадре первого монитора: для каждой сетки меряется полный проход
+        по всем тайлам (шаблона нет) и проход до первого тайла (шаблон в первом тайле).
+        Выбирается лучший баланс, как в test_tiling.py: 0.6 * FPS полного прохода + 0.4 * FPS лучшего случая.
+        """
+        images = [img for img in self.capture_all_and_split(SCALE_FACTOR) if img.size]
+        templates = self._get_all_templates()
+        if not images or not templates:
+            return (1, 1)
+        templates = self.templates_for_monitor(templates, 0)
+        img = images[0]
+
+        print(f"⏱️ Tile calibration on {img.shape[1]}x{img.shape[0]}...")
+        best, best_score = (1, 1), -1.0
+        for grid in grids:
+            tiles = self.get_tiles(img.shape, templates, grid)
+            if any(y1 - y0 < t.rgb.shape[0] or x1 - x0 < t.rgb.shape[1] for y0, y1, x0, x1 in tiles for t in templates):
+                continue  # Шаблон не влезает в тайл
+            # Порог выше любой оценки - совпадений нет, проходятся все тайлы и шаблоны
+            search = lambda rect: self._search_tile(img[rect[0]:rect[1], rect[2]:rect[3]], 'calibration', templates, 2.0)
+            search(tiles[0])  # прогрев буферов под размер тайла
+            t0 = time.perf_counter()
+            for _ in range(iterations):
+                for rect in tiles: search(rect)
+            t_all = (time.perf_counter() - t0) / iterations
+            t0 = time.perf_counter()
+            for _ in range(iterations): search(tiles[0])
+            t_first = (time.perf_counter() - t0) / iterations
+
+            score = 0.6 / t_all + 0.4 / t_first
+            print(f"   {grid[0]}x{grid[1]}: all tiles {t_all * 1000:.1f} ms | first tile {t_first * 1000:.1f} ms")
+            if score > best_score:
+                best, best_score = grid, score
+        self.preprocessor.release('calibration')
+        print(f"✅ Tile grid: {best[0]}x{best[1]}")
+        return best
+
+    def _get_template_pyramid(self, template):
+        cached = self._template_pyramids.get(template.path)
+        if cached is None or cached[0] != template.mtime or len(cached[1]) != PYRAMID_LEVELS + 1:
+            cached = (template.mtime, build_pyramid(cv2.cvtColor(template.rgb, cv2.COLOR_RGB2GRAY), PYRAMID_LEVELS))
+            self._template_pyramids[template.path] = cached
+        return cached[1]
+
+    def _check_batched(self, monitor_images, indices, templates, visualize=False):
+        if not templates: return False
+        threshold = self.config.confidence_level
+
+        # Мониторы с одинаковым размером тензора сцены (и одинаковым масштабом шаблонов) стекаются в один батч
+        # без искажений. Порядок групп сохраняет приоритет последнего успешного монитора.
+        groups = {}
+        for mon_idx in indices:
+            screen_img = monitor_images[mon_idx]
+            if screen_img.size == 0: continue
+            monitor_size = self.capture_sizes[mon_idx] if mon_idx < len(self.capture_sizes) else None
+            groups.setdefault((self.preprocessor.padded_shape(*screen_img.shape[:2]), monitor_size), []).append(mon_idx)
+
+        all_templates = templates
+        for ((h, w), monitor_size), mons in groups.items():
+            templates = self.templates_for_size(all_templates, monitor_size) if monitor_size else all_templates
+            scores = self.find_pattern_batch([monitor_images[i] for i in mons], self._get_template_groups(templates, len(mons)))
+            if scores is None: continue
+
+            for row, mon_idx in enumerate(mons):
+                best = int(np.argmax(scores[row]))
+                if not np.isfinite(scores[row, best]):  # все шаблоны больше сцены - как find_pattern, без оценки
+                    self._last_results[mon_idx] = False
+                    continue
+                self.scores.note(float(scores[row, best]), mon_idx)
+                is_match = bool(scores[row, best] > threshold)
+                self._last_results[mon_idx] = is_match
+                if visualize:
+                    self._show_debug(self.pad_to_stride(monitor_images[mon_idx]), templates[best].padded,
+                                     float(scores[row, best]), is_match, f"M{mon_idx+1}:{templates[best].name}")
+                if is_match:
+                    self.last_found_monitor_idx = mon_idx
+                    self._learn_roi(mon_idx, templates[best], monitor_images[mon_idx])
+                    return True
+        return False
+
+    def _get_template_groups(self, templates, repeats=1):
+        """
+        Шаблоны, сгруппированные по размеру тензора: [(индексы в templates, (repeats * k, 3, h, w))].
+        Внутри группы шаблоны идут подряд и повторяются repeats раз - по разу на каждую сцену батча.
+        До общего размера шаблоны не дополняются: паддинг меняет оценку, а так она та же, что у find_pattern.
+        Пересобирается только при изменении набора шаблонов (свой набор на каждый масштаб из банка).
+        """
+        key = (tuple((t.path, t.mtime) for t in templates), repeats)
+        groups = self._template_batches.get(key)
+        if groups is None:
+            with prof("build_template_batch"):
+                by_shape = {}
+                for i, t in enumerate(templates):
+                    by_shape.setdefault(t.tensor.shape[2:], []).append(i)
+                groups = [(indices, np.concatenate([templates[i].tensor for i in indices] * repeats))
+                          for indices in by_shape.values()]
+            self._template_batches[key] = groups
+        return groups
+
     @prof
     def capture_all_and_split(self, scale_factor=1):
         """
-        Делает 1 скриншот всей системы, ресайзит его и режет на мониторы.
-        scale_factor: 1.0 = 100%, 0.5 = 50% и т.д.
+        Делает 1 скриншот мониторов из MONITORS, режет его на мониторы и только их конвертирует в RGB.
+        scale_factor: 1.0 = 100%, 0.5 = 50% и т.д. Раз в MONITOR_REFRESH_INTERVAL перечитывает мониторы.
         """
-        # 1. Захват всего пространства (Monitor 0)
-        full_sct = self.sct.grab(self.virtual_screen)
-        full_img = np.array(full_sct)
-        full_rgb = cv2.cvtColor(full_img, cv2.COLOR_BGRA2RGB)
-
-        # 2. РЕЗАЙЗ ВСЕГО ХОЛСТА (если масштаб не 1.0)
-        if scale_factor != 1.0:
-            h_full, w_full = full_rgb.shape[:2]
-            new_w = int(w_full * scale_factor)
-            new_h = int(h_full * scale_factor)
-            # INTER_LINEAR — оптимальный баланс скорости и качества для уменьшения
-            full_rgb = cv2.resize(full_rgb, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        if time.perf_counter() - self._monitors_checked > MONITOR_REFRESH_INTERVAL:
+            self.update_monitors()
+        return self.use_frame(self.capture_frame(scale_factor))
+
+    def use_frame(self, frame):
+        """
+        Делает CapturedFrame текущим кадром матчера: раскладка мониторов, capture_origins/sizes для ROI и банка масштабов.
+        Возвращает изображения мониторов для check_images. Вызывается в том потоке, где идёт проверка.
+        """
+        self.apply_monitors(frame.monitors)
+        self.capture_origins, self.capture_sizes, self.capture_scale = list(frame.origins), list(frame.sizes), frame.scale
+        return list(frame.images)
+
+    def check_frame(self, frame, visualize=False):
+        """check_images по CapturedFrame (кадр из другого потока, см. PipelinedDetector)."""
+        return self.check_images(self.use_frame(frame), visualize)
+
+    def capture_frame(self, scale_factor=1, monitors=None):
+        """
+        Захват и нарезка без изменения состояния матчера - результат CapturedFrame. Можно звать из потока захвата,
+        пока другой поток проверяет кадры.
+        monitors: раскладка [виртуальный экран, мониторы...] от frame_source.get_monitors; None - текущая у матчера.
+
+        Захватывается только прямоугольник, охватывающий нужные мониторы (а не весь виртуальный экран).
+        MssSource отдаёт буфер mss без копирования (bgra_view); cvtColor/resize идут уже по срезам мониторов,
+        поэтому каждый пиксель копируется один раз, а отфильтрованные мониторы не трогаются вовсе.
+        Источник кадров потокобезопасен (у MssSource свой экземпляр mss на поток).
+        """
+        if not monitors:
+            monitors = [self.virtual_screen] + self.physical_monitors
+        selected = [mon for i, mon in enumerate(monitors[1:]) if i+1 in MONITORS or len(MONITORS) == 0]
+        if not selected:
+            return CapturedFrame((), (), (), scale_factor, monitors)
+
+        # 1. Захват прямоугольника, охватывающего выбранные мониторы
+        base_x = min(mon['left'] for mon in selected)
+        base_y = min(mon['top'] for mon in selected)
+        region = {
+            'left': base_x, 'top': base_y,
+            'width': max(mon['left'] + mon['width'] for mon in selected) - base_x,
+            'height': max(mon['top'] + mon['height'] for mon in selected) - base_y,
+        }
+        with prof("grab"):
+            full_frame = self.frame_source.grab(region)
+        if full_frame is None:
+            return CapturedFrame((), (), (), scale_factor, monitors)
 
         monitor_images = []
-        
-        # Координаты начала общего холста
-        base_x = self.virtual_screen['left']
-        base_y = self.virtual_screen['top']
-
-        # 3. Нарезка по масштабированным координатам
-        for i, mon in enumerate(self.physical_monitors):
-            if i+1 in MONITORS or len(MONITORS) == 0:
-                # Вычисляем локальные координаты и применяем масштаб
-                rel_x = int((mon['left'] - base_x) * scale_factor)
-                rel_y = int((mon['top'] - base_y) * scale_factor)
-                w = int(mon['width'] * scale_factor)
-                h = int(mon['height'] * scale_factor)
-
-                # Numpy Slice по масштабированной сетке
-                mon_img = full_rgb[rel_y:rel_y+h, rel_x:rel_x+w]
-                
-                # 4. Обрезка черных полос
-                clean_img = self.crop_black_borders(mon_img)
-                monitor_images.append(clean_img)
+        origins = []
+        sizes = []
+
+        # 2. Нарезка по координатам полного разрешения (срезы - без копирования)
+        for mon in selected:
+            rel_x = mon['left'] - base_x
+            rel_y = mon['top'] - base_y
+            mon_frame = full_frame[rel_y:rel_y+mon['height'], rel_x:rel_x+mon['width']]
+
+            # 3. Конвертация и масштаб - только пикселей монитора
+            with prof("convert"):
+                mon_img = to_rgb(mon_frame, scale_factor)
+
+            # 4. Обрезка черных полос
+            clean_img, (off_x, off_y) = self.crop_black_borders(mon_img, return_offset=True)
+            monitor_images.append(clean_img)
+            # Где левый верхний угол обрезанного изображения на реальном экране (для ROI)
+            origins.append((mon['left'] + int(off_x / scale_factor), mon['top'] + int(off_y / scale_factor)))
+            sizes.append((int(mon['width'] * scale_factor), int(mon['height'] * scale_factor)))
 
-        return monitor_images
+        return CapturedFrame(monitor_images, origins, sizes, scale_factor, monitors)
 
-    def crop_black_borders(self, img):
-        if img.size == 0: return img
+    def crop_black_borders(self, img, return_offset=False):
+        """return_offset=True - вернуть ещё и (x, y) смещение обрезанной картинки внутри исходной."""
+        img, offset = self._crop_black_borders(img)
+        return (img, offset) if return_offset else img
+
+    def _crop_black_borders(self, img):
+        if img.size == 0: return img, (0, 0)
         # Быстрый чек углов
-        if np.any(img[0,0] > 0) and np.any(img[-1,-1] > 0): return img
+        if np.any(img[0,0] > 0) and np.any(img[-1,-1] > 0): return img, (0, 0)
         
         rows = np.any(img, axis=(1, 2))
         cols = np.any(img, axis=(0, 2))
         
-        if not np.any(rows) or not np.any(cols): return img
+        if not np.any(rows) or not np.any(cols): return img, (0, 0)
         
         ymin, ymax = np.where(rows)[0][[0, -1]]
         xmin, xmax = np.where(cols)[0][[0, -1]]
-        return img[ymin:ymax+1, xmin:xmax+1]
+        return img[ymin:ymax+1, xmin:xmax+1], (int(xmin), int(ymin))
 
     @prof
     def _get_all_templates(self):
-        valid = []
-        for f in os.listdir(self.templates_path):
-            if os.path.splitext(f)[1].lower() in self.template_extensions:
-                img = self._get_template_data(os.path.join(self.templates_path, f))
-                if img is not None: valid.append((f, img))
-        return valid
-
-    def _get_template_data(self, path):
-        if path in self.template_cache: return self.template_cache[path]
-        img = cv2.imread(path)
-        if img is None: return None
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        self.template_cache[path] = img
-        return img
+        return self.templates.get_all()
+
+    def prepare_template(self, template_rgb):
+        tensor = self.preprocessor(template_rgb)
+        features = None
+        if self.two_stage:
+            features = self.template_session.run(None, {self.template_session.get_inputs()[0].name: tensor})[0]
+        return self.pad_to_stride(template_rgb), tensor, features
+
+    @prof
+    def encode_scene(self, scene_tensor, run_options=None):
+        """Эмбеддинг сцены для двухстадийной модели (один раз на монитор за кадр)."""
+        try:
+            return self._run(self.scene_session, {self.scene_session.get_inputs()[0].name: scene_tensor}, run_options)[0]
+        except Exception as e:
+            # Прерванный через RunOptions.terminate запуск - не ошибка
+            if run_options is None or not run_options.terminate: print(f"Err: {e}")
+            return None
 
     def pad_to_stride(self, img, stride=32):
         h, w = img.shape[:2]
@@ -187,36 +1041,98 @@ class TemplateMatcher:
         return img
 
     def preprocess(self, img):
+        # Эталонная (медленная) реализация. В цикле используется self.preprocessor - результат совпадает бит-в-бит.
         img = img.astype(np.float32) / 255.0
         img = (img - np.array([0.485, 0.456, 0.406], dtype=np.float32)) / np.array([0.229, 0.224, 0.225], dtype=np.float32)
         return np.expand_dims(img.transpose(2, 0, 1), axis=0)
 
     @prof
-    def find_pattern(self, scene_rgb, template_rgb, template_name, threshold=0.9, visualize=False, mon_idx=0):
-        scene_padded = self.pad_to_stride(scene_rgb)
-        template_padded = self.pad_to_stride(template_rgb)
+    def find_pattern(self, scene_rgb, template, threshold=0.9, visualize=False, mon_idx=0, scene_tensor=None,
+                     scene_features=None, run_options=None, debug=None):
+        """
+        template: TemplateEntry из реестра (тензор шаблона уже готов).
+        scene_tensor: готовый тензор сцены (если None - будет посчитан в буфер монитора mon_idx).
+        scene_features: готовый эмбеддинг сцены для двухстадийной модели (если None - будет посчитан).
+        run_options: ort.RunOptions для прерывания запуска из другого потока (параллельный поиск).
+        debug: список - с visualize окно отладки не показывается, а аргументы _show_debug дописываются туда
+               (окна OpenCV можно трогать только из вызывающего потока, не из пула).
+        """
+        if scene_tensor is None:
+            scene_tensor = self.preprocessor(scene_rgb, key=mon_idx)
+        template_tensor = template.tensor
         
-        if template_padded.shape[0] > scene_padded.shape[0] or template_padded.shape[1] > scene_padded.shape[1]:
+        if template_tensor.shape[2] > scene_tensor.shape[2] or template_tensor.shape[3] > scene_tensor.shape[3]:
              return False
 
-        scene_tensor = self.preprocess(scene_padded)
-        template_tensor = self.preprocess(template_padded)
-
         try:
-            res = self.session.run([self.output_name], {
-                self.input_name_scene: scene_tensor,
-                self.input_name_template: template_tensor
-            })
-            score = float(res[0])
+            if self.two_stage and template.features is not None:
+                if scene_features is None:
+                    scene_features = self.encode_scene(scene_tensor, run_options=run_options)
+                    if scene_features is None: return False
+                res = self._run(self.head_session, {
+                    self.scene_features_name: scene_features,
+                    self.template_features_name: template.features
+                }, run_options)
+            else:
+                res = self._run(self.session, {
+                    self.input_name_scene: scene_tensor,
+                    self.input_name_template: template_tensor
+                }, run_options)
+            score = float(res[0].reshape(-1)[0])
             is_match = score > threshold
+            self.scores.note(score, mon_idx)
 
             if visualize:
-                self._show_debug(scene_padded, template_padded, score, is_match, f"M{mon_idx+1}:{template_name}")
+                view = (self.pad_to_stride(scene_rgb), template.padded, score, is_match, f"M{mon_idx+1}:{template.name}")
+                if debug is not None: debug.append(view)
+                else: self._show_debug(*view)
             return is_match
         except Exception as e:
-            print(f"Err: {e}")
+            if run_options is None or not run_options.terminate: print(f"Err: {e}")
             return False
 
+    @prof
+    def find_pattern_batch(self, scenes_rgb, template_groups):
+        """
+        Оценивает все шаблоны против всех сцен: один session.run на группу шаблонов одного размера.
+        scenes_rgb: список RGB сцен с одинаковым размером после паддинга.
+        template_groups: _get_template_groups(шаблоны, len(scenes_rgb)).
+        Возвращает оценки (len(scenes_rgb), число шаблонов) или None при ошибке. Шаблон больше сцены не оценивается (-inf).
+
+        Модель берёт пары (сцена, шаблон) с одинаковым батчем, поэтому сцена копируется на каждую пару.
+        Чтобы буфер сцен не рос с числом шаблонов и мониторов, за один запуск идёт не больше BATCH_MAX_BYTES сцен.
+        """
+        m = len(scenes_rgb)
+        n = sum(len(indices) for indices, _ in template_groups)
+        h, w = self.preprocessor.padded_shape(*scenes_rgb[0].shape[:2])
+        chunk = max(1, min(BATCH_MAX_BYTES // (3 * h * w * 4), m * max(len(indices) for indices, _ in template_groups)))
+        scene_batch = self.preprocessor.get_buffer('batch', h, w, batch=chunk)
+        scores = np.full((m, n), -np.inf, dtype=np.float32)
+
+        try:
+            for indices, templates_tensor in template_groups:
+                k = len(indices)
+                if templates_tensor.shape[2] > h or templates_tensor.shape[3] > w: continue
+                # Пара p - сцена p // k и шаблон p % k группы
+                for start in range(0, m * k, chunk):
+                    stop = min(start + chunk, m * k)
+                    batch = scene_batch[:stop - start]
+                    for p in range(start, stop):
+                        if p == start or p % k == 0:
+                            self.preprocessor.fill(scenes_rgb[p // k], batch[p - start])
+                        else:
+                            batch[p - start] = batch[p - start - 1]
+                    res = self.session.run([self.output_name], {
+                        self.input_name_scene: batch,
+                        self.input_name_template: templates_tensor[start:stop]
+                    })[0].reshape(-1)
+                    for p, score in zip(range(start, stop), res):
+                        scores[p // k, indices[p % k]] = score
+            return scores
+        except Exception as e:
+            print(f"Err: {e}")
+            return None
+
     def _show_debug(self, scene, tmpl, score, match, name):
         dbg = cv2.cvtColor(scene, cv2.COLOR_RGB2BGR)
         color = (0, 255, 0) if match else (0, 0, 255)
@@ -242,6 +1158,174 @@ class TemplateMatcher:
         cv2.imshow("Neural Network View", dbg)
         cv2.waitKey(1)
 
+class LatestFrameSlot:
+    """
+    Очередь размером 1 по принципу "последний кадр побеждает".
+    Новый кадр затирает ещё не обработанный, поэтому инференс всегда работает по самому свежему изображению.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+                prof_pipeline.count("dropped")
+            self._frame = frame
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Забирает кадр (или None, если за timeout ничего не пришло)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame is not None, timeout)
+            frame, self._frame = self._frame, None
+            return frame
+
+
+class PipelinedDetector:
+    """
+    Конвейер поверх TemplateMatcher: поток захвата кладёт кадры в LatestFrameSlot, поток инференса их разбирает.
+    FPS определяется самой медленной стадией, а не суммой захвата и инференса.
+    Кадр - неизменяемый CapturedFrame: поток захвата только читает, а состояние матчера (мониторы, ROI, банк
+    масштабов) меняет поток инференса, когда берёт кадр (TemplateMatcher.check_frame).
+
+    check(timeout) - ждёт результат следующего обработанного кадра и возвращает его (как TemplateMatcher.check).
+    on_match(mon_idx) - колбэк из потока инференса при нахождении шаблона.
+    scale_factor - масштаб захвата; None - SCALE_FACTOR на момент создания (его же читает матчер для ROI и банка масштабов).
+    max_capture_fps - ограничение частоты захвата (None - без ограничения), чтобы не жечь CPU на кадры,
+                      которые всё равно будут выброшены.
+
+    В профайлер (секция [pipeline]) пишутся время стадий capture/inference и число выброшенных кадров dropped.
+    Если источник кадров - запись, конвейер останавливается сам, когда кадры кончились.
+    """
+    def __init__(self, matcher, on_match=None, visualize=False, scale_factor=None, max_capture_fps=None):
+        self.matcher = matcher
+        self.on_match = on_match
+        self.visualize = visualize
+        self.scale_factor = SCALE_FACTOR if scale_factor is None else scale_factor
+        self.capture_interval = 1.0 / max_capture_fps if max_capture_fps else 0.0
+
+        self.slot = LatestFrameSlot()
+        self._stop_event = threading.Event()
+        self._capture_done = threading.Event()  # запись (ImageDirSource/VideoFileSource) кончилась
+        self._threads = []
+
+        self._result_cond = threading.Condition()
+        self._result = False
+        self.last_score = None  # лучшая оценка последнего обработанного кадра
+        self._result_seq = 0
+        self._seen_seq = 0
+
+        self.captured = 0
+        self.inferred = 0
+        self._stats_start = (time.perf_counter(), 0, 0, 0)
+
+    def start(self):
+        if self._threads: return self
+        self._stop_event.clear()
+        self._capture_done.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="respawn-capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name="respawn-inference", daemon=True),
+        ]
+        for t in self._threads: t.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        with self._result_cond:
+            self._result_cond.notify_all()
+        for t in self._threads: t.join(timeout)
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _capture_loop(self):
+        source = self.matcher.frame_source
+        # Мониторы поток захвата перечитывает сам и кладёт раскладку в кадр: применяет её поток инференса (use_frame),
+        # состояние матчера меняется только там
+        monitors = [self.matcher.virtual_screen] + self.matcher.physical_monitors
+        monitors_checked = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                t0 = time.perf_counter()
+                # Запись кончилась - останавливаемся (у живых источников next() всегда True)
+                if not source.next(): break
+                try:
+                    if t0 - monitors_checked > MONITOR_REFRESH_INTERVAL:
+                        monitors, monitors_checked = source.get_monitors(refresh=True) or monitors, t0
+                    with prof_pipeline("capture"):
+                        frame = self.matcher.capture_frame(self.scale_factor, monitors)
+                except Exception as e:
+                    print(f"Capture err: {e}")
+                    time.sleep(0.1)
+                    continue
+                self.captured += 1
+                self.slot.put(frame)
+                if self.capture_interval:
+                    self._stop_event.wait(self.capture_interval - (time.perf_counter() - t0))
+        finally:
+            self._capture_done.set()
+            # mss держит дескрипторы привязанными к потоку - закрываем экземпляр этого потока
+            if source.live: source.close()
+
+    def _inference_loop(self):
+        while not self._stop_event.is_set():
+            frame = self.slot.get(timeout=0.1)
+            if frame is None:
+                if self._capture_done.is_set(): break
+                continue
+            self.matcher.scores.begin()
+            try:
+                with prof_pipeline("inference"):
+                    found = self.matcher.check_frame(frame, visualize=self.visualize)
+            except Exception as e:
+                print(f"Inference err: {e}")
+                found = False
+            self.inferred += 1
+
+            with self._result_cond:
+                self._result = found
+                self.last_score = self.matcher.scores.end()
+                self._result_seq += 1
+                self._result_cond.notify_all()
+            if found and self.on_match:
+                self.on_match(self.matcher.last_found_monitor_idx)
+
+        # Кадры кончились - будим ждущих в check()
+        self._stop_event.set()
+        with self._result_cond:
+            self._result_cond.notify_all()
+
+    def check(self, timeout=None):
+        """Результат следующего обработанного кадра. Если за timeout ничего не обработано - последний известный."""
+        if not self._threads: self.start()
+        with self._result_cond:
+            self._result_cond.wait_for(lambda: self._result_seq != self._seen_seq or self._stop_event.is_set(), timeout)
+            self._seen_seq = self._result_seq
+            return self._result
+
+    def throughput(self, reset=True):
+        """FPS стадий и число выброшенных кадров с прошлого вызова (или со старта)."""
+        now = time.perf_counter()
+        t0, captured0, inferred0, dropped0 = self._stats_start
+        dt = max(now - t0, 1e-9)
+        stats = {
+            'capture_fps': (self.captured - captured0) / dt,
+            'inference_fps': (self.inferred - inferred0) / dt,
+            'dropped': self.slot.dropped - dropped0,
+        }
+        if reset:
+            self._stats_start = (now, self.captured, self.inferred, self.slot.dropped)
+        return stats
+
+
 if __name__ == "__main__":
     import pyautogui
     pyautogui.PAUSE = 0
@@ -266,17 +1350,31 @@ if __name__ == "__main__":
     counter = 0
     start_time = time.time()
 
+    detector = PipelinedDetector(tm, visualize=True).start() if PIPELINED else tm
+    # Кадры -> события начала/конца возрождения (N из M кадров, отдельные пороги входа и выхода)
+    events = RespawnDetector(detector, my_config, check=detector.check if PIPELINED else lambda: tm.check(visualize=True))
+    # Пауза между проверками: целевой FPS, бюджет CPU, активное окно, статичный экран (см. utils.poll_scheduler)
+    scheduler = PollScheduler.from_config(my_config)
+
     try:
         while True:
             counter += 1
-            if tm.check(visualize=True):
-                print('!!! Found !!!')
+            with scheduler.frame():
+                event = events.poll()
+            if event is not None:
+                print('!!! Respawn started !!!' if event.kind == EVENT_STARTED else f'Respawn ended ({event.duration:.1f}s)')
+            scheduler.pause(hit=events.last_found, static=tm.static, present=events.present,
+                            present_interval=events.poll_interval)
             
             if counter % 100 == 0:
                 dt = time.time() - start_time
                 if dt > 0: print(f"FPS: {10/dt:.2f}")
+                if PIPELINED:
+                    stats = detector.throughput()
+                    print(f"Capture FPS: {stats['capture_fps']:.2f} | Inference FPS: {stats['inference_fps']:.2f} | Dropped: {stats['dropped']}")
                 utils.profiler.report()
                 utils.profiler.clear_stats()
                 start_time = time.time()
     except KeyboardInterrupt:
+        if PIPELINED: detector.stop()
         cv2.destroyAllWindows()
\ No newline at end of file
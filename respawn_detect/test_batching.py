@@ -0,0 +1,123 @@
+"""
+Батч шаблонов (BATCH_TEMPLATES): оценки find_pattern_batch против find_pattern по одной паре.
+
+Шаблоны группируются по размеру и не дополняются до общего размера, поэтому оценки совпадают с оценками по одной
+паре с точностью до округления: onnxruntime считает батч другими ядрами, разница - единицы ulp (до TOLERANCE).
+Для сравнения считается и старый вариант - все шаблоны, дополненные чёрным до общего размера, одним батчем
+(паддинг сдвигает оценки на сотые). Печатается размер буфера сцен на один session.run: сцена копируется
+на каждую пару (сцена, шаблон), в старом варианте буфер был мониторы * шаблоны сцен.
+
+Запуск (из корня проекта - шаблоны берутся из ./templates):
+    python respawn_detect/test_batching.py
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import cv2
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.abspath(os.path.join(SCRIPT_DIR, '..')))
+import utils.config as config
+from utils.frame_source import ImageDirSource
+import respawn_detect_ai as ai
+
+ITERATIONS = 5
+TOLERANCE = 1e-6  # Допустимая разница батча и запуска по одной паре (порог уверенности задан с точностью 0.01)
+MONITOR_SHAPE = (1080, 1920, 3)
+MONITORS = 2
+TEMPLATE_PATH = os.path.join("templates", "tf2_5.png")
+
+
+def make_templates(matcher, rgb):
+    """Варианты шаблона разных размеров, два - одного размера (одна группа батча)."""
+    h, w = rgb.shape[:2]
+    variants = {
+        "full": rgb,
+        "small": cv2.resize(rgb, (int(w * 0.8), int(h * 0.8)), interpolation=cv2.INTER_AREA),
+        "left": rgb[:, :w // 2],
+        "right": rgb[:, w - w // 2:],
+    }
+    entries = []
+    for name, img in variants.items():
+        img = np.ascontiguousarray(img)
+        padded, tensor, _ = matcher.prepare_template(img)
+        entries.append(ai.TemplateEntry(name, name, 0, img, padded, tensor, None, 0.0))
+    return entries
+
+
+def padded_batch_scores(matcher, scenes, templates):
+    """Старый батч: все шаблоны дополнены чёрным до общего размера."""
+    h = max(t.tensor.shape[2] for t in templates)
+    w = max(t.tensor.shape[3] for t in templates)
+    batch = np.empty((len(templates), 3, h, w), dtype=np.float32)
+    batch[:] = matcher.preprocessor.pad_value[None, :, None, None]
+    for i, t in enumerate(templates):
+        batch[i, :, :t.tensor.shape[2], :t.tensor.shape[3]] = t.tensor[0]
+    rows = []
+    for scene in scenes:
+        scene_tensor = matcher.preprocessor(scene)
+        rows.append(matcher.session.run([matcher.output_name], {
+            matcher.input_name_scene: np.repeat(scene_tensor, len(templates), axis=0),
+            matcher.input_name_template: batch,
+        })[0].reshape(-1))
+    return np.array(rows)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    template_img = cv2.imread(TEMPLATE_PATH, cv2.IMREAD_COLOR)
+    if template_img is None:
+        raise FileNotFoundError(f"Нет шаблона {TEMPLATE_PATH}")
+    template_rgb = cv2.cvtColor(template_img, cv2.COLOR_BGR2RGB)
+
+    # Сцены: размытый шум, на первой - шаблон
+    scenes = []
+    for i in range(MONITORS):
+        small = rng.integers(0, 256, (MONITOR_SHAPE[0] // 40, MONITOR_SHAPE[1] // 40, 3), dtype=np.uint8)
+        scene = cv2.resize(small, MONITOR_SHAPE[1::-1], interpolation=cv2.INTER_CUBIC)
+        if i == 0:
+            th, tw = template_rgb.shape[:2]
+            scene[400:400 + th, 700:700 + tw] = template_rgb
+        scenes.append(scene)
+
+    with tempfile.TemporaryDirectory() as frames:
+        cv2.imwrite(os.path.join(frames, "000.png"), cv2.cvtColor(scenes[0], cv2.COLOR_RGB2BGR))
+        matcher = ai.TemplateMatcher(config.Config(), frame_source=ImageDirSource(frames))
+    if matcher.session is None:
+        raise RuntimeError("Нет одностадийной модели matcher.onnx")
+    templates = make_templates(matcher, template_rgb)
+
+    # По одной паре, как в find_pattern (он отдаёт только совпадение - оценку берём прямым запуском той же пары)
+    single = np.empty((len(scenes), len(templates)), dtype=np.float32)
+    for i, s in enumerate(scenes):
+        scene_tensor = matcher.preprocessor(s)
+        for j, t in enumerate(templates):
+            single[i, j] = matcher.session.run([matcher.output_name], {
+                matcher.input_name_scene: scene_tensor, matcher.input_name_template: t.tensor})[0].reshape(-1)[0]
+
+    groups = matcher._get_template_groups(templates, len(scenes))
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        batched = matcher.find_pattern_batch(scenes, groups)
+    t_batch = (time.perf_counter() - start) / ITERATIONS
+    padded = padded_batch_scores(matcher, scenes, templates)
+
+    h, w = matcher.preprocessor.padded_shape(*MONITOR_SHAPE[:2])
+    scene_mb = 3 * h * w * 4 / 2 ** 20
+    buffer_mb = matcher.preprocessor.buffers['batch'].nbytes / 2 ** 20
+
+    print(f"Мониторов {MONITORS} x {MONITOR_SHAPE[1]}x{MONITOR_SHAPE[0]}, шаблонов {len(templates)} "
+          f"(групп по размеру: {len(groups)})")
+    print(f"{'Шаблон':<8} | {'по одному':<10} | {'батч':<10} | {'батч с паддингом':<16}")
+    for j, t in enumerate(templates):
+        print(f"{t.name:<8} | {single[0, j]:<10.6f} | {batched[0, j]:<10.6f} | {padded[0, j]:<16.6f}")
+
+    diff = np.abs(batched - single).max()
+    print("\n" + "=" * 60)
+    print(f"find_pattern_batch: {t_batch * 1000:.1f} мс на кадр")
+    print(f"Буфер сцен: {buffer_mb:.0f} МБ (старый батч: {scene_mb * MONITORS * len(templates):.0f} МБ)")
+    print(f"Сдвиг оценок от паддинга (старый батч): до {np.abs(padded - single).max():.4f}")
+    print(f"Батч = по одному: разница до {diff:.1e} {'✅' if diff <= TOLERANCE else '❌'}")
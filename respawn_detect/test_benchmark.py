@@ -63,6 +63,44 @@ def benchmark_mss_capture_split_crop():
     print(f"Средний FPS: {fps:.2f}")
     return fps
 
+def benchmark_mss_zero_copy_split_crop():
+    print(f"\n--- MSS Zero-copy: Capture -> np.frombuffer -> Split -> Convert RGB -> Crop ---")
+    sct = mss.mss()
+    physical_monitors = sct.monitors[1:]
+
+    # Захватываем только прямоугольник вокруг нужных мониторов
+    base_x = min(mon['left'] for mon in physical_monitors)
+    base_y = min(mon['top'] for mon in physical_monitors)
+    region = {
+        'left': base_x, 'top': base_y,
+        'width': max(mon['left'] + mon['width'] for mon in physical_monitors) - base_x,
+        'height': max(mon['top'] + mon['height'] for mon in physical_monitors) - base_y,
+    }
+
+    start = time.time()
+
+    for _ in range(ITERATIONS):
+        # 1. Grab + обёртка буфера без копирования
+        full_sct = sct.grab(region)
+        full_bgra = np.frombuffer(full_sct.raw, dtype=np.uint8).reshape(full_sct.height, full_sct.width, 4)
+
+        # 2. Split -> Convert (конвертируются только пиксели мониторов) -> Crop
+        processed_images = []
+        for mon in physical_monitors:
+            rel_x = mon['left'] - base_x
+            rel_y = mon['top'] - base_y
+            w = mon['width']
+            h = mon['height']
+
+            mon_rgb = cv2.cvtColor(full_bgra[rel_y:rel_y+h, rel_x:rel_x+w], cv2.COLOR_BGRA2RGB)
+            clean_img = crop_black_borders(mon_rgb)
+            processed_images.append(clean_img)
+
+    dt = time.time() - start
+    fps = ITERATIONS / dt
+    print(f"Средний FPS: {fps:.2f}")
+    return fps
+
 def benchmark_pyautogui_capture_split_crop():
     print(f"\n--- PyAutoGUI: Screenshot All -> Split -> Crop ---")
     
@@ -107,12 +145,14 @@ if __name__ == "__main__":
     print(f"Итераций: {ITERATIONS}")
     
     fps_mss = benchmark_mss_capture_split_crop()
+    fps_zero_copy = benchmark_mss_zero_copy_split_crop()
     fps_py = benchmark_pyautogui_capture_split_crop()
     
     print("\n" + "="*40)
     print("       РЕАЛЬНЫЙ ПОТОЛОК (Capture+Proc)")
     print("="*40)
     print(f"MSS Full Pipeline:       {fps_mss:.2f} FPS")
+    print(f"MSS Zero-copy Pipeline:  {fps_zero_copy:.2f} FPS")
     print(f"PyAutoGUI Full Pipeline: {fps_py:.2f} FPS")
     print("="*40)
     
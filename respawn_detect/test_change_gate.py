@@ -0,0 +1,73 @@
+import os
+import time
+import numpy as np
+import cv2
+
+from respawn_detect_ai import ChangeGate
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(SCRIPT_DIR, "..", "templates", "tf2_5.png")
+SCENE_SHAPE = (1080, 1920, 3)
+ITERATIONS = 200
+
+def static_scene(rng):
+    """Статичная 'игровая' сцена: размытый шум с крупными пятнами, без резких границ по всему кадру."""
+    small = rng.integers(0, 256, (SCENE_SHAPE[0] // 40, SCENE_SHAPE[1] // 40, 3), dtype=np.uint8)
+    scene = cv2.resize(small, SCENE_SHAPE[1::-1], interpolation=cv2.INTER_CUBIC)
+    return cv2.GaussianBlur(scene, (0, 0), 3)
+
+def load_template():
+    img = cv2.imread(TEMPLATE_PATH, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise FileNotFoundError(f"Нет шаблона {TEMPLATE_PATH}")
+    rgb = cv2.cvtColor(img[:, :, :3], cv2.COLOR_BGR2RGB).astype(np.float32)
+    alpha = img[:, :, 3:].astype(np.float32) / 255.0 if img.shape[2] == 4 else np.ones(img.shape[:2] + (1,), np.float32)
+    return rgb, alpha
+
+def paste(scene, template, y, x):
+    """Шаблон поверх сцены с учётом альфы (как он появляется в игре)."""
+    rgb, alpha = template
+    h, w = rgb.shape[:2]
+    out = scene.copy()
+    roi = out[y:y + h, x:x + w].astype(np.float32)
+    out[y:y + h, x:x + w] = (rgb * alpha + roi * (1 - alpha)).astype(np.uint8)
+    return out
+
+def fires(gate, before, after):
+    """Гейт видит before как точку отсчёта - пропустит ли он after?"""
+    gate.reset()
+    gate.changed(0, before)
+    return gate.changed(0, after)
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    scene = static_scene(rng)
+    template = load_template()
+    th, tw = template[0].shape[:2]
+    h, w = SCENE_SHAPE[:2]
+    gate = ChangeGate()
+
+    print("Проверка гейта...")
+    checks = []
+    checks.append(("тот же кадр - пропуск", not fires(gate, scene, scene.copy())))
+    noise = np.clip(scene.astype(np.int16) + rng.integers(-3, 4, scene.shape), 0, 255).astype(np.uint8)
+    checks.append(("шум ±3 - пропуск", not fires(gate, scene, noise)))
+    for name, (y, x) in (("центр", (h // 2, w // 2 - tw // 2)), ("левый нижний угол", (h - th - 20, 20)),
+                         ("правый верхний угол", (10, w - tw - 10)), ("не по сетке", (h // 3 + 7, w // 3 + 11))):
+        pasted = paste(scene, template, y, x)
+        diff = np.abs(gate.thumbnail(pasted) - gate.thumbnail(scene))
+        checks.append((f"шаблон, {name} - проверка (среднее {diff.mean():.2f}, максимум {diff.max()})",
+                       fires(gate, scene, pasted)))
+    for name, ok in checks:
+        print(f"{name}: {'✅' if ok else '❌'}")
+
+    gate.reset()
+    gate.changed(0, scene)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        gate.changed(0, scene)
+    dt = (time.perf_counter() - start) / ITERATIONS
+
+    print("\n" + "=" * 60)
+    print(f"ChangeGate.changed {SCENE_SHAPE}: {dt * 1000:.2f} мс")
+    print(f"Гейт: {'✅' if all(ok for _, ok in checks) else '❌'}")
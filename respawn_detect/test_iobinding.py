@@ -0,0 +1,136 @@
+"""
+Бенчмарк установившегося инференса: обычный session.run против IOBinding с постоянными буферами (BoundRunner).
+
+Для каждого режима меряется время на кадр и сколько выходных массивов (и КБ) создаётся на кадр:
+session.run выделяет выходы заново на каждом запуске, BoundRunner пишет в одни и те же буферы.
+Препроцессинг в замер не входит - буфер сцены заполнен заранее, как после Preprocessor в цикле матчера.
+Проверяется, что оценки совпадают бит-в-бит. Если экспортирована двухстадийная модель - меряется и она
+(кодирование сцены + голова на каждый шаблон). Отдельно проверяется, что при смене размера сцены (другой кроп)
+привязки к старым буферам отпускаются, а не копятся.
+
+Запуск: python respawn_detect/test_iobinding.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.abspath(os.path.join(SCRIPT_DIR, '..')))
+from respawn_detect_ai import MODEL_FILENAME, SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME, Preprocessor
+from utils.ort_session import SessionSettings, BoundRunner, create_session
+
+ITERATIONS = 20
+CROP_CHANGES = 8  # Сколько раз меняется размер сцены в проверке пересоздания буфера
+SCENE_SHAPE = (1080, 1920, 3)  # монитор 1080p
+TEMPLATE_SHAPES = [(60, 280, 3), (48, 160, 3)]
+
+
+def load(name):
+    return create_session(os.path.join(SCRIPT_DIR, name), SessionSettings(precision='fp32', cache_optimized=False))
+
+
+def measure(name, fn):
+    """
+    fn() -> [выходные массивы]. Возвращает (мс на вызов, новых массивов на вызов, КБ новых массивов на вызов, оценки).
+    Новый массив - объект, которого не было среди выходов прошлого вызова (session.run создаёт выходы на каждом кадре,
+    BoundRunner отдаёт одни и те же буферы).
+    """
+    fn()  # прогрев (и создание привязок)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    dt = (time.perf_counter() - start) / ITERATIONS
+    prev, outputs = fn(), fn()
+    new = [o for o in outputs if not any(o is p for p in prev)]
+    kb = sum(o.nbytes for o in new) / 1024
+    scores = [float(o.reshape(-1)[0]) for o in outputs if o.size == 1]
+    print(f"{name:<26} | {dt * 1000:8.2f} мс | {len(new):3} новых массивов, {kb:8.1f} КБ на вызов")
+    return dt, len(new), kb, scores
+
+
+def single_stage(pre, scene, templates):
+    session = load(MODEL_FILENAME)
+    scene_name, template_name = session.get_inputs()[0].name, session.get_inputs()[1].name
+    output_name = session.get_outputs()[0].name
+    runner = BoundRunner(session)
+    scene_tensor = pre(scene, key=0)
+
+    def plain():
+        return [session.run([output_name], {scene_name: scene_tensor, template_name: t})[0] for t in templates]
+
+    def bound():
+        return [runner.run({scene_name: scene_tensor, template_name: t})[0] for t in templates]
+
+    print(f"\n--- {MODEL_FILENAME}: сцена {scene.shape[1]}x{scene.shape[0]}, шаблонов {len(templates)} ---")
+    return measure("session.run", plain), measure("IOBinding (BoundRunner)", bound), runner
+
+
+def two_stage(pre, scene, templates):
+    scene_session, template_session, head_session = [load(n) for n in (SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME)]
+    scene_input = scene_session.get_inputs()[0].name
+    features_name, template_features_name = head_session.get_inputs()[0].name, head_session.get_inputs()[1].name
+    template_features = [template_session.run(None, {template_session.get_inputs()[0].name: t})[0] for t in templates]
+    scene_runner, head_runner = BoundRunner(scene_session), BoundRunner(head_session)
+    scene_tensor = pre(scene, key=0)
+
+    def plain():
+        features = scene_session.run(None, {scene_input: scene_tensor})[0]
+        return [features] + [head_session.run(None, {features_name: features, template_features_name: f})[0]
+                             for f in template_features]
+
+    def bound():
+        features = scene_runner.run({scene_input: scene_tensor})[0]
+        return [features] + [head_runner.run({features_name: features, template_features_name: f})[0]
+                             for f in template_features]
+
+    print(f"\n--- Двухстадийная модель: сцена {scene.shape[1]}x{scene.shape[0]}, шаблонов {len(templates)} ---")
+    return measure("session.run", plain), measure("IOBinding (BoundRunner)", bound), head_runner
+
+
+def reallocation_check(scene, templates):
+    """
+    Сцена меняет размер CROP_CHANGES раз (как после crop_black_borders), Preprocessor каждый раз пересоздаёт буфер.
+    (привязок без drop, привязок с drop, МБ буферов сцен, которые держат привязки без drop)
+    """
+    session = load(MODEL_FILENAME)
+    scene_name, template_name = session.get_inputs()[0].name, session.get_inputs()[1].name
+    counts = []
+    for release in (False, True):
+        runner, pre = BoundRunner(session), Preprocessor()
+        if release: pre.on_release = lambda buf: runner.drop([buf])
+        for i in range(CROP_CHANGES):
+            scene_tensor = pre(scene[:scene.shape[0] - 32 * i], key=0)
+            for t in templates: runner.run({scene_name: scene_tensor, template_name: t})
+        counts.append(len(runner))
+    # Все буферы, кроме последнего, уже не нужны Preprocessor-у
+    held_mb = sum(np.prod(pre.padded_shape(scene.shape[0] - 32 * i, scene.shape[1])) * 3 * 4
+                  for i in range(CROP_CHANGES - 1)) / 2 ** 20
+    print(f"\n--- Смена размера сцены {CROP_CHANGES} раз, шаблонов {len(templates)} ---")
+    print(f"Привязок: без drop {counts[0]}, с drop {counts[1]} (без drop держат {held_mb:.1f} МБ старых буферов сцен)")
+    return counts[0], counts[1], held_mb
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    scene = rng.integers(0, 256, SCENE_SHAPE, dtype=np.uint8)
+    pre = Preprocessor()
+    templates = [pre(rng.integers(0, 256, shape, dtype=np.uint8)) for shape in TEMPLATE_SHAPES]
+
+    print(f"Итераций: {ITERATIONS}")
+    runs = [("single-stage", *single_stage(pre, scene, templates))]
+    if all(os.path.exists(os.path.join(SCRIPT_DIR, n)) for n in (SCENE_MODEL_FILENAME, TEMPLATE_MODEL_FILENAME, HEAD_MODEL_FILENAME)):
+        runs.append(("two-stage", *two_stage(pre, scene, templates)))
+
+    print("\n" + "=" * 84)
+    print(f"{'Модель':<13} | {'run, мс':<8} | {'IOB, мс':<8} | {'Ускорение':<9} | {'КБ/кадр run → IOB':<19} | {'Привязок':<8} | Оценки")
+    print("-" * 84)
+    for name, (t_plain, n_plain, kb_plain, r_plain), (t_bound, n_bound, kb_bound, r_bound), runner in runs:
+        same = np.array_equal(np.array(r_plain), np.array(r_bound))
+        print(f"{name:<13} | {t_plain * 1000:<8.2f} | {t_bound * 1000:<8.2f} | x{t_plain / t_bound:<8.2f} | "
+              f"{kb_plain:>8.1f} → {kb_bound:<8.1f} | {runner.bindings_created:<8} | {'✅' if same else '❌'}")
+    print("=" * 84)
+
+    _, kept, _ = reallocation_check(scene[:SCENE_SHAPE[0] // 2, :SCENE_SHAPE[1] // 2], templates)
+    print(f"Старые буферы сцен отпускаются: {'✅' if kept == len(templates) else '❌'}")
@@ -0,0 +1,69 @@
+import sys
+import os
+import time
+import numpy as np
+import pyautogui
+from PIL import Image
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.config as config
+from respawn_detect import TemplateMatcher
+
+ITERATIONS = 20
+
+def make_haystack(matcher):
+    """Реальный скриншот + первый шаблон, вклеенный в центр (чтобы оба движка что-то находили)."""
+    screen = np.array(matcher.get_screen_img())
+    if matcher.templates:
+        template = Image.open(matcher.templates[0][0]).convert('RGB')
+        t = np.array(template)
+        y = (screen.shape[0] - t.shape[0]) // 2
+        x = (screen.shape[1] - t.shape[1]) // 2
+        screen[y:y+t.shape[0], x:x+t.shape[1]] = t
+    return Image.fromarray(screen)
+
+def run_pyautogui(matcher, haystack):
+    for template_path, _, _ in matcher.templates:
+        if matcher.find_pattern(haystack, template_path, matcher.config.confidence_level):
+            return True
+    return False
+
+def run_opencv(matcher, haystack):
+    # Конвертация скриншота входит в замер, как и в check()
+    prepared = matcher.prepare_image(haystack)
+    for _, template_img, mask in matcher.templates:
+        if matcher.find_pattern_cv(prepared, template_img, matcher.config.confidence_level, mask=mask):
+            return True
+    return False
+
+def benchmark(name, fn, matcher, haystack):
+    print(f"\n--- {name} ---")
+    found = fn(matcher, haystack)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(matcher, haystack)
+    dt = (time.perf_counter() - start) / ITERATIONS
+    print(f"Найдено: {found} | Среднее время: {dt * 1000:.1f} мс | FPS: {1 / dt:.2f}")
+    return found, dt
+
+if __name__ == "__main__":
+    pyautogui.PAUSE = 0
+    my_config = config.Config()
+
+    results = []
+    for use_gray in (False, True):
+        cv_matcher = TemplateMatcher(my_config, use_gray=use_gray, engine='opencv')
+        py_matcher = TemplateMatcher(my_config, use_gray=use_gray, engine='pyautogui')
+        haystack = make_haystack(cv_matcher)
+        print(f"\nСкриншот: {haystack.size} | Шаблонов: {len(cv_matcher.templates)} | use_gray={use_gray}")
+
+        found_py, t_py = benchmark("pyautogui.locate", run_pyautogui, py_matcher, haystack)
+        found_cv, t_cv = benchmark("OpenCV matchTemplate", run_opencv, cv_matcher, haystack)
+        results.append((use_gray, found_py, t_py, found_cv, t_cv))
+
+    print("\n" + "="*70)
+    print(f"{'use_gray':<9} | {'pyautogui, мс':<14} | {'OpenCV, мс':<11} | {'Ускорение':<9} | Совпадают")
+    print("-"*70)
+    for use_gray, found_py, t_py, found_cv, t_cv in results:
+        print(f"{str(use_gray):<9} | {t_py*1000:<14.1f} | {t_cv*1000:<11.1f} | x{t_py/t_cv:<8.2f} | {'✅' if found_py == found_cv else '❌'}")
+    print("="*70)
@@ -0,0 +1,71 @@
+import time
+import numpy as np
+import cv2
+
+from respawn_detect_ai import Preprocessor
+
+ITERATIONS = 200
+SCENE_SHAPE = (1440, 2560, 3)  # 2K монитор
+TEMPLATE_SHAPE = (60, 280, 3)
+
+# === Копируем текущий препроцессинг 1-в-1 из основного скрипта ===
+def pad_to_stride(img, stride=32):
+    h, w = img.shape[:2]
+    pad_h = (stride - h % stride) % stride
+    pad_w = (stride - w % stride) % stride
+    if pad_h > 0 or pad_w > 0:
+        return cv2.copyMakeBorder(img, 0, pad_h, 0, pad_w, cv2.BORDER_CONSTANT, value=[0, 0, 0])
+    return img
+
+def preprocess(img):
+    img = img.astype(np.float32) / 255.0
+    img = (img - np.array([0.485, 0.456, 0.406], dtype=np.float32)) / np.array([0.229, 0.224, 0.225], dtype=np.float32)
+    return np.expand_dims(img.transpose(2, 0, 1), axis=0)
+
+def check_bit_exact(pre, img):
+    ref = preprocess(pad_to_stride(img))
+    out = pre(img, key='check')
+    same = ref.shape == out.shape and np.array_equal(ref.view(np.uint32), out.view(np.uint32))
+    print(f"Бит-в-бит {img.shape}: {'✅' if same else '❌'}")
+    return same
+
+def benchmark(name, fn, img):
+    print(f"\n--- {name} {img.shape} ---")
+    fn(img)  # прогрев
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(img)
+    dt = (time.perf_counter() - start) / ITERATIONS
+    print(f"Среднее время: {dt * 1000:.2f} мс")
+    return dt
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    scene = rng.integers(0, 256, SCENE_SHAPE, dtype=np.uint8)
+    # Размер после crop_black_borders обычно не кратен 32 - проверяем и паддинг
+    scene_odd = scene[3:-5, 7:-2]
+    template = rng.integers(0, 256, TEMPLATE_SHAPE, dtype=np.uint8)
+
+    pre = Preprocessor()
+
+    print("Проверка совместимости...")
+    ok = all(check_bit_exact(pre, img) for img in (scene, scene_odd, template))
+
+    # ORT всё равно приводит вход к C-contiguous, поэтому честно сравниваем с ascontiguousarray
+    old = lambda img: np.ascontiguousarray(preprocess(pad_to_stride(img)))
+    new = lambda img: pre(img, key=0)
+
+    print(f"\nИтераций: {ITERATIONS}")
+    results = []
+    for img in (scene_odd, template):
+        t_old = benchmark("pad_to_stride + preprocess", old, img)
+        t_new = benchmark("Preprocessor (LUT -> NCHW буфер)", new, img)
+        results.append((img.shape, t_old, t_new))
+
+    print("\n" + "="*60)
+    print(f"{'Размер':<18} | {'Старый, мс':<11} | {'Новый, мс':<11} | {'Ускорение':<9}")
+    print("-"*60)
+    for shape, t_old, t_new in results:
+        print(f"{str(shape):<18} | {t_old*1000:<11.2f} | {t_new*1000:<11.2f} | x{t_old/t_new:.2f}")
+    print("="*60)
+    print(f"Бит-в-бит: {'✅' if ok else '❌'}")
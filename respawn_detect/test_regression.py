@@ -0,0 +1,221 @@
+"""
+Регрессионный бенчмарк детекторов на размеченных записях геймплея.
+
+Каждая конфигурация детектора прогоняется по одному и тому же набору кадров через полный цикл check()
+(кадры подаются через utils.frame_source, без живого экрана). Считаются precision/recall,
+p50/p95/p99 времени на кадр и кадры/с. Результат - JSON; при заданном baseline скрипт падает
+(код возврата 1), если какая-то конфигурация стала хуже.
+
+Набор кадров:
+    <dataset>/respawn/*.png|jpg - на кадре есть экран возрождения
+    <dataset>/none/*.png|jpg    - нет
+Кадры обеих папок идут в порядке имён файлов (нумерация сквозная - сохраняется порядок записи).
+
+Запуск (из корня проекта - шаблоны берутся из ./templates):
+    python respawn_detect/test_regression.py <dataset> [--output results.json]
+    python respawn_detect/test_regression.py <dataset> --update-baseline   # сохранить текущий результат как эталон
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import traceback
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.abspath(os.path.join(SCRIPT_DIR, '..')))
+import utils.config as config
+from utils.frame_source import RecordedSource, ImageDirSource
+
+DEFAULT_BASELINE = os.path.join(SCRIPT_DIR, "regression_baseline.json")
+LABEL_DIRS = {"respawn": True, "none": False}
+
+# Допуски регрессии относительно baseline
+MAX_QUALITY_DROP = 0.02    # precision/recall могут упасть не больше чем на столько (абсолютно)
+MAX_LATENCY_GROWTH = 0.25  # p95 может вырасти не больше чем на 25%
+MAX_FPS_DROP = 0.20        # кадры/с могут упасть не больше чем на 20%
+
+
+class LabelledDirSource(ImageDirSource):
+    """Кадры из <dataset>/respawn и <dataset>/none с разметкой текущего кадра (label)."""
+    def __init__(self, dataset, extensions=('.png', '.jpg'), monitors=None):
+        RecordedSource.__init__(self, monitors)
+        frames = []
+        for sub, label in LABEL_DIRS.items():
+            folder = os.path.join(dataset, sub)
+            if not os.path.isdir(folder): continue
+            frames += [(f, os.path.join(folder, f), label) for f in os.listdir(folder)
+                       if os.path.splitext(f)[1].lower() in extensions]
+        frames.sort()
+        self.paths = [path for _, path, _ in frames]
+        self.labels = [label for _, _, label in frames]
+        self._pos = 0
+
+    @property
+    def label(self):
+        return self.labels[self._pos - 1] if self._pos else None
+
+
+@contextlib.contextmanager
+def patched(module, overrides):
+    """Временно подменяет константы модуля (SCALE_FACTOR, CHANGE_GATE, ...) на время прогона конфигурации."""
+    old = {name: getattr(module, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            setattr(module, name, value)
+
+
+# Набор кадров - не обязательно непрерывная запись, поэтому состояние между кадрами (гейт, ROI) выключено
+ONNX_DEFAULTS = {'MONITORS': [], 'CHANGE_GATE': False, 'ROI_CAPTURE': False, 'PIPELINED': False}
+
+
+def classic(engine):
+    def build(source, cfg):
+        import respawn_detect as rd
+        return rd, {}, rd.TemplateMatcher(cfg, engine=engine, frame_source=source).check
+    return build
+
+
+def onnx(scale_factor=1.0):
+    def build(source, cfg):
+        import respawn_detect_ai as ai
+        overrides = dict(ONNX_DEFAULTS, SCALE_FACTOR=scale_factor)
+        with patched(ai, overrides):
+            matcher = ai.TemplateMatcher(cfg, frame_source=source)
+        return ai, overrides, matcher.check
+    return build
+
+
+def onnx_tiled(grid=None):
+    """Тайловый режим матчера (TILED); grid=None - сетка подбирается калибровкой при создании матчера."""
+    def build(source, cfg):
+        import respawn_detect_ai as ai
+        overrides = dict(ONNX_DEFAULTS, TILED=True, TILE_GRID=grid)
+        with patched(ai, overrides):
+            matcher = ai.TemplateMatcher(cfg, frame_source=source)
+        return ai, overrides, matcher.check
+    return build
+
+
+CONFIGURATIONS = {
+    "classic_pyautogui": classic('pyautogui'),
+    "classic_opencv": classic('opencv'),
+    "onnx_x1.0": onnx(1.0),
+    "onnx_x0.75": onnx(0.75),
+    "onnx_x0.5": onnx(0.5),
+    "onnx_tiled_2x2": onnx_tiled((2, 2)),
+    "onnx_tiled_auto": onnx_tiled(),
+}
+
+
+def run_configuration(name, build, dataset, cfg):
+    source = LabelledDirSource(dataset)
+    try:
+        module, overrides, check = build(source, cfg)
+    except Exception as e:
+        # Например, нет модели или pyautogui без дисплея
+        return {"skipped": f"{type(e).__name__}: {e}"}
+
+    latencies, tp, fp, fn, tn = [], 0, 0, 0, 0
+    with patched(module, overrides):
+        # Прогрев (ленивые буферы, первые вызовы onnxruntime) - не в замере.
+        # Кадр 0 при этом только загружается, первый next() его не пропускает.
+        check()
+        start = time.perf_counter()
+        while source.next():
+            t0 = time.perf_counter()
+            found = bool(check())
+            latencies.append(time.perf_counter() - t0)
+            if source.label:
+                tp, fn = tp + found, fn + (not found)
+            else:
+                fp, tn = fp + found, tn + (not found)
+        total = time.perf_counter() - start
+    source.close()
+
+    if not latencies:
+        return {"skipped": "нет кадров"}
+    ms = np.array(latencies) * 1000
+    return {
+        "frames": len(latencies),
+        "precision": tp / (tp + fp) if tp + fp else 1.0,
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "fps": len(latencies) / total,
+    }
+
+
+def compare(results, baseline):
+    """Список регрессий [(конфигурация, метрика, было, стало)]."""
+    regressions = []
+    for name, base in baseline.get("configs", {}).items():
+        cur = results["configs"].get(name)
+        if cur is None or "skipped" in base: continue
+        if "skipped" in cur:
+            regressions.append((name, "skipped", None, cur["skipped"]))
+            continue
+        for metric in ("precision", "recall"):
+            if cur[metric] < base[metric] - MAX_QUALITY_DROP:
+                regressions.append((name, metric, base[metric], cur[metric]))
+        if cur["p95_ms"] > base["p95_ms"] * (1 + MAX_LATENCY_GROWTH):
+            regressions.append((name, "p95_ms", base["p95_ms"], cur["p95_ms"]))
+        if cur["fps"] < base["fps"] * (1 - MAX_FPS_DROP):
+            regressions.append((name, "fps", base["fps"], cur["fps"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Регрессионный бенчмарк детекторов возрождения")
+    parser.add_argument("dataset", help="папка с подпапками respawn/ и none/")
+    parser.add_argument("--configs", nargs="*", default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    parser.add_argument("--output", help="куда записать JSON с результатами (по умолчанию - только stdout)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="эталонный JSON для сравнения")
+    parser.add_argument("--update-baseline", action="store_true", help="записать результат как новый эталон")
+    args = parser.parse_args(argv)
+
+    cfg = config.Config()
+    results = {"dataset": os.path.abspath(args.dataset), "configs": {}}
+    for name in args.configs:
+        print(f"--- {name} ---", file=sys.stderr)
+        try:
+            results["configs"][name] = run_configuration(name, CONFIGURATIONS[name], args.dataset, cfg)
+        except Exception as e:
+            traceback.print_exc()
+            results["configs"][name] = {"skipped": f"{type(e).__name__}: {e}"}
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"✅ Baseline обновлён: {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"⚠️ Нет baseline ({args.baseline}) - сравнение пропущено, см. --update-baseline", file=sys.stderr)
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        regressions = compare(results, json.load(f))
+    for name, metric, old, new in regressions:
+        print(f"❌ {name}: {metric} {old} -> {new}", file=sys.stderr)
+    if not regressions:
+        print("✅ Регрессий нет", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Кэш ответов AnkiConnect: CachedAnkiConnect - тот же AnkiConnect, но редко меняющиеся данные берутся из памяти.
+
+Что кэшируется и как долго - CACHE_POLICIES (TTL и размер LRU на действие):
+- getMediaDirPath, шаблоны/стили/поля моделей почти не меняются - живут долго;
+- cardsInfo кэшируется по каждой карте отдельно: cardsInfo([a, b]) после cardsInfo([a]) запросит только b.
+
+Свежесть:
+- запись старше TTL - промах, запрашивается заново;
+- раз в VALIDATE_INTERVAL секунд в ближайший исходящий запрос (тот же multi) добавляются cardsModTime,
+  notesModTime и findModelsByName по закэшированным картам, заметкам и моделям; изменённые после загрузки записи
+  выбрасываются. Ответы, отданные из кэша в этом же запросе, ещё могут быть старыми - не дольше VALIDATE_INTERVAL;
+- действия, меняющие карты/заметки/модели (answerCards, updateNoteFields, updateModelTemplates, ...), выбрасывают
+  затронутые записи до отправки и ещё раз после ответа. Ответ на чтение, которое шло одновременно с записью
+  (например, из потока CardPrefetcher), не кэшируется: он мог быть собран до записи.
+
+Работает и для пакетов (AnkiConnect.batch / multi): попадания отвечаются локально, в Anki уходят только промахи.
+Если промахов нет и проверка не нужна - запроса нет вовсе. hits / misses - счётчики по действиям
+(они же в utils.profiler, модуль "anki_cache").
+"""
+
+import json
+import time
+import threading
+from collections import Counter, OrderedDict
+
+import utils.profiler
+from utils.anki_connect import AnkiConnect, ANKI_ADDRESS, POOL_SIZE, DEFAULT_TIMEOUT
+
+def hi():
+    print(f'hi from {__name__}')
+
+prof = utils.profiler.get_profiler("anki_cache")
+
+VALIDATE_INTERVAL = 30.0  # Как часто проверять mod-времена закэшированных карт, заметок и моделей, сек
+
+CARD, MODEL = 'card', 'model'
+
+
+class CachePolicy:
+    def __init__(self, ttl, max_entries, depends_on=None):
+        self.ttl = ttl                  # Сколько секунд запись считается свежей
+        self.max_entries = max_entries  # Размер LRU
+        self.depends_on = depends_on    # CARD / MODEL - чьё mod-время проверять; None - только TTL
+
+
+CACHE_POLICIES = {
+    'getMediaDirPath': CachePolicy(3600, 1),
+    'modelNames': CachePolicy(300, 1),
+    'modelTemplates': CachePolicy(3600, 64, MODEL),
+    'modelStyling': CachePolicy(3600, 64, MODEL),
+    'modelFieldNames': CachePolicy(3600, 64, MODEL),
+    'cardsInfo': CachePolicy(600, 1024, CARD),
+}
+
+
+def _ids(*names):
+    """Функция params -> ID из перечисленных параметров (список или одно значение)."""
+    def get(params):
+        ids = []
+        for name in names:
+            value = params.get(name)
+            if value is None: continue
+            ids.extend(value if isinstance(value, (list, tuple)) else [value])
+        return ids
+    return get
+
+
+# Действие -> ID затронутых карт
+CARD_WRITES = {
+    'answerCards': lambda params: [a.get('cardId') for a in params.get('answers', [])],
+    'suspend': _ids('cards'), 'unsuspend': _ids('cards'), 'forgetCards': _ids('cards'), 'relearnCards': _ids('cards'),
+    'setDueDate': _ids('cards'), 'setEaseFactors': _ids('cards'), 'changeDeck': _ids('cards'),
+    'setSpecificValueOfCard': _ids('card'),
+}
+# Действие -> ID затронутых заметок
+NOTE_WRITES = {
+    'updateNoteFields': lambda params: [params.get('note', {}).get('id')],
+    'updateNote': lambda params: [params.get('note', {}).get('id')],
+    'updateNoteModel': lambda params: [params.get('note', {}).get('id')],
+    'updateNoteTags': _ids('note'), 'addTags': _ids('notes'), 'removeTags': _ids('notes'), 'deleteNotes': _ids('notes'),
+}
+# Действие -> имена затронутых моделей
+MODEL_WRITES = {
+    'updateModelTemplates': lambda params: [params.get('model', {}).get('name')],
+    'updateModelStyling': lambda params: [params.get('model', {}).get('name')],
+    'modelFieldRename': _ids('modelName'), 'modelFieldAdd': _ids('modelName'), 'modelFieldRemove': _ids('modelName'),
+    'modelFieldReposition': _ids('modelName'),
+}
+
+
+class _Entry:
+    __slots__ = ('value', 'fetched_at', 'expires')
+
+    def __init__(self, value, ttl):
+        self.value = value
+        self.fetched_at = time.time()
+        self.expires = time.perf_counter() + ttl
+
+
+class CachedAnkiConnect(AnkiConnect):
+    def __init__(self, anki_address=ANKI_ADDRESS, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT, transport=None,
+                 policies=None, validate_interval=VALIDATE_INTERVAL):
+        super().__init__(anki_address, pool_size, timeout, transport)
+        self.policies = dict(CACHE_POLICIES, **(policies or {}))
+        self.validate_interval = validate_interval
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._entries = {action: OrderedDict() for action in self.policies}
+        self._validated = time.perf_counter()
+        self._write_epoch = 0       # растёт в начале и в конце каждой записи
+        self._writes_in_flight = 0
+
+    # --- Кэш ---
+
+    @staticmethod
+    def _key(action, params):
+        return json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+    def _get(self, action, key):
+        entries = self._entries[action]
+        entry = entries.get(key)
+        if entry is None or entry.expires < time.perf_counter():
+            if entry is not None: del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry
+
+    def _put(self, action, key, value):
+        policy, entries = self.policies[action], self._entries[action]
+        entries[key] = _Entry(value, policy.ttl)
+        entries.move_to_end(key)
+        while len(entries) > policy.max_entries:
+            entries.popitem(last=False)
+
+    def _count(self, action, hits=0, misses=0):
+        if hits:
+            self.hits[action] += hits
+            prof.count(f"hit:{action}", hits)
+        if misses:
+            self.misses[action] += misses
+            prof.count(f"miss:{action}", misses)
+
+    def clear(self):
+        with self._lock:
+            for entries in self._entries.values():
+                entries.clear()
+
+    def stats(self):
+        """{действие: (попадания, промахи)}."""
+        return {action: (self.hits[action], self.misses[action]) for action in set(self.hits) | set(self.misses)}
+
+    # --- Инвалидация ---
+
+    def _drop_cards(self, card_ids=None, note_ids=None):
+        entries = self._entries.get('cardsInfo', {})
+        card_ids, note_ids = set(card_ids or ()), set(note_ids or ())
+        for key in [k for k, e in entries.items() if e.value.get('cardId') in card_ids or e.value.get('note') in note_ids]:
+            del entries[key]
+
+    def _drop_models(self, names):
+        names = set(names)
+        for action, policy in self.policies.items():
+            if policy.depends_on != MODEL: continue
+            entries = self._entries[action]
+            for key in [k for k in entries if json.loads(k).get('modelName') in names]:
+                del entries[key]
+
+    def _invalidate(self, action, params):
+        if action in CARD_WRITES: self._drop_cards(card_ids=CARD_WRITES[action](params))
+        if action in NOTE_WRITES: self._drop_cards(note_ids=NOTE_WRITES[action](params))
+        if action in MODEL_WRITES: self._drop_models(MODEL_WRITES[action](params))
+
+    @staticmethod
+    def _is_write(action):
+        return action in CARD_WRITES or action in NOTE_WRITES or action in MODEL_WRITES
+
+    def _begin_writes(self, writes):
+        """Под self._lock: записи [(действие, params)] уходят в Anki - их записи выбрасываются заранее."""
+        for action, params in writes:
+            self._invalidate(action, params)
+        if writes:
+            self._writes_in_flight += 1
+            self._write_epoch += 1
+
+    def _end_writes(self, writes):
+        """Под self._lock: Anki ответил - выбрасываем ещё раз то, что чтения успели положить, пока запись шла."""
+        for action, params in writes:
+            self._invalidate(action, params)
+        if writes:
+            self._writes_in_flight -= 1
+            self._write_epoch += 1
+
+    def _read_epoch(self):
+        """Под self._lock: метка для чтения; None - идёт запись, ответ кэшировать нельзя."""
+        return None if self._writes_in_flight else self._write_epoch
+
+    def _validation_due(self):
+        return time.perf_counter() - self._validated >= self.validate_interval
+
+    def _validation_actions(self):
+        """Действия проверки mod-времён, если пора; иначе []."""
+        if not self._validation_due(): return []
+        self._validated = time.perf_counter()
+        cards = list(self._entries.get('cardsInfo', {}).values())
+        models = {json.loads(k).get('modelName') for action, policy in self.policies.items()
+                  if policy.depends_on == MODEL for k in self._entries[action]} - {None}
+        actions = []
+        if cards:
+            actions.append({"action": "cardsModTime", "version": 6,
+                            "params": {"cards": [e.value.get('cardId') for e in cards if e.value.get('cardId') is not None]}})
+            actions.append({"action": "notesModTime", "version": 6,
+                            "params": {"notes": sorted({e.value.get('note') for e in cards} - {None})}})
+        if models:
+            actions.append({"action": "findModelsByName", "version": 6, "params": {"modelNames": sorted(models)}})
+        if actions: prof.count("validate")
+        return actions
+
+    def _apply_validation(self, action, result):
+        if not isinstance(result, list): return
+        cards = {e.value.get('cardId'): e for e in self._entries.get('cardsInfo', {}).values()}
+        if action == 'cardsModTime':
+            # У карты mod из cardsInfo - сравниваем как есть
+            self._drop_cards(card_ids=[r['cardId'] for r in result
+                                       if r.get('cardId') in cards and r.get('mod') != cards[r['cardId']].value.get('mod')])
+        elif action == 'notesModTime':
+            # У заметки mod в ответе cardsInfo нет - изменённой считается заметка, правленная после загрузки карты
+            fetched = {}
+            for e in cards.values():
+                fetched[e.value.get('note')] = min(fetched.get(e.value.get('note'), e.fetched_at), e.fetched_at)
+            self._drop_cards(note_ids=[r['noteId'] for r in result
+                                       if r.get('noteId') in fetched and r.get('mod', 0) >= int(fetched[r['noteId']])])
+        elif action == 'findModelsByName':
+            fetched = {}
+            for action_name, policy in self.policies.items():
+                if policy.depends_on != MODEL: continue
+                for k, e in self._entries[action_name].items():
+                    name = json.loads(k).get('modelName')
+                    fetched[name] = min(fetched.get(name, e.fetched_at), e.fetched_at)
+            self._drop_models([m.get('name') for m in result
+                               if isinstance(m, dict) and m.get('name') in fetched and m.get('mod', 0) >= int(fetched[m['name']])])
+
+    # --- Запросы ---
+
+    def send_request(self, action, **params):
+        if action == 'multi':
+            return self._multi(params.get('actions', []))
+        if action not in self.policies:
+            with self._lock:
+                validate = self._validation_due()
+                writes = [(action, params)] if not validate and self._is_write(action) else []
+                self._begin_writes(writes)
+            if not validate:
+                try:
+                    return super().send_request(action, **params)
+                finally:
+                    with self._lock:
+                        self._end_writes(writes)
+        reply = self._multi([{"action": action, "version": 6, "params": params}])[0]
+        if reply['error']:
+            print(f"❌ Произошла ошибка: AnkiConnect error: {reply['error']}")
+            return None
+        return reply['result']
+
+    def _multi(self, actions):
+        """multi с кэшем: попадания отвечаются локально, остальное (и проверка mod-времён) - одним запросом."""
+        results = [None] * len(actions)
+        outgoing = []  # (индекс в actions или None для проверки, действие, params, ключ или [ID карт])
+        writes = []    # (действие, params) меняющих действий
+        with self._lock:
+            for i, item in enumerate(actions):
+                action, params = item.get('action'), item.get('params', {}) or {}
+                if action == 'cardsInfo' and 'cardsInfo' in self.policies:
+                    cards, missing = [], []
+                    for card_id in params.get('cards', []):
+                        entry = self._get('cardsInfo', card_id)
+                        cards.append(entry.value if entry else None)
+                        if entry is None: missing.append(card_id)
+                    self._count(action, hits=len(cards) - len(missing), misses=len(missing))
+                    results[i] = cards
+                    if missing: outgoing.append((i, action, {**params, 'cards': missing}, missing))
+                elif action in self.policies:
+                    key = self._key(action, params)
+                    entry = self._get(action, key)
+                    if entry is not None:
+                        self._count(action, hits=1)
+                        results[i] = {"result": entry.value, "error": None}
+                    else:
+                        self._count(action, misses=1)
+                        outgoing.append((i, action, params, key))
+                else:
+                    if self._is_write(action): writes.append((action, params))
+                    outgoing.append((i, action, params, None))
+            self._begin_writes(writes)
+            epoch = self._read_epoch()
+            validation = self._validation_actions()
+
+        replies = []
+        try:
+            if outgoing or validation:
+                request = [{"action": a, "version": 6, "params": p} for _, a, p, _ in outgoing] + validation
+                replies = super().send_request("multi", actions=request)
+                if not isinstance(replies, list) or len(replies) != len(request):
+                    replies = [{"result": None, "error": "multi request failed"}] * len(request)
+        finally:
+            with self._lock:
+                self._end_writes(writes)
+
+        with self._lock:
+            # Пока запрос шёл, была запись - ответы могли быть собраны до неё, в кэш их не кладём
+            cacheable = epoch is not None and epoch == self._write_epoch
+            for (i, action, params, key), reply in zip(outgoing, replies):
+                if action == 'cardsInfo' and isinstance(key, list):
+                    fetched = {c['cardId']: c for c in (reply.get('result') or [])
+                               if isinstance(c, dict) and c.get('cardId') is not None}
+                    for card_id, card in fetched.items():
+                        if cacheable: self._put('cardsInfo', card_id, card)
+                    # Ненайденная карта (AnkiConnect отдаёт для неё {}) не кэшируется, но остаётся {} на своём месте,
+                    # чтобы позиции совпадали с обычным cardsInfo
+                    cards = [c if c is not None else fetched.get(card_id, {})
+                             for c, card_id in zip(results[i], actions[i].get('params', {}).get('cards', []))]
+                    results[i] = {"result": cards, "error": reply.get('error')}
+                else:
+                    if key is not None and cacheable and not reply.get('error'):
+                        self._put(action, key, reply.get('result'))
+                    results[i] = reply
+            for item, reply in zip(validation, replies[len(outgoing):]):
+                if not reply.get('error'): self._apply_validation(item['action'], reply.get('result'))
+
+        for i, item in enumerate(actions):
+            if isinstance(results[i], list):  # cardsInfo целиком из кэша
+                results[i] = {"result": results[i], "error": None}
+            if 'version' not in item:  # без version AnkiConnect отвечает в multi голым результатом
+                results[i] = results[i]['result']
+        return results
@@ -1,15 +1,122 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 import json
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 def hi():
     print(f'hi from {__name__}')
 
+ANKI_ADDRESS = 'http://localhost:8765'
+POOL_SIZE = 4         # Сколько соединений держать открытыми (для запросов из нескольких потоков)
+DEFAULT_TIMEOUT = 10  # Таймаут запроса, сек
+# Действия, которые в Anki работают заметно дольше обычных (сек)
+ACTION_TIMEOUTS = {
+    'sync': 120,
+    'guiCheckDatabase': 120,
+    'exportPackage': 300,
+    'importPackage': 300,
+    'guiImportFile': 300,
+    'getCollectionStatsHTML': 30,
+}
+# Действия, которые ничего не меняют в коллекции: после разрыва соединения их можно отправить ещё раз
+READ_ONLY_ACTIONS = frozenset({
+    'version', 'getProfiles', 'getActiveProfile', 'apiReflect',
+    'deckNames', 'deckNamesAndIds', 'getDecks', 'deckNameFromId', 'getDeckConfig', 'getDeckStats',
+    'findCards', 'findNotes', 'cardsInfo', 'notesInfo', 'cardsModTime', 'notesModTime', 'cardsToNotes',
+    'areDue', 'areSuspended', 'suspended', 'getIntervals', 'getEaseFactors', 'getNoteTags', 'getTags',
+    'cardReviews', 'getReviewsOfCards', 'getLatestReviewID', 'getNumCardsReviewedToday', 'getNumCardsReviewedByDay',
+    'getCollectionStatsHTML', 'canAddNote', 'canAddNotes', 'canAddNoteWithErrorDetail', 'canAddNotesWithErrorDetail',
+    'modelNames', 'modelNamesAndIds', 'modelNameFromId', 'findModelsById', 'findModelsByName', 'modelFieldNames',
+    'modelFieldDescriptions', 'modelFieldFonts', 'modelFieldsOnTemplates', 'modelTemplates', 'modelStyling',
+    'getMediaDirPath', 'getMediaFilesNames', 'retrieveMediaFile',
+    'guiCurrentCard', 'guiSelectedNotes', 'guiReviewActive',
+})
+
+
+def is_read_only(payload):
+    """True - запрос только читает коллекцию (multi - если все его действия такие)."""
+    action = payload.get('action')
+    if action == 'multi':
+        return all(is_read_only(item) for item in (payload.get('params') or {}).get('actions', []))
+    return action in READ_ONLY_ACTIONS
+
+
+class AnkiTransport:
+    """
+    HTTP-транспорт к AnkiConnect с постоянными соединениями (keep-alive).
+
+    requests.post на каждый вызов открывал новое TCP-соединение к localhost:8765; здесь соединения живут в пуле
+    requests.Session и переиспользуются. TCP_NODELAY urllib3 ставит сам, так что задержки Nagle нет.
+    Если Anki закрыл простаивающее соединение или был перезапущен - сессия пересоздаётся и запрос повторяется один раз,
+    но только если повтор ничего не применит дважды: действие только читает (READ_ONLY_ACTIONS) или соединение
+    вообще не установилось (запрос до Anki не дошёл). Запрос на запись, оборванный после отправки, не повторяется -
+    Anki мог успеть его выполнить (answerCards, updateNoteFields...). Таймауты не повторяются.
+    Соединение, которое Anki закрыл, пока оно простаивало в пуле, urllib3 замечает до отправки и открывает новое.
+    """
+    def __init__(self, address=ANKI_ADDRESS, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT, action_timeouts=None):
+        self.address = address
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.action_timeouts = dict(ACTION_TIMEOUTS, **(action_timeouts or {}))
+        self.reconnects = 0
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                session.trust_env = False  # Anki локальный: не читаем прокси/netrc из окружения на каждом запросе
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def timeout_for(self, action):
+        return self.action_timeouts.get(action, self.timeout)
+
+    def post(self, payload):
+        """Отправляет payload, возвращает разобранный JSON-ответ. Исключения requests пробрасываются."""
+        timeout = self.timeout_for(payload.get('action'))
+        for attempt in range(2):
+            session = self._get_session()
+            try:
+                response = session.post(self.address, json=payload, timeout=timeout)
+                response.raise_for_status()
+                return response.json()
+            except requests.exceptions.ConnectTimeout:
+                self.close()
+                raise
+            except requests.exceptions.ConnectionError as e:
+                self.close()
+                if attempt or not (is_read_only(payload) or self._not_sent(e)): raise
+                self.reconnects += 1
+
+    @staticmethod
+    def _not_sent(error):
+        """True - соединение не установилось, запрос до Anki точно не дошёл."""
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
 class AnkiConnect():
     """
     Класс-обертка для взаимодействия с Anki через плагин AnkiConnect.
     """
-    def __init__(self, anki_address='http://localhost:8765'):
+    def __init__(self, anki_address=ANKI_ADDRESS, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT, transport=None):
         self.anki_address = anki_address
+        self.transport = transport or AnkiTransport(anki_address, pool_size, timeout)
 
     def version(self):
         """
@@ -66,6 +173,16 @@ class AnkiConnect():
         """
         return self.send_request("multi", actions=actions)
 
+    def batch(self):
+        """
+        Пакет независимых вызовов, которые уходят одним запросом multi (см. AnkiBatch).
+            with anki.batch() as batch:
+                media = batch.getMediaDirPath()
+                cards = batch.cardsInfo([card_id])
+            media.result, cards.result, cards.error
+        """
+        return AnkiBatch(self)
+
     def getNumCardsReviewedToday(self):
         """
         Возвращает количество карточек, пройденных сегодня.
@@ -855,7 +972,7 @@ class AnkiConnect():
 
     def send_request(self, action, **params):
         """
-        Внутренний метод для отправки HTTP POST запросов к AnkiConnect.
+        Внутренний метод для отправки HTTP POST запросов к AnkiConnect (через self.transport, с keep-alive).
         :param action: Название метода API (напр. "version").
         :param params: Параметры метода (kwargs).
         :return: Значение поля 'result' из JSON-ответа или None при ошибке.
@@ -867,9 +984,7 @@ class AnkiConnect():
         }
         
         try:
-            response = requests.post(self.anki_address, json=payload, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self.transport.post(payload)
             if data.get('error'):
                 raise Exception(f"AnkiConnect error: {data['error']}")
             return data['result']
@@ -877,7 +992,7 @@ class AnkiConnect():
             print("❌ Ошибка: Не удалось подключиться к Anki. Убедитесь, что Anki запущен с плагином AnkiConnect.")
             return None
         except requests.exceptions.Timeout:
-            print("❌ Ошибка: Таймаут запроса.")
+            print(f"❌ Ошибка: Таймаут запроса {action} ({self.transport.timeout_for(action)} с).")
             return None
         except json.JSONDecodeError:
             print("❌ Ошибка: Сервер вернул не-JSON ответ.")
@@ -913,6 +1028,116 @@ class AnkiConnect():
         return card_info
 
 
+class AnkiCall:
+    """Отложенный вызов из AnkiBatch: result и error заполняются, когда пакет отправлен (done=True)."""
+    __slots__ = ('action', 'params', 'result', 'error', 'done')
+
+    def __init__(self, action, params):
+        self.action = action
+        self.params = params
+        self.result = None
+        self.error = None
+        self.done = False
+
+    def __repr__(self):
+        return f"AnkiCall({self.action}, result={self.result!r}, error={self.error!r})"
+
+
+class AnkiBatch:
+    """
+    Собирает вызовы методов AnkiConnect и отправляет их одним запросом multi при выходе из with (или send()).
+    Методы пакета - те же, что у AnkiConnect, но возвращают AnkiCall вместо результата.
+    Подходят методы, которые возвращают send_request(...) как есть (почти все); вызовы должны быть независимы -
+    результат одного нельзя передать в другой в том же пакете. Действия выполняются в Anki по порядку.
+    Ошибка отдельного действия не мешает остальным: она попадает в AnkiCall.error.
+    """
+    def __init__(self, anki):
+        self.anki = anki
+        self.calls = []
+
+    def send_request(self, action, **params):
+        call = AnkiCall(action, params)
+        self.calls.append(call)
+        return call
+
+    def __getattr__(self, name):
+        method = getattr(AnkiConnect, name, None)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        return lambda *args, **kwargs: method(self, *args, **kwargs)
+
+    def send(self):
+        """Отправляет накопленные вызовы одним запросом multi."""
+        calls, self.calls = self.calls, []
+        if not calls: return
+        actions = [{"action": c.action, "version": 6, "params": c.params} for c in calls]
+        replies = self.anki.send_request("multi", actions=actions)
+        if not isinstance(replies, list) or len(replies) != len(calls):
+            replies = [{"result": None, "error": "multi request failed"}] * len(calls)
+        for call, reply in zip(calls, replies):
+            # С version в каждом действии AnkiConnect отвечает {"result", "error"}, без него - голым результатом
+            if isinstance(reply, dict) and set(reply) == {"result", "error"}:
+                call.result, call.error = reply["result"], reply["error"]
+            else:
+                call.result = reply
+            if call.error: print(f"❌ AnkiConnect error ({call.action}): {call.error}")
+            call.done = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None: self.send()
+
+
+class AsyncAnkiConnect:
+    """
+    Асинхронный AnkiConnect: те же методы, что у AnkiConnect, но это корутины.
+        anki = AsyncAnkiConnect()
+        version, decks = await asyncio.gather(anki.version(), anki.deckNames())
+
+    Запросы выполняются в пуле из max_workers потоков поверх синхронного AnkiConnect - транспорт (keep-alive пул),
+    таймауты и обработка ошибок общие. Одновременно в полёте до max_workers запросов.
+    run(fn, *args) - любой код с синхронным клиентом (например, пакет multi) как корутина.
+    submit(fn, *args) - то же для кода без asyncio (concurrent.futures.Future): на нём построен мост в Qt (overlay.py).
+    Метода batch() нет - пакет собирается внутри run().
+    """
+    def __init__(self, anki=None, max_workers=POOL_SIZE):
+        self.anki = anki or AnkiConnect(pool_size=max_workers)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="anki")
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.anki.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _async_method(name):
+    method = getattr(AnkiConnect, name)
+
+    @functools.wraps(method)
+    async def call(self, *args, **kwargs):
+        return await self.run(getattr(self.anki, name), *args, **kwargs)
+    return call
+
+
+# Все публичные методы AnkiConnect - корутинами AsyncAnkiConnect
+for _name, _method in list(vars(AnkiConnect).items()):
+    if callable(_method) and not _name.startswith('_') and _name != 'batch':
+        setattr(AsyncAnkiConnect, _name, _async_method(_name))
+
+
 if __name__ == "__main__":
     print(f"--- Запуск тестов модуля {__name__} ---")
     
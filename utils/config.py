@@ -9,13 +9,41 @@ class Config:
         self.config_path = config_path # Путь до файла конфига
         self.decks = ['ALL_DECKS'] # Если ['ALL_DECKS'] - то все возможные. Иначе список строк(названий колод) из которых нужно выбирать карточку
         self.confidence_level = 0.7 # Урочень уверенности в том, что шаблон найден, требуемый для подтверждения нахождения.
-        self.template_check_rate = 0 # Задержка в секундах между попытками найти шаблон
+        self.exit_confidence_level = 0.6 # Ниже этого уровня экран возрождения считается пропавшим (гистерезис, <= confidence_level)
+        self.template_check_rate = 0 # Минимальная пауза в секундах между попытками найти шаблон (основная настройка частоты - target_fps)
+        self.target_fps = 10.0 # Сколько раз в секунду проверять экран (не чаще)
+        self.cpu_budget = 0.25 # Доля всего процессора (0-1), которую детектор может занимать в среднем
+        self.game_window = '' # Часть заголовка окна или имени exe игры. Пока активно другое окно - проверки реже. '' - не проверять
+        self.background_fps = 1.0 # Частота проверок, пока игра не в фокусе
+        self.template_rois = {} # Области поиска шаблонов: {имя файла шаблона: [left, top, width, height]} в пикселях виртуального экрана
+        self.template_base_resolution = [] # [ширина, высота] экрана, на котором сняты шаблоны без суффикса "@ШxВ". [] - не масштабировать
+        self.inference_threads = 2 # Потоков onnxruntime на один запуск нейросети (intra_op_num_threads)
+        self.inference_inter_op_threads = 1 # Потоков onnxruntime для независимых веток графа (inter_op_num_threads). 1 - по очереди
+        self.inference_workers = 1 # Сколько тайлов/мониторов проверять параллельно. 1 - последовательно
+        self.onnx_precision = 'auto' # Вариант модели: auto (int8/fp16, если созданы quantize_model.py), fp32, fp16, int8
+        self.onnx_cache_optimized = True # Кэшировать оптимизированный граф модели на диске (быстрее старт)
+        self.onnx_cpu_mem_arena = True # Арена памяти onnxruntime (быстрее, но держит память)
+        self.onnx_mem_pattern = True # Предвыделение памяти по шаблону прошлых запусков
         
         
         self.default_values = {
             'decks': ['ALL_DECKS'],
             'confidence_level': 0.7,
-            'template_check_rate': 0.0
+            'exit_confidence_level': 0.6,
+            'template_check_rate': 0.0,
+            'target_fps': 10.0,
+            'cpu_budget': 0.25,
+            'game_window': '',
+            'background_fps': 1.0,
+            'template_rois': {},
+            'template_base_resolution': [],
+            'inference_threads': 2,
+            'inference_inter_op_threads': 1,
+            'inference_workers': 1,
+            'onnx_precision': 'auto',
+            'onnx_cache_optimized': True,
+            'onnx_cpu_mem_arena': True,
+            'onnx_mem_pattern': True
         }
 
         self.default_config = """
@@ -28,8 +56,36 @@ decks:
 
 # Определяет, насколько точным должно быть совпадение с шаблоном для обнаружения экрана смерти/возрождения
 confidence_level: 0.7 # Значение в диапазоне: 0-1
-# Время в секундах между проверками экрана на наличие шаблона. По умолчанию: 0.
+# Экран возрождения считается пропавшим, когда оценка падает ниже этого уровня (не выше confidence_level).
+# Разрыв между уровнями не даёт повторных срабатываний, когда оценка колеблется около confidence_level.
+exit_confidence_level: 0.6 # Значение в диапазоне: 0-1
+# Минимальное время в секундах между проверками экрана на наличие шаблона. По умолчанию: 0.
 template_check_rate: 0.0 # Любое число. (1, 0.5, 3, 0.01, 0, 10, ...)
+# Частота проверок подбирается автоматически: не чаще target_fps и не больше cpu_budget процессора.
+# На статичном экране и пока игра не в фокусе проверки идут реже, после совпадения - снова на полной частоте.
+target_fps: 10.0 # Проверок в секунду (максимум), больше 0
+cpu_budget: 0.25 # Доля всего процессора (все ядра), 0-1. 0 - без ограничения
+game_window: '' # Часть заголовка окна или имени exe игры, например 'Team Fortress 2' или 'hl2.exe'. '' - не проверять
+background_fps: 1.0 # Проверок в секунду, пока активно другое окно
+# Области экрана, где появляется шаблон: [left, top, width, height] в пикселях всего (виртуального) экрана.
+# Если область не задана - она выучивается автоматически по прошлым совпадениям.
+template_rois: {}
+# template_rois:
+#   tf2_5.png: [2200, 400, 800, 300]
+# Разрешение экрана [ширина, высота], на котором сняты шаблоны. Тогда на мониторах с другим разрешением шаблоны
+# масштабируются под монитор. [] - шаблоны используются как есть (кроме файлов с суффиксом вида "tf2_5@2560x1440.png")
+template_base_resolution: []
+# template_base_resolution: [1920, 1080]
+# Нагрузка на процессор при поиске нейросетью. Всего занято ядер: примерно inference_threads * inference_workers.
+# Уменьшите, чтобы оставить ядра игре.
+inference_threads: 2 # Потоков на один запуск нейросети
+inference_inter_op_threads: 1 # Потоков на независимые ветки графа (больше 1 - ветки идут параллельно)
+inference_workers: 1 # Сколько тайлов/мониторов проверять параллельно (1 - последовательно)
+# Вариант модели: auto - int8/fp16, если они созданы respawn_detect/quantize_model.py, иначе fp32. Или явно: fp32, fp16, int8
+onnx_precision: auto
+onnx_cache_optimized: true # Сохранять оптимизированный граф модели на диск, чтобы не оптимизировать при каждом старте
+onnx_cpu_mem_arena: true # Арена памяти onnxruntime: быстрее, но держит выделенную память
+onnx_mem_pattern: true # Предвыделение памяти по шаблону прошлых запусков
 """
         self.load_config()
     
@@ -75,7 +131,21 @@ template_check_rate: 0.0 # Любое число. (1, 0.5, 3, 0.01, 0, 10, ...)
             data = {
             'decks': self.decks,
             'confidence_level': self.confidence_level,
-            'template_check_rate': self.template_check_rate
+            'exit_confidence_level': self.exit_confidence_level,
+            'template_check_rate': self.template_check_rate,
+            'target_fps': self.target_fps,
+            'cpu_budget': self.cpu_budget,
+            'game_window': self.game_window,
+            'background_fps': self.background_fps,
+            'template_rois': self.template_rois,
+            'template_base_resolution': self.template_base_resolution,
+            'inference_threads': self.inference_threads,
+            'inference_inter_op_threads': self.inference_inter_op_threads,
+            'inference_workers': self.inference_workers,
+            'onnx_precision': self.onnx_precision,
+            'onnx_cache_optimized': self.onnx_cache_optimized,
+            'onnx_cpu_mem_arena': self.onnx_cpu_mem_arena,
+            'onnx_mem_pattern': self.onnx_mem_pattern
             }
             yaml.dump(data,file)
     
@@ -0,0 +1,269 @@
+"""
+Источники кадров для матчеров шаблонов.
+
+Матчер не захватывает экран сам, а берёт кадры у FrameSource. Это позволяет прогнать записанный геймплей
+(папку скриншотов или видео) через полный цикл детекции с максимальной скоростью - воспроизводимо
+и без дисплея (например, в CI на Linux).
+
+    MssSource        - живой захват через mss (BGRA, без копирования)
+    PyAutoGuiSource  - живой захват через pyautogui.screenshot (RGB), мониторы из screeninfo
+    ImageDirSource   - скриншоты из папки по порядку имён (RGB)
+    VideoFileSource  - кадры видеофайла через cv2.VideoCapture (RGB)
+
+Кадр - numpy-массив (H, W, 3) RGB или (H, W, 4) BGRA; to_rgb приводит любой из них к RGB.
+Мониторы описываются как в mss: [виртуальный экран, монитор 1, монитор 2, ...],
+каждый - dict с left/top/width/height.
+
+Живые источники каждый grab() делают новый снимок. Записанные показывают "текущий" кадр:
+next() переходит к следующему (False - запись кончилась), grab() режет текущий. У живых next() всегда True,
+поэтому цикл `while source.next(): matcher.check()` одинаково работает с обоими.
+"""
+
+import os
+import threading
+import cv2
+import numpy as np
+
+def hi():
+    print(f'hi from {__name__}')
+
+
+def bgra_view(shot):
+    """
+    numpy-представление (H, W, 4) BGRA поверх буфера скриншота mss без копирования (np.array(shot) копирует весь кадр).
+    Валидно, пока жив shot; всё, что нужно сохранить, надо сконвертировать/скопировать.
+    """
+    return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+
+def bgra_to_rgb(img, scale_factor=1.0):
+    """
+    BGRA срез -> RGB с масштабом. При уменьшении сначала ресайз, потом конвертация - цвет считается по меньшему числу пикселей.
+    """
+    if scale_factor == 1.0:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2RGB)
+    h, w = img.shape[:2]
+    size = (int(w * scale_factor), int(h * scale_factor))
+    if scale_factor < 1.0:
+        return cv2.cvtColor(cv2.resize(img, size, interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGRA2RGB)
+    return cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGRA2RGB), size, interpolation=cv2.INTER_LINEAR)
+
+
+def to_rgb(img, scale_factor=1.0):
+    """Кадр любого источника (RGB или BGRA) -> RGB с масштабом."""
+    if img.ndim == 3 and img.shape[2] == 4:
+        return bgra_to_rgb(img, scale_factor)
+    if scale_factor == 1.0:
+        return img
+    h, w = img.shape[:2]
+    return cv2.resize(img, (int(w * scale_factor), int(h * scale_factor)), interpolation=cv2.INTER_LINEAR)
+
+
+def bounding_monitor(monitors):
+    """Прямоугольник, охватывающий все мониторы (аналог monitors[0] у mss)."""
+    left = min(m['left'] for m in monitors)
+    top = min(m['top'] for m in monitors)
+    return {
+        'left': left, 'top': top,
+        'width': max(m['left'] + m['width'] for m in monitors) - left,
+        'height': max(m['top'] + m['height'] for m in monitors) - top,
+    }
+
+
+class FrameSource:
+    """Базовый источник кадров. Подклассы переопределяют get_monitors и grab (и next для записей)."""
+    live = True
+
+    def get_monitors(self, refresh=False):
+        """[виртуальный экран, монитор 1, ...]. refresh=True - перечитать (мониторы могли смениться)."""
+        raise NotImplementedError
+
+    def next(self):
+        """Переход к следующему кадру записи. False - кадров больше нет. Живые источники - всегда True."""
+        return True
+
+    def grab(self, region=None):
+        """Кадр области region (dict left/top/width/height) или всего виртуального экрана. None - кадра нет."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class MssSource(FrameSource):
+    """
+    Живой захват через mss. Возвращает BGRA-представление буфера без копирования (bgra_view).
+    mss держит дескрипторы привязанными к потоку, поэтому у каждого потока свой экземпляр;
+    close() закрывает экземпляр вызывающего потока.
+    """
+    def __init__(self):
+        import mss
+        self._mss = mss.mss
+        self._local = threading.local()
+        self.monitors = None
+
+    @property
+    def sct(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = self._mss()
+        return sct
+
+    def get_monitors(self, refresh=False):
+        if self.monitors is None or refresh:
+            # Экземпляр mss кэширует список мониторов при первом обращении - для обновления спрашиваем новый
+            with self._mss() as probe:
+                self.monitors = [dict(m) for m in probe.monitors]
+        return self.monitors
+
+    def grab(self, region=None):
+        return bgra_view(self.sct.grab(region or self.get_monitors()[0]))
+
+    def close(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+class PyAutoGuiSource(FrameSource):
+    """
+    Живой захват через pyautogui.screenshot (корректно учитывает DPI scaling на Windows). RGB.
+    Мониторы берутся из screeninfo (у dict есть ещё name и is_primary).
+    """
+    def __init__(self):
+        import pyautogui
+        self._pyautogui = pyautogui
+        self.monitors = None
+
+    def get_monitors(self, refresh=False):
+        if self.monitors is None or refresh:
+            from screeninfo import get_monitors
+            physical = [{'left': m.x, 'top': m.y, 'width': m.width, 'height': m.height,
+                         'name': m.name, 'is_primary': m.is_primary} for m in get_monitors()]
+            self.monitors = [bounding_monitor(physical)] + physical if physical else []
+        return self.monitors
+
+    def grab(self, region=None):
+        if region is None:
+            pil_img = self._pyautogui.screenshot(allScreens=True)
+        else:
+            pil_img = self._pyautogui.screenshot(region=(region['left'], region['top'], region['width'], region['height']))
+        if pil_img.mode != 'RGB': pil_img = pil_img.convert('RGB')
+        return np.asarray(pil_img)
+
+
+class RecordedSource(FrameSource):
+    """
+    Общая часть записанных источников: текущий кадр, нарезка областей и мониторы.
+    monitors: раскладка мониторов [виртуальный экран, монитор 1, ...] в координатах кадра.
+              None - весь кадр считается одним монитором.
+    """
+    live = False
+
+    def __init__(self, monitors=None, loop=False):
+        self.declared_monitors = monitors
+        self.loop = loop
+        self.frame = None
+        self.index = -1
+        self._primed = False  # первый кадр уже загружен обращением до next() - next() его не пропускает
+
+    def read(self):
+        """Следующий RGB кадр записи или None."""
+        raise NotImplementedError
+
+    def rewind(self):
+        raise NotImplementedError
+
+    def _current(self):
+        if self.frame is None:
+            if not self.next(): return None
+            self._primed = True
+        return self.frame
+
+    def next(self):
+        if self._primed:
+            self._primed = False
+            return True
+        frame = self.read()
+        if frame is None and self.loop and self.index >= 0:
+            self.rewind()
+            frame = self.read()
+        if frame is None:
+            return False
+        self.frame = frame
+        self.index += 1
+        return True
+
+    def get_monitors(self, refresh=False):
+        if self.declared_monitors:
+            return self.declared_monitors
+        frame = self._current()
+        if frame is None:
+            return []
+        h, w = frame.shape[:2]
+        screen = {'left': 0, 'top': 0, 'width': w, 'height': h}
+        return [screen, dict(screen)]
+
+    def grab(self, region=None):
+        frame = self._current()
+        if frame is None:
+            return None
+        if region is None:
+            return frame
+        origin = self.get_monitors()[0]
+        x = region['left'] - origin['left']
+        y = region['top'] - origin['top']
+        return frame[max(0, y):y + region['height'], max(0, x):x + region['width']]
+
+
+class ImageDirSource(RecordedSource):
+    """Скриншоты из папки (png/jpg) по порядку имён."""
+    def __init__(self, path, extensions=('.png', '.jpg'), monitors=None, loop=False):
+        super().__init__(monitors, loop)
+        self.paths = sorted(os.path.join(path, f) for f in os.listdir(path)
+                            if os.path.splitext(f)[1].lower() in extensions)
+        self._pos = 0
+
+    @property
+    def path(self):
+        """Файл текущего кадра (для разметки в бенчмарках)."""
+        return self.paths[self._pos - 1] if self._pos else None
+
+    def read(self):
+        while self._pos < len(self.paths):
+            img = cv2.imread(self.paths[self._pos])
+            self._pos += 1
+            if img is not None:
+                return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            print(f"Не удалось загрузить кадр: {self.paths[self._pos - 1]}")
+        return None
+
+    def rewind(self):
+        self._pos = 0
+
+
+class VideoFileSource(RecordedSource):
+    """Кадры видеофайла через cv2.VideoCapture."""
+    def __init__(self, path, monitors=None, loop=False):
+        super().__init__(monitors, loop)
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise FileNotFoundError(f"Не удалось открыть видео {path}")
+
+    def read(self):
+        ok, img = self.capture.read()
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB) if ok else None
+
+    def rewind(self):
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def close(self):
+        self.capture.release()
@@ -0,0 +1,194 @@
+"""
+Настройка сессий onnxruntime для нейросетевого матчера.
+
+- Вариант модели: рядом с matcher.onnx могут лежать matcher.int8.onnx (статическая INT8 квантизация QDQ,
+  веса по каналам, калибровка; динамическая для этой сети не годится - см. quantize_model.py)
+  и matcher.fp16.onnx (создаются respawn_detect/quantize_model.py). precision='auto' берёт первый найденный
+  из PRECISION_PRIORITY, иначе - исходную FP32 модель. Так же и для matcher_scene/template/head.
+- Кэш оптимизированного графа: при первом запуске onnxruntime сохраняет оптимизированный граф
+  (<модель>.optimized.onnx, optimized_model_filepath), дальше он грузится без повторной оптимизации.
+  Кэш пересоздаётся, если модель новее кэша или кэш не загрузился (например, после обновления onnxruntime).
+- Потоки, арена памяти и memory pattern берутся из config.yaml (SessionSettings.from_config).
+- BoundRunner: запуск в установившемся режиме через IOBinding - входы и выходы привязаны к буферам один раз,
+  дальше на каждом кадре буферы перезаписываются на месте, session.run не копирует входы и не выделяет выходы.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import onnxruntime as ort
+
+def hi():
+    print(f'hi from {__name__}')
+
+PRECISION_PRIORITY = ('int8', 'fp16')
+OPTIMIZED_SUFFIX = '.optimized.onnx'
+
+
+class SessionSettings:
+    """Параметры создания InferenceSession. Значения по умолчанию совпадают с прежними захардкоженными."""
+    def __init__(self, precision='auto', intra_op_threads=2, inter_op_threads=1, cpu_mem_arena=True,
+                 mem_pattern=True, cache_optimized=True, providers=('CPUExecutionProvider',)):
+        self.precision = precision
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.cpu_mem_arena = cpu_mem_arena
+        self.mem_pattern = mem_pattern
+        self.cache_optimized = cache_optimized
+        self.providers = list(providers)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            precision=getattr(config, 'onnx_precision', 'auto'),
+            intra_op_threads=max(1, int(getattr(config, 'inference_threads', 2))),
+            inter_op_threads=max(1, int(getattr(config, 'inference_inter_op_threads', 1))),
+            cpu_mem_arena=bool(getattr(config, 'onnx_cpu_mem_arena', True)),
+            mem_pattern=bool(getattr(config, 'onnx_mem_pattern', True)),
+            cache_optimized=bool(getattr(config, 'onnx_cache_optimized', True)),
+        )
+
+
+def variant_path(model_path, precision):
+    """matcher.onnx + 'int8' -> matcher.int8.onnx; 'fp32' - исходный файл."""
+    if precision == 'fp32': return model_path
+    stem, ext = os.path.splitext(model_path)
+    return f"{stem}.{precision}{ext}"
+
+
+def resolve_model(model_path, precision='auto'):
+    """Путь к варианту модели нужной точности. Если варианта нет - исходная модель."""
+    candidates = PRECISION_PRIORITY if precision == 'auto' else (precision,)
+    for p in candidates:
+        path = variant_path(model_path, p)
+        if os.path.exists(path):
+            return path
+    return model_path
+
+
+def optimized_path(model_path):
+    return os.path.splitext(model_path)[0] + OPTIMIZED_SUFFIX
+
+
+def session_options(settings):
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = settings.intra_op_threads
+    opts.inter_op_num_threads = settings.inter_op_threads
+    if settings.inter_op_threads > 1:
+        # inter_op потоки работают только в параллельном режиме: независимые ветки графа идут одновременно
+        opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    opts.enable_cpu_mem_arena = settings.cpu_mem_arena
+    opts.enable_mem_pattern = settings.mem_pattern
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return opts
+
+
+def create_session(model_path, settings=None):
+    """
+    InferenceSession для model_path с учётом варианта точности и кэша оптимизированного графа.
+    У сессии выставлен атрибут model_variant - какой файл на самом деле загружен.
+    """
+    settings = settings or SessionSettings()
+    path = resolve_model(model_path, settings.precision)
+    cache = optimized_path(path)
+
+    session = None
+    if settings.cache_optimized and os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        opts = session_options(settings)
+        # Граф уже оптимизирован - повторно не оптимизируем
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            session = ort.InferenceSession(cache, sess_options=opts, providers=settings.providers)
+        except Exception as e:
+            print(f"⚠️ Optimized cache {os.path.basename(cache)} is invalid, rebuilding: {e}")
+            os.remove(cache)
+
+    if session is None:
+        opts = session_options(settings)
+        if settings.cache_optimized:
+            opts.optimized_model_filepath = cache
+        session = ort.InferenceSession(path, sess_options=opts, providers=settings.providers)
+
+    session.model_variant = path
+    return session
+
+
+class BoundRunner:
+    """
+    session.run через IOBinding с привязкой к постоянным буферам.
+
+    Привязка создаётся на набор входных массивов (по их id) и держит ссылки на них: Preprocessor пишет сцену
+    в один и тот же буфер монитора/тайла, тензоры шаблонов неизменны, поэтому со второго кадра запуск идёт
+    без копирования входов и без выделения выходов. Выходы - заранее выделенные numpy массивы,
+    валидны до следующего запуска с теми же входами (их перезапишет onnxruntime).
+
+    Привязка держит свои входы живыми, поэтому буфер, пересозданный под новый размер (или больше не нужный),
+    нужно отпустить через drop - иначе старые буферы сцен живут до вытеснения. Привязок не больше max_entries (LRU).
+    Разные привязки можно запускать из разных потоков одновременно; одну и ту же - нельзя
+    (как и писать в один буфер препроцессинга).
+    """
+    def __init__(self, session, max_entries=64):
+        self.session = session
+        self.output_names = [o.name for o in session.get_outputs()]
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # ((имя входа, id массива), ...) -> (входы, OrtValue входов/выходов, binding, выходы)
+        self._lock = threading.Lock()
+        self.bindings_created = 0
+
+    def run(self, feeds, run_options=None):
+        """Как session.run(None, feeds, run_options), но выходы - постоянные буферы привязки."""
+        if not all(arr.flags.c_contiguous for arr in feeds.values()):
+            # Привязать можно только непрерывный буфер, копия не видела бы перезаписи на месте
+            return self.session.run(None, feeds, run_options)
+        key = tuple((name, id(arr)) for name, arr in feeds.items())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            return self._bind(key, feeds, run_options)
+        self.session.run_with_iobinding(entry[2], run_options)
+        return entry[3]
+
+    def _bind(self, key, feeds, run_options):
+        binding = self.session.io_binding()
+        values = [ort.OrtValue.ortvalue_from_numpy(arr) for arr in feeds.values()]  # без копии, держит ссылку на arr
+        for name, value in zip(feeds, values):
+            binding.bind_ortvalue_input(name, value)
+        # Формы выходов заранее не известны (зависят от размера сцены) - первый запуск выделяет их сам
+        for name in self.output_names:
+            binding.bind_output(name, 'cpu')
+        self.session.run_with_iobinding(binding, run_options)
+        outputs = [np.array(out, copy=True) for out in binding.copy_outputs_to_cpu()]
+        binding.clear_binding_outputs()
+        for name, out in zip(self.output_names, outputs):
+            value = ort.OrtValue.ortvalue_from_numpy(out)
+            binding.bind_ortvalue_output(name, value)
+            values.append(value)
+
+        with self._lock:
+            self._entries[key] = (list(feeds.values()), values, binding, outputs)
+            self.bindings_created += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return outputs
+
+    def drop(self, arrays):
+        """
+        Убирает привязки, среди входов которых есть один из arrays (буфер пересоздан и больше не будет использован).
+        Возвращает выходы убранных привязок - они могли быть входами привязок другой сессии
+        (эмбеддинг сцены -> голова двухстадийной модели), их вызывающий отпускает так же.
+        """
+        ids = {id(arr) for arr in arrays}
+        with self._lock:
+            keys = [key for key in self._entries if any(i in ids for _, i in key)]
+            entries = [self._entries.pop(key) for key in keys]
+        return [out for entry in entries for out in entry[3]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,207 @@
+"""
+Планировщик цикла детекции: пауза между проверками подбирается на каждом кадре, а не фиксирована (template_check_rate).
+
+- Целевая частота target_fps - не чаще.
+- Бюджет CPU cpu_budget - доля всего процессора (всех ядер), которую детектор может занимать в среднем.
+  Если проверка стоит больше, пауза растёт, чтобы не отнимать процессор у игры.
+- Активное окно не игра (game_window - часть заголовка окна или имени exe) - частота падает до background_fps.
+- Экран не меняется (гейт изменений матчера пропустил все мониторы) - пауза растёт вдвое с каждым таким кадром,
+  до STATIC_MAX_INTERVAL.
+- После сырого совпадения (ещё не подтверждённого RespawnTracker) BOOST_SECONDS секунд - полная частота,
+  чтобы быстрее набрать подтверждение. Пока возрождение подтверждено - пауза не меньше present_interval.
+- template_check_rate (старый параметр) остаётся нижней границей паузы.
+
+Фактические FPS и доля CPU за последние STATS_WINDOW секунд пишутся в utils.profiler (модуль "poll_scheduler").
+"""
+
+import os
+import time
+from collections import deque
+
+import utils.profiler
+
+try:
+    import win32gui
+    import win32process
+except ImportError:
+    win32gui = None
+    win32process = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def hi():
+    print(f'hi from {__name__}')
+
+prof = utils.profiler.get_profiler("poll_scheduler")
+
+DEFAULT_TARGET_FPS = 10.0        # target_fps, если в config.yaml он не задан или не больше 0
+STATIC_BACKOFF = 2.0             # Во сколько раз растёт пауза за каждый статичный кадр подряд
+STATIC_MIN_INTERVAL = 0.01       # С какой паузы начинается рост на статичном экране, если базовая меньше, сек
+STATIC_MAX_INTERVAL = 1.0        # Предел паузы на статичном экране, сек
+BOOST_SECONDS = 3.0              # Сколько секунд после совпадения держать полную частоту
+FOREGROUND_CHECK_INTERVAL = 1.0  # Как часто перепроверять активное окно, сек
+STATS_WINDOW = 5.0               # Окно усреднения фактических FPS и доли CPU, сек
+CPU_COST_SMOOTHING = 0.2         # Вес нового кадра в скользящей оценке CPU на проверку
+
+
+def foreground_window():
+    """(заголовок, имя exe) активного окна. None - платформа не поддерживается (не Windows / нет pywin32)."""
+    if win32gui is None: return None
+    hwnd = win32gui.GetForegroundWindow()
+    title = win32gui.GetWindowText(hwnd)
+    process = ''
+    if psutil is not None:
+        try:
+            _, pid = win32process.GetWindowThreadProcessId(hwnd)
+            process = psutil.Process(pid).name()
+        except Exception:
+            pass
+    return title, process
+
+
+class PollScheduler:
+    """
+    Использование:
+        with scheduler.frame():
+            event = events.poll()
+        scheduler.pause(hit=events.last_found, static=matcher.static, present=events.present,
+                        present_interval=events.poll_interval)
+    """
+    def __init__(self, target_fps=DEFAULT_TARGET_FPS, cpu_budget=0.25, game_window='', background_fps=1.0,
+                 min_interval=0.0, foreground=foreground_window):
+        if not target_fps or target_fps <= 0:
+            print(f"⚠️ target_fps должен быть больше 0 (задан {target_fps}), используется {DEFAULT_TARGET_FPS}")
+            target_fps = DEFAULT_TARGET_FPS
+        self.target_fps = target_fps
+        self.cpu_budget = cpu_budget
+        self.game_window = game_window.lower()
+        self.background_fps = background_fps
+        self.min_interval = min_interval
+        self.foreground = foreground
+        self.cpus = os.cpu_count() or 1
+
+        self.interval = 0.0        # Последняя выбранная пауза от начала проверки до начала следующей, сек
+        self.cpu_cost = None       # Скользящая оценка процессорного времени одной проверки, сек
+        self._static_streak = 0
+        self._last_hit = None
+        self._in_game = True
+        self._foreground_checked = 0.0
+        self._frame_start = None
+        self._frame_cpu = None
+        self._history = deque()    # (время начала проверки, process_time на начало)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            target_fps=float(getattr(config, 'target_fps', DEFAULT_TARGET_FPS) or 0.0),
+            cpu_budget=float(getattr(config, 'cpu_budget', 0.25)),
+            game_window=str(getattr(config, 'game_window', '') or ''),
+            background_fps=float(getattr(config, 'background_fps', 1.0)),
+            min_interval=float(getattr(config, 'template_check_rate', 0.0) or 0.0),
+        )
+
+    def in_game(self):
+        """Активно ли окно игры (с кэшем на FOREGROUND_CHECK_INTERVAL). Без game_window или без pywin32 - всегда True."""
+        if not self.game_window: return True
+        now = time.perf_counter()
+        if now - self._foreground_checked >= FOREGROUND_CHECK_INTERVAL:
+            self._foreground_checked = now
+            window = self.foreground()
+            self._in_game = window is None or any(self.game_window in part.lower() for part in window)
+        return self._in_game
+
+    def frame(self):
+        """Контекст одной проверки: замеряет её время и процессорное время всего процесса (включая потоки onnxruntime)."""
+        return _Frame(self)
+
+    def _begin(self):
+        self._frame_start = time.perf_counter()
+        self._frame_cpu = time.process_time()
+        self._history.append((self._frame_start, self._frame_cpu))
+        while self._history and self._frame_start - self._history[0][0] > STATS_WINDOW:
+            self._history.popleft()
+
+    def _end(self):
+        wall = time.perf_counter() - self._frame_start
+        cpu = time.process_time() - self._frame_cpu
+        prof.add_time("check", wall)
+        prof.add_time("check_cpu", cpu)
+        self.cpu_cost = cpu if self.cpu_cost is None else self.cpu_cost + CPU_COST_SMOOTHING * (cpu - self.cpu_cost)
+
+    def next_interval(self, hit=False, static=False, present=False, present_interval=0.0):
+        """Пауза от начала последней проверки до начала следующей."""
+        now = time.perf_counter()
+        if hit: self._last_hit = now
+        interval = 1.0 / self.target_fps
+
+        if not self.in_game():
+            interval = max(interval, 1.0 / self.background_fps if self.background_fps > 0 else STATIC_MAX_INTERVAL)
+            prof.count("background")
+        elif present:
+            interval = max(interval, present_interval)
+        elif self._last_hit is not None and now - self._last_hit < BOOST_SECONDS:
+            self._static_streak = 0
+            prof.count("boost")
+        elif static:
+            self._static_streak += 1
+            base = max(interval, STATIC_MIN_INTERVAL)
+            interval = max(interval, min(base * STATIC_BACKOFF ** self._static_streak, STATIC_MAX_INTERVAL))
+            prof.count("static_backoff")
+        else:
+            self._static_streak = 0
+
+        # Бюджет CPU: cpu_cost / (пауза * ядра) <= cpu_budget
+        if self.cpu_budget > 0 and self.cpu_cost:
+            budget_interval = self.cpu_cost / (self.cpu_budget * self.cpus)
+            if budget_interval > interval:
+                interval = budget_interval
+                prof.count("cpu_throttled")
+
+        self.interval = max(interval, self.min_interval)
+        return self.interval
+
+    def pause(self, hit=False, static=False, present=False, present_interval=0.0, stop_event=None):
+        """Выбирает паузу, спит остаток от начала проверки и обновляет фактические FPS/CPU в профайлере."""
+        interval = self.next_interval(hit, static, present, present_interval)
+        elapsed = time.perf_counter() - self._frame_start if self._frame_start is not None else 0.0
+        wait = interval - elapsed
+        if wait > 0:
+            prof.add_time("sleep", wait)
+            if stop_event is not None:
+                stop_event.wait(wait)
+            else:
+                time.sleep(wait)
+        self._publish()
+
+    def stats(self):
+        """Фактические FPS и доля CPU (всего процессора) за последние STATS_WINDOW секунд."""
+        if len(self._history) < 2:
+            return {'fps': 0.0, 'cpu_share': 0.0, 'interval': self.interval}
+        (t0, cpu0), now, cpu_now = self._history[0], time.perf_counter(), time.process_time()
+        span = max(now - t0, 1e-9)
+        return {
+            'fps': (len(self._history) - 1) / (self._history[-1][0] - t0) if self._history[-1][0] > t0 else 0.0,
+            'cpu_share': (cpu_now - cpu0) / span / self.cpus,
+            'interval': self.interval,
+        }
+
+    def _publish(self):
+        stats = self.stats()
+        prof.gauge("achieved_fps", stats['fps'])
+        prof.gauge("cpu_share_%", stats['cpu_share'] * 100)
+        prof.gauge("interval_ms", stats['interval'] * 1000)
+
+
+class _Frame:
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    def __enter__(self):
+        self.scheduler._begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.scheduler._end()
@@ -12,6 +12,9 @@ _STATS: Dict[str, Dict[str, List[Union[float, int]]]] = collections.defaultdict(
     lambda: collections.defaultdict(lambda: [0.0, 0])
 )
 
+# { module_name: { gauge_name: последнее значение } } - показатели, которые не суммируются (FPS, доля CPU)
+_GAUGES: Dict[str, Dict[str, float]] = collections.defaultdict(dict)
+
 _IS_ENABLED = True # Глобальный флаг для включения/отключения профилирования
 
 def enable_profiling(enable: bool = True):
@@ -48,6 +51,10 @@ class _Section(ContextDecorator):
 
     # __call__ наследуется от ContextDecorator и используется для декорирования функций
 
+    def _recreate_cm(self) -> '_Section':
+        # Свой t0 на каждый вызов декорированной функции - иначе параллельные вызовы из разных потоков затирают друг друга
+        return _Section(self.module_name, self.section_name, self.stats_dict, self.lock)
+
 class _Profiler:
     def __init__(self, module_name: str,
                  target_stats_dict: Dict[str, Dict[str, List[Union[float, int]]]] = _STATS,
@@ -84,6 +91,32 @@ class _Profiler:
                 "Profiler argument must be a section name (str) or a callable."
             )
 
+    def add_time(self, section_name: str, dt: float, calls: int = 1) -> None:
+        """
+        Записывает в секцию заранее измеренное время (например, длительность, замеренную в другом потоке).
+        Только реально потраченное время: оно входит в total модуля. Оценки (сэкономленное время) - через gauge.
+        """
+        if not is_profiling_enabled():
+            return
+        with self.target_lock:
+            entry = self.target_stats_dict[self.module_name][section_name]
+            entry[0] += dt
+            entry[1] += calls
+
+    def count(self, section_name: str, n: int = 1) -> None:
+        """Счётчик событий без времени (пропуски кадров, попадания в кэш и т.д.)."""
+        self.add_time(section_name, 0.0, n)
+
+    def gauge(self, name: str, value: float) -> None:
+        """
+        Текущее значение показателя (достигнутый FPS, доля CPU и т.д.). В отчёте - последнее записанное значение.
+        Показатели всегда пишутся в глобальную таблицу, даже у локального профайлера.
+        """
+        if not is_profiling_enabled():
+            return
+        with _LOCK:
+            _GAUGES[self.module_name][name] = value
+
     def __getattr__(self, section_name: str) -> _Section:
         if not is_profiling_enabled(): # Если профилирование отключено
              # Возвращаем "пустышку" _Section, которая ничего не делает
@@ -142,6 +175,7 @@ def clear_stats() -> None:
     """Очищает всю собранную статистику."""
     with _LOCK:
         _STATS.clear()
+        _GAUGES.clear()
 
 def report(sort_by: str = "time", target_stats: Dict[str, Dict[str, List[Union[float, int]]]] = _STATS) -> None:
     """
@@ -156,12 +190,14 @@ def report(sort_by: str = "time", target_stats: Dict[str, Dict[str, List[Union[f
     with _LOCK: # Используем глобальный _LOCK для чтения глобального _STATS, если target_stats это он
                  # Если target_stats локальный, этот лок может быть избыточен, но безопасен.
         print("\n─── MiniProfiler report ───")
-        if not target_stats:
+        gauges = _GAUGES if target_stats is _STATS else {}
+        if not target_stats and not gauges:
             print("  No profiling data collected.")
             print("─────────────────────────────\n")
             return
 
-        sorted_modules = sorted(target_stats.items(), key=lambda item: item[0])
+        # .get - чтобы не создавать пустые секции в defaultdict для модулей, где есть только показатели
+        sorted_modules = [(mod, target_stats.get(mod, {})) for mod in sorted(set(target_stats) | set(gauges))]
 
         for mod, sects in sorted_modules:
             if not isinstance(sects, collections.defaultdict) and not isinstance(sects, dict):
@@ -197,4 +233,6 @@ def report(sort_by: str = "time", target_stats: Dict[str, Dict[str, List[Union[f
             for name, (tt, n) in rows:
                 perc: float = (tt / total_for_perc) * 100 if total_for_perc != 0 else 0 # Проверка деления на ноль
                 print(f"  {name:30s}: {tt:7.3f}s  | {perc:5.1f}% | {n:7d}×")
+            for name, value in sorted(gauges.get(mod, {}).items()):
+                print(f"  {name:30s}: {value:7.2f}")
         print("─────────────────────────────\n")
\ No newline at end of file
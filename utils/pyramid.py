@@ -0,0 +1,82 @@
+"""
+Поиск шаблона от грубого к точному (coarse-to-fine) по пирамиде изображений.
+
+1. Сцена и шаблон уменьшаются в 2**levels раз (cv2.pyrDown).
+2. На маленькой сцене cv2.matchTemplate находит top_k лучших пиков (кандидатов).
+3. Каждый кандидат проверяется на полном разрешении только в небольшом окне вокруг него.
+
+Модуль общий для respawn_detect.py (OpenCV) и respawn_detect_ai.py (нейросеть подтверждает окна).
+"""
+
+import cv2
+import numpy as np
+
+def hi():
+    print(f'hi from {__name__}')
+
+MIN_COARSE_SIZE = 8  # Меньше этого шаблон на грубом уровне теряет детали - уровень понижается
+
+
+def build_pyramid(img, levels):
+    """[img, img/2, img/4, ...] - всего levels + 1 уровней."""
+    pyramid = [img]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+def downscale_mask(mask, shape):
+    """Маска прозрачности под размер уменьшенного шаблона (без сглаживания, чтобы осталась бинарной)."""
+    if mask is None: return None
+    return cv2.resize(mask, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+
+
+def effective_levels(needle_shape, levels, min_size=MIN_COARSE_SIZE):
+    """Сколько уровней можно реально использовать, чтобы шаблон не стал меньше min_size пикселей."""
+    h, w = needle_shape[:2]
+    while levels > 0 and min(h >> levels, w >> levels) < min_size:
+        levels -= 1
+    return levels
+
+
+def find_peaks(res, top_k, min_distance):
+    """
+    top_k лучших локальных максимумов карты matchTemplate.
+    Вокруг каждого найденного пика окрестность min_distance гасится, чтобы пики не слипались.
+    Возвращает [(score, x, y)] по убыванию score.
+    """
+    res = np.nan_to_num(res, nan=-1.0, posinf=-1.0, neginf=-1.0)
+    peaks = []
+    for _ in range(top_k):
+        _, max_val, _, (x, y) = cv2.minMaxLoc(res)
+        if max_val <= -1.0: break
+        peaks.append((float(max_val), x, y))
+        res[max(0, y - min_distance):y + min_distance + 1, max(0, x - min_distance):x + min_distance + 1] = -1.0
+    return peaks
+
+
+def coarse_candidates(haystack_coarse, needle_coarse, levels, top_k, mask_coarse=None):
+    """
+    Кандидаты на грубом уровне в координатах полного разрешения: [(score, x, y)].
+    (x, y) - левый верхний угол предполагаемого совпадения на уровне 0.
+    """
+    h, w = needle_coarse.shape[:2]
+    if h > haystack_coarse.shape[0] or w > haystack_coarse.shape[1]:
+        return []
+    res = cv2.matchTemplate(haystack_coarse, needle_coarse, cv2.TM_CCOEFF_NORMED, mask=mask_coarse)
+    scale = 2 ** levels
+    return [(score, x * scale, y * scale) for score, x, y in find_peaks(res, top_k, max(1, min(h, w) // 2))]
+
+
+def candidate_window(x, y, needle_shape, haystack_shape, margin):
+    """
+    Окно (x0, y0, x1, y1) вокруг кандидата на полном разрешении: шаблон + margin с каждой стороны.
+    У края экрана окно сдвигается внутрь, а не обрезается, чтобы шаблон в него помещался.
+    """
+    nh, nw = needle_shape[:2]
+    hh, hw = haystack_shape[:2]
+    win_w = min(hw, nw + 2 * margin)
+    win_h = min(hh, nh + 2 * margin)
+    x0 = min(max(0, x - margin), hw - win_w)
+    y0 = min(max(0, y - margin), hh - win_h)
+    return x0, y0, x0 + win_w, y0 + win_h
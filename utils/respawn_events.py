@@ -0,0 +1,181 @@
+"""
+События возрождения поверх матчеров шаблонов.
+
+check() матчера - решение по одному кадру: любой кадр с оценкой выше confidence_level даёт True.
+RespawnTracker превращает поток кадров в события "возрождение началось" / "возрождение закончилось":
+- вход подтверждается N кадрами из последних M (CONFIRM_FRAMES) с оценкой выше порога входа (confidence_level);
+- выход - N промахами из последних M (RELEASE_FRAMES), промах - оценка ниже порога выхода (exit_confidence_level).
+  Порог выхода ниже порога входа, поэтому оценка, колеблющаяся около confidence_level, не даёт пачку событий.
+RespawnDetector опрашивает матчер (или PipelinedDetector) и подстраивает частоту опроса:
+пока экран возрождения подтверждён, проверки идут реже (PRESENT_POLL_INTERVAL), после выхода - снова часто.
+
+Оценки кадра собирает FrameScores: матчеры отмечают в нём каждую посчитанную оценку, лучшая за check()
+доступна как matcher.last_score. Если оценки нет (pyautogui.locate), используется только решение check().
+"""
+
+import threading
+import time
+from collections import deque
+
+import utils.profiler
+
+def hi():
+    print(f'hi from {__name__}')
+
+prof = utils.profiler.get_profiler("respawn_events")
+
+EVENT_STARTED = 'started'
+EVENT_ENDED = 'ended'
+
+CONFIRM_FRAMES = (2, 3)  # (N, M): вход - N кадров выше порога входа среди последних M
+RELEASE_FRAMES = (3, 4)  # (N, M): выход - N кадров ниже порога выхода среди последних M
+PRESENT_POLL_INTERVAL = 0.5  # Секунд между проверками, пока экран возрождения на экране
+ABSENT_POLL_INTERVAL = 0.0   # ... и пока его нет
+
+
+class FrameScores:
+    """
+    Лучшая оценка совпадения за одну проверку - в целом и по ключам (мониторам).
+    begin() перед проверкой, note() на каждую посчитанную оценку (можно из нескольких потоков), end() - итог.
+    previous(key) - оценка ключа из прошлых проверок (для кадров, пропущенных гейтом изменений).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._best = None
+        self._frame = {}
+        self._last = {}
+
+    def begin(self):
+        with self._lock:
+            self._best = None
+            self._frame = {}
+
+    def note(self, score, key=None):
+        if score is None: return
+        with self._lock:
+            if self._best is None or score > self._best:
+                self._best = score
+            if key is not None and (self._frame.get(key) is None or score > self._frame[key]):
+                self._frame[key] = score
+
+    def end(self):
+        with self._lock:
+            self._last.update(self._frame)
+            return self._best
+
+    def previous(self, key):
+        return self._last.get(key)
+
+    def clear(self):
+        with self._lock:
+            self._best = None
+            self._frame.clear()
+            self._last.clear()
+
+
+class RespawnEvent:
+    def __init__(self, kind, timestamp, score=None, duration=None):
+        self.kind = kind            # EVENT_STARTED / EVENT_ENDED
+        self.timestamp = timestamp  # time.time() кадра, на котором событие подтвердилось
+        self.score = score          # оценка этого кадра (None - неизвестна)
+        self.duration = duration    # для EVENT_ENDED: сколько секунд экран возрождения был подтверждён
+
+    def __repr__(self):
+        return f"RespawnEvent({self.kind}, score={self.score}, duration={self.duration})"
+
+
+class RespawnTracker:
+    """Гистерезис по кадрам: update() на каждую проверку, событие возвращается в кадре подтверждения."""
+    def __init__(self, enter_threshold, exit_threshold=None, confirm=CONFIRM_FRAMES, release=RELEASE_FRAMES):
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = enter_threshold if exit_threshold is None else min(exit_threshold, enter_threshold)
+        self.confirm = confirm
+        self.release = release
+        self.present = False
+        self.since = None
+        self._window = deque(maxlen=max(confirm[1], release[1]))
+
+    def _hit(self, found, score):
+        threshold = self.exit_threshold if self.present else self.enter_threshold
+        if score is None:
+            return bool(found)
+        return bool(found) or score > threshold
+
+    def update(self, found, score=None, now=None):
+        """found - результат check(), score - лучшая оценка кадра (или None). Возвращает RespawnEvent или None."""
+        now = time.time() if now is None else now
+        self._window.append(self._hit(found, score))
+        recent = list(self._window)
+
+        if not self.present:
+            n, m = self.confirm
+            if sum(recent[-m:]) >= n:
+                self.present, self.since = True, now
+                self._window.clear()
+                prof.count(EVENT_STARTED)
+                return RespawnEvent(EVENT_STARTED, now, score)
+        else:
+            n, m = self.release
+            if sum(not hit for hit in recent[-m:]) >= n:
+                duration = now - self.since
+                self.present, self.since = False, None
+                self._window.clear()
+                prof.count(EVENT_ENDED)
+                return RespawnEvent(EVENT_ENDED, now, score, duration)
+        return None
+
+    def reset(self):
+        self.present, self.since = False, None
+        self._window.clear()
+
+
+class RespawnDetector:
+    """
+    Опрос детектора с гистерезисом. detector - TemplateMatcher любого из матчеров или PipelinedDetector:
+    нужен check() и (необязательно) last_score.
+    on_started(event) / on_ended(event) вызываются в потоке опроса.
+    """
+    def __init__(self, detector, config, on_started=None, on_ended=None, check=None):
+        self.detector = detector
+        self.check = check or detector.check
+        self.tracker = RespawnTracker(config.confidence_level, getattr(config, 'exit_confidence_level', None))
+        self.on_started = on_started
+        self.on_ended = on_ended
+        self.last_found = False  # решение check() на последнем кадре (до подтверждения)
+
+    @property
+    def present(self):
+        return self.tracker.present
+
+    @property
+    def poll_interval(self):
+        return PRESENT_POLL_INTERVAL if self.tracker.present else ABSENT_POLL_INTERVAL
+
+    def poll(self):
+        """Одна проверка. Возвращает RespawnEvent, если на этом кадре подтвердилось начало или конец."""
+        found = self.last_found = bool(self.check())
+        event = self.tracker.update(found, getattr(self.detector, 'last_score', None))
+        if event is not None:
+            callback = self.on_started if event.kind == EVENT_STARTED else self.on_ended
+            if callback: callback(event)
+        return event
+
+    def run(self, stop_event=None, scheduler=None):
+        """
+        Цикл опроса до stop_event. scheduler - utils.poll_scheduler.PollScheduler: паузу выбирает он
+        (с учётом poll_interval). Без него пауза - poll_interval за вычетом времени проверки.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            if scheduler is not None:
+                with scheduler.frame():
+                    self.poll()
+                scheduler.pause(hit=self.last_found, static=getattr(self.detector, 'static', False),
+                                present=self.present, present_interval=self.poll_interval, stop_event=stop_event)
+                continue
+            t0 = time.perf_counter()
+            self.poll()
+            wait = self.poll_interval - (time.perf_counter() - t0)
+            if wait > 0:
+                prof.add_time("idle", wait)
+                stop_event.wait(wait)
@@ -0,0 +1,108 @@
+"""
+Банк масштабированных вариантов шаблонов под разрешения мониторов.
+
+Шаблон снят на одном разрешении (указанном в имени файла: "respawn@2560x1440.png", либо общем для всех
+шаблонов template_base_resolution из конфига), а игрок может играть на другом разрешении/DPI. Вместо перебора
+масштабов на каждом кадре банк один раз строит вариант шаблона под каждый размер монитора и отдаёт нужный
+по размеру монитора. Шаблоны без известного разрешения не масштабируются.
+При смене мониторов (set_monitors) банк сбрасывается и варианты строятся заново.
+"""
+
+import os
+import re
+import cv2
+
+def hi():
+    print(f'hi from {__name__}')
+
+TEMPLATE_BASE_RESOLUTION = None         # (ширина, высота) экрана, на котором сняты шаблоны без суффикса. None - не масштабировать
+SCALE_TOLERANCE = 0.02                   # Масштаб ближе к 1 считается единичным - шаблон не трогаем
+
+_RESOLUTION_SUFFIX = re.compile(r'@(\d+)x(\d+)$')
+
+
+def config_resolution(value):
+    """[ширина, высота] из конфига -> (ширина, высота). Пусто или некорректно - None."""
+    try:
+        w, h = (int(v) for v in value)
+    except (TypeError, ValueError):
+        return None
+    return (w, h) if w > 0 and h > 0 else None
+
+
+def base_resolution(template_path, default=TEMPLATE_BASE_RESOLUTION):
+    """Разрешение, на котором снят шаблон: из суффикса имени файла "@ШxВ" или default (None - неизвестно)."""
+    stem = os.path.splitext(os.path.basename(template_path))[0]
+    m = _RESOLUTION_SUFFIX.search(stem)
+    return (int(m.group(1)), int(m.group(2))) if m else default
+
+
+def template_scale(template_path, monitor_size, default=TEMPLATE_BASE_RESOLUTION):
+    """
+    Во сколько раз шаблон нужно увеличить для монитора monitor_size = (ширина, высота).
+    Берётся минимум по осям: на ультрашироких мониторах интерфейс масштабируется по высоте.
+    Разрешение шаблона неизвестно (нет суффикса и default=None) - 1.0, шаблон используется как есть.
+    """
+    base = base_resolution(template_path, default)
+    if base is None or monitor_size is None: return 1.0
+    base_w, base_h = base
+    scale = min(monitor_size[0] / base_w, monitor_size[1] / base_h)
+    return 1.0 if abs(scale - 1.0) < SCALE_TOLERANCE else scale
+
+
+def resize(img, scale, is_mask=False):
+    if img is None or scale == 1.0: return img
+    h, w = img.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    if is_mask:
+        interpolation = cv2.INTER_NEAREST
+    else:
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+    return cv2.resize(img, size, interpolation=interpolation)
+
+
+class ScaleBank:
+    """
+    Кэш вариантов шаблонов: (ключ шаблона, версия, масштаб) -> вариант.
+
+    build(source, scale): строит вариант из исходного шаблона (source - что угодно: картинка, запись реестра...).
+    version: что-то, меняющееся при изменении файла шаблона (например mtime) - старые варианты не используются.
+    """
+    def __init__(self, build, default_resolution=TEMPLATE_BASE_RESOLUTION):
+        self.build = build
+        self.default_resolution = default_resolution
+        self.monitor_sizes = ()
+        self.variants = {}
+
+    def set_monitors(self, monitor_sizes):
+        """Запоминает размеры мониторов [(ширина, высота)]. Возвращает True, если они изменились (банк сброшен)."""
+        sizes = tuple(sorted(set(tuple(s) for s in monitor_sizes)))
+        if sizes == self.monitor_sizes:
+            return False
+        self.monitor_sizes = sizes
+        self.variants.clear()
+        return True
+
+    def scale(self, key, monitor_size):
+        return template_scale(key, monitor_size, self.default_resolution)
+
+    def get(self, key, source, monitor_size, version=None):
+        scale = self.scale(key, monitor_size)
+        cache_key = (key, version, round(scale, 4))
+        variant = self.variants.get(cache_key)
+        if variant is None:
+            variant = self.build(source, scale)
+            self.variants[cache_key] = variant
+        return variant
+
+    def prebuild(self, items):
+        """Строит варианты заранее для всех известных мониторов. items: [(key, source, version)]."""
+        for key, source, version in items:
+            for size in self.monitor_sizes:
+                self.get(key, source, size, version)
+
+    def prune(self, keys):
+        """Выкидывает варианты шаблонов, которых больше нет."""
+        keys = set(keys)
+        for cache_key in [k for k in self.variants if k[0] not in keys]:
+            del self.variants[cache_key]
@@ -0,0 +1,170 @@
+"""
+Общее хранилище шаблонов для обоих матчеров.
+
+Папка шаблонов сканируется один раз, файлы декодируются один раз. Результат - неизменяемый снимок
+(TemplateSnapshot): кортеж TemplateFile с RGB/RGBA изображением только для чтения. Изменения подхватываются
+опросом mtime не чаще POLL_INTERVAL секунд (listdir + stat файлов), а не os.listdir на каждом кадре.
+Неизменившиеся файлы между снимками не перечитываются. Файл, который не декодируется, повторно читается
+(и попадает в лог) только после изменения его mtime.
+
+Каждый матчер готовит шаблоны по-своему (маска и масштабы у классического, тензоры и эмбеддинги у нейросетевого):
+prepared(owner, prepare) кэширует результат prepare(TemplateFile) для владельца по (путь, mtime)
+и возвращает один и тот же кортеж, пока снимок не сменился.
+
+get_store(path, extensions) - один экземпляр на папку, чтобы матчеры в одном процессе делили скан и декодирование.
+"""
+
+import os
+import time
+import threading
+import weakref
+import cv2
+
+def hi():
+    print(f'hi from {__name__}')
+
+POLL_INTERVAL = 2.0  # Секунд между проверками папки шаблонов на изменения
+EXTENSIONS = ('.png', '.jpg')
+
+
+class TemplateFile:
+    """Декодированный файл шаблона. image - RGB или RGBA (если есть альфа-канал), только для чтения."""
+    __slots__ = ('name', 'path', 'mtime', 'image')
+
+    def __init__(self, name, path, mtime, image):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.image = image
+
+
+class TemplateSnapshot:
+    """Неизменяемый набор шаблонов. version растёт при каждом изменении папки."""
+    __slots__ = ('version', 'files')
+
+    def __init__(self, version, files):
+        self.version = version
+        self.files = tuple(files)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+
+def load_image(path):
+    """Файл -> RGB/RGBA uint8 только для чтения. None, если не читается."""
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None: return None
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+    elif img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+    else:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img.setflags(write=False)
+    return img
+
+
+class TemplateStore:
+    def __init__(self, path='templates', extensions=EXTENSIONS, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked = 0.0
+        self._prepared = weakref.WeakKeyDictionary()  # владелец -> (версия, кортеж, {(путь, mtime): результат})
+        self._failed = {}  # путь -> mtime, с которым файл не загрузился
+
+    def snapshot(self):
+        """Текущий снимок. Папка перепроверяется, если с прошлой проверки прошло poll_interval секунд."""
+        with self._lock:
+            if self._snapshot is None or time.perf_counter() - self._checked >= self.poll_interval:
+                self._scan()
+            return self._snapshot
+
+    def refresh(self):
+        """Перепроверить папку сейчас. True - набор шаблонов изменился."""
+        with self._lock:
+            version = self._snapshot.version if self._snapshot else None
+            self._scan()
+            return self._snapshot.version != version
+
+    def _scan(self):
+        # Нет папки - FileNotFoundError, как раньше у os.listdir в матчерах
+        names = sorted(f for f in os.listdir(self.path) if os.path.splitext(f)[1].lower() in self.extensions)
+        self._checked = time.perf_counter()
+        old = {f.path: f for f in self._snapshot} if self._snapshot else {}
+
+        files, changed = [], False
+        paths = set()
+        for name in names:
+            path = os.path.join(self.path, name)
+            paths.add(path)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            file = old.get(path)
+            if file is None or file.mtime != mtime:
+                if self._failed.get(path) == mtime: continue  # тот же битый файл - не перечитываем
+                image = load_image(path)
+                if image is None:
+                    print(f"Не удалось загрузить шаблон: {path}")
+                    self._failed[path] = mtime
+                    continue
+                self._failed.pop(path, None)
+                file = TemplateFile(name, path, mtime, image)
+                changed = True
+            files.append(file)
+        self._failed = {path: mtime for path, mtime in self._failed.items() if path in paths}
+
+        if self._snapshot is None or changed or len(files) != len(self._snapshot):
+            version = self._snapshot.version + 1 if self._snapshot else 0
+            self._snapshot = TemplateSnapshot(version, files)
+            if version: print(f"🧩 Templates changed: {len(files)}")
+
+    def prepared(self, owner, prepare, on_hit=None):
+        """
+        Кортеж prepare(TemplateFile) для всех шаблонов текущего снимка (None-результаты пропускаются).
+        Для владельца owner кэшируется по (путь, mtime): при смене снимка готовятся только новые/изменённые файлы.
+        on_hit(value): вызывается для каждого результата, взятого из кэша, а не приготовленного заново
+        (например, чтобы считать сэкономленное время подготовки).
+        """
+        snapshot = self.snapshot()
+        cached = self._prepared.get(owner)
+        if cached is not None and cached[0] == snapshot.version:
+            if on_hit is not None:
+                for value in cached[1]: on_hit(value)
+            return cached[1]
+
+        previous = cached[2] if cached is not None else {}
+        results, values = {}, []
+        for file in snapshot:
+            key = (file.path, file.mtime)
+            if key in previous:
+                value = previous[key]
+                if on_hit is not None and value is not None: on_hit(value)
+            else:
+                value = prepare(file)
+            results[key] = value
+            if value is not None: values.append(value)
+        values = tuple(values)
+        self._prepared[owner] = (snapshot.version, values, results)
+        return values
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_store(path='templates', extensions=EXTENSIONS):
+    """Общий TemplateStore для папки path (один на процесс)."""
+    key = (os.path.abspath(path), tuple(e.lower() for e in extensions))
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = TemplateStore(path, extensions)
+        return store